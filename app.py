@@ -1,47 +1,153 @@
 import os
+from time import time
+
+import click
 from dotenv import load_dotenv
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import (
+    Blueprint, Flask, render_template, request, flash, redirect, session, g,
+    jsonify)
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 
 from forms import UserAddForm, LoginForm, MessageForm, CSRFProtectForm, EditProfileForm, DirectMessageForm
-from models import db, connect_db, User, Message, Like, DirectMessage
+from models import db, connect_db, User, Message, Like
+from config import load_config
+from caching import init_caching, cached_page, page_etag, user_stamp
+from follow_graph import follow_cache
+from interactions import like, unlike, follow, unfollow
+from fragments import fragment_cache, init_fragments, profile_version
+from message_search import (
+    search_messages, index_message, unindex_message,
+    create_message_search_index)
+from metrics import init_metrics
+from passwords import init_passwords
+from purge import (
+    delete_account, purge_user, users_to_purge, PURGE_BATCH_SIZE)
+from routing import init_routing
+from pagination import Page, cursor_arg, next_page_url
+from projections import USER_COLUMNS, user_rows
+from queries import (
+    home_feed, profile_messages, liked_messages, liked_message_ids,
+    all_users, user_followers, user_following)
+from counters import adjust_counters, reconcile_counters, release_message
+from search import (
+    search_users, index_user, unindex_user, create_search_indexes,
+    AUTOCOMPLETE_LIMIT)
+from direct_messages import (
+    conversations, thread, mark_read, send_direct_message, find_recipient,
+    rebuild_conversations)
+from user_cache import CurrentUser, user_cache, new_version
+from timeline import (
+    fan_out_message, rebuild_timelines)
 
 load_dotenv()
 
 CURR_USER_KEY = "curr_user"
+CURR_USER_VERSION_KEY = "curr_user_version"
+FOLLOWS_CHANGED_KEY = "follows_changed_at"
+
+MESSAGES_PER_PAGE = 100
+USERS_PER_PAGE = 60
+DIRECT_MESSAGES_PER_PAGE = 20
+SEARCH_RESULTS_PER_PAGE = 20
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+# Every route and command; create_app() registers them on the app
+bp = Blueprint('warbler', __name__, cli_group=None)
+
+
+def create_app(config=None):
+    """Create the Warbler app with a config profile (see config.py).
+
+    `config` names the profile: 'development', 'testing' or 'production',
+    defaulting to the WARBLER_CONFIG environment variable or else
+    'development'. Production workers are best run with gunicorn's
+    --preload, so the app is built once and its memory shared by them:
+
+        gunicorn --preload "app:create_app('production')"
+    """
 
-app = Flask(__name__)
+    app = Flask(__name__)
+    load_config(app, config)
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ['DATABASE_URL'].replace("postgres://", "postgresql://"))
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
-toolbar = DebugToolbarExtension(app)
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        app.jinja_options = {
+            **app.jinja_options,
+            'bytecode_cache': FileSystemBytecodeCache(
+                app.config['TEMPLATE_CACHE_DIR']),
+        }
 
-connect_db(app)
+    if app.config['DEBUG_TOOLBAR']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    # Migrations are only run by `flask db`, and Alembic is slow to import
+    if app.config['MIGRATIONS'] or click.get_current_context(silent=True):
+        init_migrations(app)
+    init_routing(app)
+    init_metrics(app)
+    init_passwords(app)
+    init_caching(app)
+    init_fragments(app)
+
+    app.register_blueprint(bp)
+    app.jinja_env.globals['next_page_url'] = next_page_url
+
+    if app.config['PRECOMPILE_TEMPLATES']:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+
+    return app
+
+
+def init_migrations(app):
+    """Set up Flask-Migrate, for the `flask db` commands (and load.py)."""
+
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=MIGRATIONS_DIR)
+
+
+def __getattr__(name):
+    """`app`: an app for the WARBLER_CONFIG profile, made on first use.
+
+    It's what `gunicorn app:app`, `flask` and the tests load; importing this
+    module for create_app() doesn't build one.
+    """
+
+    global app
+
+    if name == 'app':
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@bp.before_app_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
+
+    g.user is a CurrentUser, which only queries the database when a route
+    needs more than the cached profile columns (see user_cache.py).
+    """
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = CurrentUser(
+            session[CURR_USER_KEY],
+            version=session.get(CURR_USER_VERSION_KEY),
+            follows_changed_at=session.get(FOLLOWS_CHANGED_KEY))
 
     else:
         g.user = None
 
-@app.before_request
+@bp.before_app_request
 def add_csrf_form_to_all_pages():
     """Before every route, add CSRF-only form to global object."""
     g.csrf_form = CSRFProtectForm()
@@ -51,6 +157,36 @@ def do_login(user):
     """Log in user."""
 
     session[CURR_USER_KEY] = user.id
+    session[CURR_USER_VERSION_KEY] = new_version()
+    user_cache.store(user, session[CURR_USER_VERSION_KEY])
+
+
+def user_changed():
+    """Note that the logged-in user's profile or counts just changed.
+
+    Rotating the version stamp makes their next request reload the
+    snapshot, whichever worker serves it.
+    """
+
+    user_cache.invalidate(g.user.id)
+    session[CURR_USER_VERSION_KEY] = new_version()
+
+
+def followed_ids_among(users):
+    """Return ids of `users` that the logged-in user follows."""
+
+    return follow_cache.following_among(
+        g.user.id,
+        [user.id for user in users],
+        fresh_after=session.get(FOLLOWS_CHANGED_KEY))
+
+
+def follows_changed():
+    """Note that the logged-in user just followed or unfollowed someone."""
+
+    follow_cache.invalidate(g.user.id)
+    session[FOLLOWS_CHANGED_KEY] = time()
+    user_changed()
 
 
 def do_logout():
@@ -58,9 +194,10 @@ def do_logout():
 
     if CURR_USER_KEY in session:
         del session[CURR_USER_KEY]
+    session.pop(CURR_USER_VERSION_KEY, None)
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@bp.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -91,6 +228,7 @@ def signup():
             flash("Username already taken", 'danger')
             return render_template('users/signup.html', form=form)
 
+        index_user(user)
         do_login(user)
 
         return redirect("/")
@@ -99,7 +237,7 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login and redirect to homepage on success."""
 
@@ -111,6 +249,7 @@ def login():
             form.password.data)
 
         if user:
+            db.session.commit()  # saves a password re-hashed at a new cost
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -120,7 +259,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.post('/logout')
+@bp.post('/logout')
 def logout():
     """Handle logout of user and redirect to homepage."""
 
@@ -140,11 +279,12 @@ def logout():
 ##############################################################################
 # General user routes:
 
-@app.get('/users')
+@bp.get('/users')
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search by that username; search
+    shows the best matches (see search.py) rather than paging through all.
     """
     if not g.user:
         flash("Access unauthorized.", "danger")
@@ -152,15 +292,38 @@ def list_users():
 
     search = request.args.get('q')
 
-    if not search:
-        users = User.query.all()
+    if search:
+        users = Page(user_rows(search_users(search, columns=USER_COLUMNS)))
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        users = all_users(before=cursor_arg(), per_page=USERS_PER_PAGE)
 
-    return render_template('users/index.html', users=users)
+    return render_template('users/index.html', users=users,
+                           followed_ids=followed_ids_among(users))
 
 
-@app.get('/users/<int:user_id>')
+@bp.get('/users/autocomplete')
+def autocomplete_users():
+    """Return JSON username suggestions for the 'q' param.
+
+    Called as the user types, so it reads only the columns it returns and
+    renders no template.
+    """
+
+    if not g.user:
+        return jsonify(error="Access unauthorized."), 401
+
+    matches = search_users(
+        request.args.get('q'),
+        limit=AUTOCOMPLETE_LIMIT,
+        columns=(User.id, User.username, User.image_url))
+
+    return jsonify(users=[
+        {"id": id, "username": username, "image_url": image_url}
+        for id, username, image_url in matches
+    ])
+
+
+@bp.get('/users/<int:user_id>')
 def show_user(user_id):
     """Show user profile."""
 
@@ -168,12 +331,19 @@ def show_user(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
+    user = User.query.filter_by(id=user_id, deleted_at=None).first_or_404()
+    before = cursor_arg()
+
+    def render():
+        messages = profile_messages(user_id, before=before,
+                                    per_page=MESSAGES_PER_PAGE)
+        return render_template('users/show.html', user=user,
+                               messages=messages)
 
-    return render_template('users/show.html', user=user)
+    return cached_page(page_etag(user_stamp(user)), render)
 
 
-@app.get('/users/<int:user_id>/following')
+@bp.get('/users/<int:user_id>/following')
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -182,11 +352,21 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    user = User.query.filter_by(id=user_id, deleted_at=None).first_or_404()
+    following = user_following(user_id, before=cursor_arg(),
+                               per_page=USERS_PER_PAGE)
 
+    def render():
+        return render_template('users/following.html', user=user,
+                               following=following,
+                               followed_ids=followed_ids_among(following))
 
-@app.get('/users/<int:user_id>/followers')
+    return cached_page(
+        page_etag(user_stamp(user), [user_stamp(u) for u in following]),
+        render)
+
+
+@bp.get('/users/<int:user_id>/followers')
 def show_followers(user_id):
     """Show list of followers of this user."""
 
@@ -194,11 +374,21 @@ def show_followers(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    user = User.query.filter_by(id=user_id, deleted_at=None).first_or_404()
+    followers = user_followers(user_id, before=cursor_arg(),
+                               per_page=USERS_PER_PAGE)
+
+    def render():
+        return render_template('users/followers.html', user=user,
+                               followers=followers,
+                               followed_ids=followed_ids_among(followers))
 
+    return cached_page(
+        page_etag(user_stamp(user), [user_stamp(u) for u in followers]),
+        render)
 
-@app.post('/users/follow/<int:follow_id>')
+
+@bp.post('/users/follow/<int:follow_id>')
 def start_following(follow_id):
     """Add a follow for the currently-logged-in user.
 
@@ -209,14 +399,16 @@ def start_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
-    db.session.commit()
+    followed_user = (User.query.filter_by(id=follow_id, deleted_at=None)
+                     .first_or_404())
+    if follow(g.user.id, followed_user.id):
+        db.session.commit()
+        follows_changed()
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.post('/users/stop-following/<int:follow_id>')
+@bp.post('/users/stop-following/<int:follow_id>')
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user.
 
@@ -227,14 +419,16 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
-    db.session.commit()
+    followed_user = (User.query.filter_by(id=follow_id, deleted_at=None)
+                     .first_or_404())
+    if unfollow(g.user.id, followed_user.id):
+        db.session.commit()
+        follows_changed()
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@bp.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -256,6 +450,9 @@ def profile():
                                         or User.header_image_url.default.arg)
                 user.bio=form.bio.data
                 db.session.commit()
+                index_user(user)
+                fragment_cache.invalidate_user(user.id)
+                user_changed()
 
                 flash('Profile updated successfully!')
                 return redirect(f'/users/{user.id}')
@@ -270,28 +467,24 @@ def profile():
         return render_template('users/edit.html', form=form)
 
 
-@app.get('/users/<int:user_id>/liked-messages')
+@bp.get('/users/<int:user_id>/liked-messages')
 def show_liked_messages(user_id):
     """Show liked messages: """
 
     if g.user:
 
-        user = User.query.get(user_id)
-        liked_messages = [ message.id for message in user.liked_messages]
-        messages = (Message
-                    .query
-                    .filter(Message.id.in_(liked_messages))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        messages = liked_messages(user_id, before=cursor_arg(),
+                                  per_page=MESSAGES_PER_PAGE)
+        liked_ids = liked_message_ids(g.user.id, messages)
 
-        return render_template('liked.html', messages=messages)
+        return render_template('liked.html', messages=messages,
+                               liked_ids=liked_ids)
 
     else:
         return render_template('liked.html')
 
 
-@app.post('/users/delete')
+@bp.post('/users/delete')
 def delete_user():
     """Delete user.
 
@@ -304,8 +497,12 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    user_id = g.user.id
+    delete_account(g.user.load())
     db.session.commit()
+    unindex_user(user_id)
+    user_cache.invalidate(user_id)
+    fragment_cache.invalidate_user(user_id)
 
     return redirect("/signup")
 
@@ -313,7 +510,7 @@ def delete_user():
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@bp.route('/messages/new', methods=["GET", "POST"])
 def add_message():
     """Add a message:
 
@@ -327,16 +524,57 @@ def add_message():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+        adjust_counters(g.user.id, messages_count=1)
+        fan_out_message(msg)
         db.session.commit()
+        index_message(msg)
+        user_changed()
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/create.html', form=form)
 
 
-@app.get('/messages/<int:message_id>')
+@bp.get('/messages/search')
+def search_messages_page():
+    """Full-text search of messages, best matches first.
+
+    Query string: 'q' is the search (web search syntax: "phrases", or,
+    -word); 'author' limits results to one username; 'following=1' limits
+    them to people the logged-in user follows.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    term = request.args.get('q', '')
+    author = request.args.get('author', '').strip().lstrip('@')
+    following = request.args.get('following') == '1'
+
+    author_id = None
+    if author:
+        author_id = (db.session.query(User.id)
+                     .filter_by(username=author, deleted_at=None).scalar())
+
+    if author and author_id is None:
+        messages = Page([])
+    else:
+        messages = search_messages(
+            term, before=cursor_arg(), per_page=SEARCH_RESULTS_PER_PAGE,
+            author_id=author_id,
+            following_of=g.user.id if following else None)
+
+    return render_template(
+        'messages/search.html', messages=messages, term=term, author=author,
+        following=following,
+        liked_ids=liked_message_ids(g.user.id, messages))
+
+
+@bp.get('/messages/<int:message_id>')
 def show_message(message_id):
     """Show a message."""
 
@@ -345,13 +583,21 @@ def show_message(message_id):
         return redirect("/")
 
     form = g.csrf_form #
-    msg = Message.query.get_or_404(message_id)
-    like = Like.query.get((g.user.id, message_id))
-    return render_template('messages/show.html', message=msg,
-                            like=like, form=form)
+    msg = (Message.query
+           .join(Message.user)
+           .filter(Message.id == message_id, User.deleted_at.is_(None))
+           .first_or_404())
 
+    def render():
+        liked = Like.query.get((g.user.id, message_id))
+        return render_template('messages/show.html', message=msg,
+                                like=liked, form=form)
 
-@app.post('/messages/<int:message_id>/delete')
+    # The viewer's likes are part of their own stamp (see caching.py)
+    return cached_page(page_etag(user_stamp(msg.user)), render)
+
+
+@bp.post('/messages/<int:message_id>/delete')
 def delete_message(message_id):
     """Delete a message.
 
@@ -364,12 +610,18 @@ def delete_message(message_id):
         return redirect("/")
 
     msg = Message.query.get_or_404(message_id)
+    # Read before the commit expires (and the delete detaches) the message
+    version = profile_version(msg.user)
+    release_message(msg)
     db.session.delete(msg)
     db.session.commit()
+    unindex_message(message_id)
+    fragment_cache.invalidate_message(message_id, version)
+    user_changed()
 
     return redirect(f"/users/{g.user.id}")
 
-@app.post('/messages/<int:message_id>/likes')
+@bp.post('/messages/<int:message_id>/likes')
 def like_message(message_id):
     """Likes or unlikes a message."""
 
@@ -377,95 +629,196 @@ def like_message(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    message = Message.query.get(message_id)
+    message = Message.query.get_or_404(message_id)
 
     form = g.csrf_form
+    requested = request.referrer or '/'
 
     if form.validate_on_submit():
-        requested = request.referrer
-
-        if not request.referrer:
-            requested = '/'
-
+        # Unlike if it was liked, else like: one statement to unlike, a
+        # second to like when the unlike found nothing
+        if unlike(g.user.id, message.id) or like(g.user.id, message.id):
+            db.session.commit()
+            user_changed()
+        flash('Liked/unliked successfully!')
 
-        if message in g.user.liked_messages:
-            g.user.liked_messages.remove(message) # use append/remove
-        elif message.user_id != g.user.id:
-            g.user.liked_messages.append(message)
+    return redirect(requested)
 
+@bp.get('/direct-messages')
+def show_direct_messages():
+    """Show the logged-in user's conversations, most recent first."""
 
-        db.session.commit()
-        flash('Liked/unliked successfully!')
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
 
-        return redirect(requested) # request.referer
-        # refer header
+    page = conversations(g.user.id, before=cursor_arg(),
+                         per_page=DIRECT_MESSAGES_PER_PAGE)
 
-    else:
-        return redirect(requested)
+    return render_template('messages/directmessages.html',
+                           conversations=page)
 
-@app.get('/direct-messages')
-def show_direct_messages():
-    """Show all direct messages."""
+@bp.get('/direct-messages/<int:user_id>')
+def show_conversation(user_id):
+    """Show the messages between the logged-in user and another, newest
+    first, and mark the ones received as read."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    msgs = (DirectMessage.query
-                        .filter(DirectMessage.user_id_to == g.user.id)
-                        .limit(20)
-                        .all())
+    other_user = (User.query.filter_by(id=user_id, deleted_at=None)
+                  .first_or_404())
+
+    if mark_read(g.user.id, user_id):
+        db.session.commit()
+        user_changed()
+
+    msgs = thread(g.user.id, user_id, before=cursor_arg(),
+                  per_page=DIRECT_MESSAGES_PER_PAGE)
+    form = DirectMessageForm(recipient=other_user.username)
 
-    return render_template('messages/directmessages.html', msgs=msgs)
+    return render_template('messages/thread.html', other_user=other_user,
+                           msgs=msgs, form=form)
 
-@app.route('/direct-messages/new', methods=["GET", "POST"])
+@bp.route('/direct-messages/new', methods=["GET", "POST"])
 def add_direct_message():
-    """Add a direct message:
+    """Send a direct message:
 
-    Show form if GET. If valid, update message and redirect to user page.
+    Show form if GET. If valid, send it and redirect to the conversation.
     """
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    form = DirectMessageForm()
-    form.user_id_to.choices = [(user.id, user.username) for user in g.user.following]
+    form = DirectMessageForm(recipient=request.args.get('to'))
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
-        db.session.commit()
+        recipient_id = find_recipient(form.recipient.data)
 
-        return redirect(f"/users/{g.user.id}")
+        if recipient_id is None:
+            form.recipient.errors.append("No user with that username.")
+        elif recipient_id == g.user.id:
+            form.recipient.errors.append("You can't message yourself.")
+        else:
+            send_direct_message(g.user.id, recipient_id,
+                                form.subject.data, form.text.data)
+            db.session.commit()
+
+            return redirect(f"/direct-messages/{recipient_id}")
 
     return render_template('messages/createdm.html', form=form)
 
+##############################################################################
+# JSON API
+#
+# Used by static/js/toggles.js so a star or follow button click doesn't
+# reload the page. POST sets the state, DELETE clears it; either way the
+# response has the new state and counts. Requests carry the CSRF token
+# like the forms do.
+
+
+def api_error(message, status):
+    return jsonify(error=message), status
+
+
+def check_api_request():
+    """Error response if the request isn't from a logged-in user with a
+    valid CSRF token, else None."""
+
+    if not g.user:
+        return api_error("Access unauthorized.", 401)
+    if not g.csrf_form.validate_on_submit():
+        return api_error("Invalid CSRF token.", 400)
+    return None
+
+
+@bp.route('/api/messages/<int:message_id>/like', methods=["POST", "DELETE"])
+def api_like_message(message_id):
+    """Like (POST) or unlike (DELETE) a message.
+
+    Returns {"message_id", "liked", "likes_count"}, where likes_count is
+    how many messages the logged-in user now likes.
+    """
+
+    error = check_api_request()
+    if error:
+        return error
+
+    message = Message.query.get(message_id)
+    if message is None:
+        return api_error("Message not found.", 404)
+    if message.user_id == g.user.id:
+        return api_error("You can't like your own message.", 403)
+
+    liked = request.method == "POST"
+    changed = (like if liked else unlike)(g.user.id, message_id)
+    if changed:
+        db.session.commit()
+        user_changed()
+
+    likes_count = db.session.execute(
+        select(User.likes_count).where(User.id == g.user.id)).scalar()
+
+    return jsonify(message_id=message_id, liked=liked,
+                   likes_count=likes_count)
+
+
+@bp.route('/api/users/<int:user_id>/follow', methods=["POST", "DELETE"])
+def api_follow_user(user_id):
+    """Follow (POST) or unfollow (DELETE) a user.
+
+    Returns {"user_id", "following", "followers_count", "following_count"}:
+    the user's follower count and the logged-in user's following count.
+    """
+
+    error = check_api_request()
+    if error:
+        return error
+
+    user = User.query.filter_by(id=user_id, deleted_at=None).first()
+    if user is None:
+        return api_error("User not found.", 404)
+    if user.id == g.user.id:
+        return api_error("You can't follow yourself.", 403)
+
+    following = request.method == "POST"
+    changed = (follow if following else unfollow)(g.user.id, user_id)
+    if changed:
+        db.session.commit()
+        follows_changed()
+
+    counts = {id: (followers_count, following_count)
+              for id, followers_count, following_count in db.session.execute(
+                  select(User.id, User.followers_count, User.following_count)
+                  .where(User.id.in_([user_id, g.user.id])))}
+
+    return jsonify(user_id=user_id, following=following,
+                   followers_count=counts[user_id][0],
+                   following_count=counts[g.user.id][1])
+
+
 ##############################################################################
 # Homepage and error pages
 
 
-@app.get('/')
+@bp.get('/')
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: 100 most recent messages of followed_users, with a
+      cursor to page further back
     """
-    # breakpoint()
 
     if g.user:
-        following = [user.id for user in g.user.following]
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
-        like_messages = g.user.liked_messages
+        messages = home_feed(g.user.id, before=cursor_arg(),
+                             per_page=MESSAGES_PER_PAGE)
+        liked_ids = liked_message_ids(g.user.id, messages)
 
         return render_template('home.html', messages=messages,
-                                like_messages=like_messages)
+                               liked_ids=liked_ids)
 
     else:
         return render_template('home-anon.html')
@@ -473,16 +826,67 @@ def homepage():
 
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# CLI commands
+
+
+@bp.cli.command('rebuild-timelines')
+def rebuild_timelines_command():
+    """Rebuild every home timeline from existing follows and messages."""
+
+    rebuilt = rebuild_timelines(
+        progress=lambda done: click.echo(f"Rebuilt {done} timelines..."))
+    click.echo(f"Done: {rebuilt} timelines rebuilt.")
+
+
+@bp.cli.command('create-search-indexes')
+def create_search_indexes_command():
+    """Add the username and message search indexes to an existing database."""
+
+    with db.engine.begin() as connection:
+        trigram = create_search_indexes(connection)
+        fulltext = create_message_search_index(connection)
+
+    if trigram:
+        click.echo("Created prefix and trigram username indexes.")
+    else:
+        click.echo("Created prefix index; pg_trgm is unavailable, so "
+                   "substring search will scan the users table.")
+
+    if fulltext:
+        click.echo("Created the message full-text column and index.")
+    else:
+        click.echo("Message search will use the in-process index.")
+
+
+@bp.cli.command('rebuild-conversations')
+def rebuild_conversations_command():
+    """Rebuild every user's conversation list from the direct messages."""
+
+    rebuilt = rebuild_conversations()
+    click.echo(f"Done: {rebuilt} conversations rebuilt.")
+
+
+@bp.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute every user's message/follower/following/like counts."""
+
+    fixed = reconcile_counters(
+        progress=lambda upto: click.echo(f"Checked users up to #{upto}..."))
+    click.echo(f"Done: {fixed} users corrected.")
+
+
+@bp.cli.command('purge-users')
+@click.option('--batch-size', default=PURGE_BATCH_SIZE, show_default=True,
+              help="Rows deleted per transaction.")
+def purge_users_command(batch_size):
+    """Delete the large accounts waiting to be purged, in batches."""
 
-@app.after_request
-def add_header(response):
-    """Add non-caching headers on every request."""
+    user_ids = users_to_purge()
+    for user_id in user_ids:
+        purge_user(
+            user_id, batch_size=batch_size,
+            progress=lambda step, done: click.echo(
+                f"User #{user_id}: deleted {done} {step}..."))
+        click.echo(f"User #{user_id} purged.")
 
-    # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-    response.cache_control.no_store = True
-    return response
+    click.echo(f"Done: {len(user_ids)} users purged.")
@@ -0,0 +1,61 @@
+"""Benchmark password verification throughput.
+
+Reports logins per second, overall and per core, for checking a bcrypt hash
+inline versus through the hashing pool in passwords.py.
+
+    python bench/bench_passwords.py --rounds 12 --logins 64
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import passwords  # noqa: E402
+
+
+def run(logins, threads, hashed):
+    """Check `logins` passwords from `threads` request threads."""
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as request_threads:
+        results = list(request_threads.map(
+            lambda _: passwords.check_password(hashed, "password"),
+            range(logins)))
+    elapsed = perf_counter() - start
+
+    assert all(results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--logins', type=int, default=32)
+    parser.add_argument('--pool-size', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    cores = os.cpu_count()
+    passwords.configure(rounds=args.rounds, size=0)
+    hashed = passwords.hash_password("password")
+
+    print(f"bcrypt cost {args.rounds}, {args.logins} logins, {cores} cores")
+
+    for label, size, threads in (
+            ("inline, 1 thread", 0, 1),
+            (f"pool of {args.pool_size}, {args.pool_size * 2} threads",
+             args.pool_size, args.pool_size * 2)):
+        passwords.configure(rounds=args.rounds, size=size)
+        if size:
+            run(size, size, hashed)  # start the pool's processes
+        rate = run(args.logins, threads, hashed)
+        used = min(cores, size or 1)
+        print(f"  {label:<28} {rate:8.1f} logins/s  "
+              f"{rate / used:6.1f} logins/s/core")
+
+
+if __name__ == '__main__':
+    main()
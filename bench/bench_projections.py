@@ -0,0 +1,204 @@
+"""Benchmark listing pages read as ORM objects versus read-only rows.
+
+For each listing page, at 100- and 1000-row page sizes, loads a page and
+reads every attribute its template shows, once with ORM objects (as the
+pages did before projections.py) and once with the projection rows the
+pages use now. Reports per request:
+
+- CPU: process time in this process (median of --runs), so the database's
+  own work isn't counted;
+- peak: the most memory Python had allocated while loading and reading;
+- kept: what the page still holds afterwards (until the request ends).
+
+    python bench/bench_projections.py --runs 20
+
+The database's tables are dropped and seeded with a reader who follows, is
+followed by and likes the messages of --users users.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tracemalloc
+from time import process_time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+PAGE_SIZES = (100, 1000)
+
+MESSAGE_FIELDS = ('id', 'text', 'timestamp', 'user_id')
+AUTHOR_FIELDS = ('id', 'username', 'image_url')
+USER_FIELDS = (
+    'id', 'username', 'image_url', 'header_image_url', 'bio', 'updated_at',
+    'messages_count', 'followers_count', 'following_count', 'likes_count')
+
+
+def seed(users):
+    """Create the reader and `users` others; returns the reader's id and
+    the id of a user with more than 1000 messages."""
+
+    from sqlalchemy import insert, literal, select
+
+    from counters import reconcile_counters
+    from models import db, User, Message, Follows, Like
+    from timeline import rebuild_timelines
+
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(insert(User), [
+        {'username': f"user{n}", 'email': f"user{n}@example.com",
+         'password': "not-a-hash", 'bio': f"Bio of user {n}"}
+        for n in range(users + 1)])
+    reader_id, *others = db.session.execute(
+        select(User.id).order_by(User.id)).scalars()
+    author_id = others[0]
+
+    db.session.execute(insert(Message), [
+        {'text': f"Message {n} by user {user_id}", 'user_id': user_id}
+        for n, user_id in enumerate([author_id] * max(PAGE_SIZES) + others)])
+    db.session.execute(insert(Follows), [
+        pair for user_id in others
+        for pair in (
+            {'user_following_id': reader_id,
+             'user_being_followed_id': user_id},
+            {'user_following_id': user_id,
+             'user_being_followed_id': reader_id})])
+    db.session.execute(
+        insert(Like).from_select(
+            ['user_id', 'message_id'],
+            select(literal(reader_id), Message.id)))
+    db.session.commit()
+
+    reconcile_counters()
+    rebuild_timelines()
+    return reader_id, author_id
+
+
+def read_messages(page):
+    for msg in page:
+        for name in MESSAGE_FIELDS:
+            getattr(msg, name)
+        for name in AUTHOR_FIELDS:
+            getattr(msg.user, name)
+
+
+def read_users(page):
+    for user in page:
+        for name in USER_FIELDS:
+            getattr(user, name)
+
+
+def listings(reader_id, author_id):
+    """(page, read, ORM loader, projection loader) for each listing."""
+
+    from sqlalchemy.orm import joinedload
+
+    from models import User, Message, Like, Follows
+    from pagination import make_page, paginate
+    from queries import (
+        MESSAGE_ORDER, message_key, load_authors, home_feed,
+        profile_messages, liked_messages, user_followers, all_users)
+    from timeline import home_timeline
+
+    def orm_home_feed(per_page):
+        rows = home_timeline(reader_id, limit=per_page + 1)
+        page = make_page(rows, per_page, key=message_key)
+        load_authors(page.items)
+        return page
+
+    def orm_messages(query):
+        return lambda per_page: paginate(
+            query.options(joinedload(Message.user)), MESSAGE_ORDER,
+            per_page=per_page)
+
+    def orm_users(query, descending=True):
+        return lambda per_page: paginate(
+            query, (User.id,), per_page=per_page, descending=descending)
+
+    return [
+        ('home feed', read_messages, orm_home_feed,
+         lambda per_page: home_feed(reader_id, per_page=per_page)),
+        ('liked messages', read_messages,
+         orm_messages(Message.query
+                      .join(Like, Like.message_id == Message.id)
+                      .filter(Like.user_id == reader_id)),
+         lambda per_page: liked_messages(reader_id, per_page=per_page)),
+        ('profile', read_messages,
+         orm_messages(Message.query.filter(Message.user_id == author_id)),
+         lambda per_page: profile_messages(author_id, per_page=per_page)),
+        ('followers', read_users,
+         orm_users(User.query
+                   .join(Follows, Follows.user_following_id == User.id)
+                   .filter(Follows.user_being_followed_id == reader_id)),
+         lambda per_page: user_followers(reader_id, per_page=per_page)),
+        ('users', read_users,
+         orm_users(User.query.filter_by(deleted_at=None), descending=False),
+         lambda per_page: all_users(per_page=per_page)),
+    ]
+
+
+def measure(load, read, per_page, runs):
+    """(CPU ms, peak KiB, kept KiB) for one request's page."""
+
+    from models import db
+
+    def request():
+        page = load(per_page)
+        assert len(page) == per_page
+        read(page)
+        return page
+
+    times = []
+    for _ in range(runs):
+        db.session.remove()
+        start = process_time()
+        request()
+        times.append(process_time() - start)
+
+    db.session.remove()
+    tracemalloc.start()
+    page = request()
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del page
+
+    return (statistics.median(times) * 1000, peak / 1024, kept / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--database-url',
+                        default='postgresql:///warbler_bench')
+    parser.add_argument('--users', type=int, default=max(PAGE_SIZES) + 100,
+                        help="users the reader follows (at least 1000)")
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('SECRET_KEY', 'bench')
+
+    from app import app
+
+    with app.app_context():
+        reader_id, author_id = seed(args.users)
+
+        print(f"{'page':<16} {'rows':>5}  {'':<10} {'CPU ms':>8} "
+              f"{'peak KiB':>10} {'kept KiB':>9}")
+        for name, read, orm, projection in listings(reader_id, author_id):
+            for per_page in PAGE_SIZES:
+                before = measure(orm, read, per_page, args.runs)
+                after = measure(projection, read, per_page, args.runs)
+                for label, (cpu, peak, kept) in (
+                        ("ORM", before), ("rows", after)):
+                    print(f"{name:<16} {per_page:>5}  {label:<10} "
+                          f"{cpu:8.2f} {peak:10.0f} {kept:9.0f}")
+                print(f"{'':<16} {'':>5}  {'saved':<10} "
+                      f"{1 - after[0] / before[0]:8.0%} "
+                      f"{1 - after[1] / before[1]:10.0%} "
+                      f"{1 - after[2] / before[2]:9.0%}")
+
+
+if __name__ == '__main__':
+    main()
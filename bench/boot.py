@@ -0,0 +1,182 @@
+"""Measure how fast Warbler starts and how much memory its workers use.
+
+Two numbers matter when scaling out gunicorn workers:
+
+- cold start: the time for a fresh interpreter to import and build the app
+  (median of --runs), and for a new gunicorn to answer its first request;
+- memory per worker: RSS, and PSS, which splits pages shared with the
+  master (e.g. after --preload) between the processes sharing them, so it
+  shows what one more worker really costs. Read after each worker has
+  served some requests.
+
+    python bench/boot.py --app "app:create_app('production')" --preload \\
+        --workers 4 --out boot.json
+
+Results are printed and written as JSON; pass an earlier file with
+--baseline to compare two runs. Only pages that don't need data are
+requested, so any database with the schema will do.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter, sleep
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Pages requested to warm up each worker
+WARMUP_PATHS = ('/', '/login', '/signup')
+
+IMPORT_SCRIPT = """
+import sys
+from time import perf_counter
+start = perf_counter()
+from gunicorn.util import import_app
+import_app(sys.argv[1])
+print(perf_counter() - start)
+"""
+
+
+def import_time(args, env):
+    """Seconds to import and build the app in a fresh interpreter."""
+
+    times = []
+    for _ in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT_SCRIPT, args.app],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def memory(pid):
+    """(RSS, PSS) of a process, in MiB."""
+
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                values[name] = int(rest.split()[0]) / 1024
+    return values['Rss'], values['Pss']
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def boot(args, env):
+    """Start gunicorn; time the first response and measure its workers."""
+
+    command = [sys.executable, '-m', 'gunicorn', args.app,
+               '--bind', f'127.0.0.1:{args.port}',
+               '--workers', str(args.workers)]
+    if args.preload:
+        command.append('--preload')
+
+    url = f'http://127.0.0.1:{args.port}'
+    start = perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        while True:
+            if server.poll() is not None:
+                sys.exit("gunicorn didn't start")
+            try:
+                requests.get(url + '/login', timeout=5)
+                break
+            except requests.ConnectionError:
+                sleep(0.01)
+        first_response = perf_counter() - start
+
+        # Enough requests that every worker serves some of each page
+        with requests.Session() as session:
+            for _ in range(args.workers * 10):
+                for path in WARMUP_PATHS:
+                    session.get(url + path, timeout=5)
+                session.close()
+
+        workers = [memory(pid) for pid in children(server.pid)]
+        master = memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'first_response_s': round(first_response, 3),
+        'master_rss_mib': round(master[0], 1),
+        'worker_rss_mib': round(statistics.mean(r for r, _ in workers), 1),
+        'worker_pss_mib': round(statistics.mean(p for _, p in workers), 1),
+        'total_pss_mib': round(master[1] + sum(p for _, p in workers), 1),
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"\n{report['app']} ({report['workers']} workers"
+          f"{', preloaded' if report['preload'] else ''})")
+    for name, value in report['results'].items():
+        line = f"  {name:<20} {value:>10}"
+        before = baseline and baseline['results'].get(name)
+        if before:
+            line += f"   {(value - before) / before:+7.1%} vs baseline"
+        print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--app', default='app:app',
+                        help="gunicorn app target")
+    parser.add_argument('--preload', action='store_true',
+                        help="load the app in the gunicorn master")
+    parser.add_argument('--database-url',
+                        default=os.environ.get('DATABASE_URL',
+                                               'postgresql:///warbler'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=5,
+                        help="fresh imports to take the median of")
+    parser.add_argument('--port', type=int, default=5078)
+    parser.add_argument('--out', default='boot.json')
+    parser.add_argument('--baseline', help="earlier --out file to compare to")
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL=args.database_url,
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'boot'))
+
+    report = {
+        'revision': git_revision(),
+        'app': args.app,
+        'workers': args.workers,
+        'preload': args.preload,
+        'results': {
+            'import_s': round(import_time(args, env), 3),
+            **boot(args, env),
+        },
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
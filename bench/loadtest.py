@@ -0,0 +1,376 @@
+"""Load-test Warbler end to end and record per-route latency percentiles.
+
+Seeds a database with generated data (generator/create_csvs.py + load.py),
+starts the app under gunicorn, logs in a pool of virtual users and has each
+of them drive a weighted mix of routes for a fixed time. Throughput and
+p50/p95/p99 latency per route are printed and written as JSON, which can be
+passed back in with --baseline to compare two runs.
+
+    python bench/loadtest.py --database-url postgresql:///warbler_loadtest \\
+        --users 10000 --messages 200000 --vus 32 --duration 60 \\
+        --out baseline.json
+
+The database is dropped and recreated unless --skip-seed is given, so point
+--database-url at one used only for load testing.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import defaultdict
+from random import Random
+from time import perf_counter, sleep
+
+import requests
+from sqlalchemy import create_engine, text
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, os.path.join(ROOT, 'generator'))
+
+from helpers import ADJECTIVES, NOUNS  # noqa: E402
+
+# Every generated user has this password (see generator/create_csvs.py)
+PASSWORD = "password"
+
+# Relative weights of the actions in the route mix
+ROUTE_MIX = {
+    'GET /': 40,
+    'GET /users/<id>': 20,
+    'GET /users?q=': 10,
+    'GET /messages/new': 10,
+    'POST /messages/<id>/likes': 10,
+    'POST /users/follow/<id>': 10,
+}
+
+CSRF_TOKEN_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+PERCENTILES = (50, 95, 99)
+
+
+##############################################################################
+# Setup
+
+
+def seed(args, env):
+    """Generate CSVs at the requested scale and bulk-load them."""
+
+    with tempfile.TemporaryDirectory() as directory:
+        subprocess.run([
+            sys.executable, os.path.join(ROOT, 'generator', 'create_csvs.py'),
+            '--dir', directory,
+            '--users', str(args.users), '--messages', str(args.messages),
+            '--follows', str(args.follows), '--likes', str(args.likes),
+            '--dms', str(args.dms), '--seed', str(args.seed),
+        ], check=True)
+        subprocess.run([sys.executable, os.path.join(ROOT, 'load.py'),
+                        '--dir', directory], cwd=ROOT, env=env, check=True)
+
+
+def start_server(args, env):
+    """Start gunicorn and wait until it answers."""
+
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', "app:create_app('production')",
+        '--preload',
+        '--bind', f'127.0.0.1:{args.port}',
+        '--workers', str(args.workers),
+        '--threads', str(args.threads),
+    ], cwd=ROOT, env=env)
+
+    url = f'http://127.0.0.1:{args.port}'
+    for _ in range(100):
+        if server.poll() is not None:
+            break
+        try:
+            requests.get(f'{url}/login', timeout=5)
+            return server, url
+        except requests.RequestException:
+            sleep(0.2)
+
+    server.terminate()
+    sys.exit("gunicorn didn't start")
+
+
+def dataset_size(engine):
+    with engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT (SELECT max(id) FROM users), (SELECT max(id) FROM messages)"
+        )).one()
+
+
+##############################################################################
+# Virtual users
+
+
+class VirtualUser:
+    """A logged-in session that picks actions from ROUTE_MIX."""
+
+    def __init__(self, url, user_id, username, following, num_users,
+                 num_messages, rng):
+        self.url = url
+        self.user_id = user_id
+        self.username = username
+        self.following = following
+        self.num_users = num_users
+        self.num_messages = num_messages
+        self.rng = rng
+        self.session = requests.Session()
+        self.csrf_token = None
+
+    def login(self):
+        page = self.session.get(f'{self.url}/login').text
+        form = {
+            'csrf_token': CSRF_TOKEN_RE.search(page).group(1),
+            'username': self.username,
+            'password': PASSWORD,
+        }
+        resp = self.session.post(f'{self.url}/login', data=form,
+                                 allow_redirects=False)
+        if resp.status_code != 302:
+            raise RuntimeError(f"couldn't log in as {self.username}")
+
+        home = self.session.get(f'{self.url}/').text
+        self.csrf_token = CSRF_TOKEN_RE.search(home).group(1)
+
+    def random_user_id(self):
+        return self.rng.randint(1, self.num_users)
+
+    def request(self, route):
+        """Make one request for `route`, returning the response."""
+
+        get = self.session.get
+        post = self.session.post
+        form = {'csrf_token': self.csrf_token}
+
+        if route == 'GET /':
+            return get(f'{self.url}/')
+        if route == 'GET /users/<id>':
+            return get(f'{self.url}/users/{self.random_user_id()}')
+        if route == 'GET /users?q=':
+            term = self.rng.choice(ADJECTIVES + NOUNS)[:self.rng.randint(3, 6)]
+            return get(f'{self.url}/users', params={'q': term})
+        if route == 'GET /messages/new':
+            return get(f'{self.url}/messages/new')
+        if route == 'POST /messages/<id>/likes':
+            message_id = self.rng.randint(1, self.num_messages)
+            return post(f'{self.url}/messages/{message_id}/likes', data=form,
+                        allow_redirects=False)
+        if route == 'POST /users/follow/<id>':
+            # Toggle, so the user's follow state stays consistent
+            other_id = self.random_user_id()
+            if other_id == self.user_id:
+                other_id = other_id % self.num_users + 1
+            if other_id in self.following:
+                self.following.discard(other_id)
+                action = 'stop-following'
+            else:
+                self.following.add(other_id)
+                action = 'follow'
+            return post(f'{self.url}/users/{action}/{other_id}', data=form,
+                        allow_redirects=False)
+
+        raise ValueError(route)
+
+    def run(self, routes, weights, start_at, stop_at, think, results):
+        """Make requests until `stop_at`, recording those after `start_at`."""
+
+        while True:
+            route = self.rng.choices(routes, weights)[0]
+            started = perf_counter()
+            if started >= stop_at:
+                break
+
+            try:
+                ok = self.request(route).status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = perf_counter() - started
+
+            if started >= start_at:
+                results[route].append((elapsed, ok))
+            if think:
+                sleep(self.rng.uniform(0, 2 * think))
+
+
+def make_virtual_users(args, url, engine, num_users, num_messages):
+    rng = Random(args.seed)
+    user_ids = rng.sample(range(1, num_users + 1), min(args.vus, num_users))
+
+    with engine.connect() as connection:
+        usernames = dict(connection.execute(text(
+            "SELECT id, username FROM users WHERE id = ANY(:ids)"),
+            {'ids': user_ids}).all())
+        following = defaultdict(set)
+        for follower, followed in connection.execute(text(
+                "SELECT user_following_id, user_being_followed_id "
+                "FROM follows WHERE user_following_id = ANY(:ids)"),
+                {'ids': user_ids}):
+            following[follower].add(followed)
+
+    return [VirtualUser(url, user_id, usernames[user_id], following[user_id],
+                        num_users, num_messages, Random(args.seed + user_id))
+            for user_id in user_ids]
+
+
+##############################################################################
+# Reporting
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+
+    rank = max(0, -(-p * len(ordered) // 100) - 1)
+    return ordered[rank]
+
+
+def summarize(results, seconds):
+    routes = {}
+    for route in ROUTE_MIX:
+        samples = [r for per_user in results for r in per_user[route]]
+        if not samples:
+            continue
+        latencies = sorted(elapsed for elapsed, _ in samples)
+        summary = {
+            'requests': len(samples),
+            'errors': sum(1 for _, ok in samples if not ok),
+            'throughput_rps': round(len(samples) / seconds, 2),
+            'mean_ms': round(1000 * sum(latencies) / len(latencies), 2),
+        }
+        for p in PERCENTILES:
+            summary[f'p{p}_ms'] = round(1000 * percentile(latencies, p), 2)
+        summary['max_ms'] = round(1000 * latencies[-1], 2)
+        routes[route] = summary
+
+    total = sum(r['requests'] for r in routes.values())
+    return {
+        'requests': total,
+        'errors': sum(r['errors'] for r in routes.values()),
+        'throughput_rps': round(total / seconds, 2),
+        'routes': routes,
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"\n{report['requests']:,} requests, {report['errors']:,} errors, "
+          f"{report['throughput_rps']:,.1f} req/s")
+    print(f"  {'route':<28} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}"
+          + ("   p95 vs baseline" if baseline else ""))
+
+    for route, r in report['routes'].items():
+        line = (f"  {route:<28} {r['throughput_rps']:>8.1f} "
+                f"{r['p50_ms']:>6.1f}ms {r['p95_ms']:>6.1f}ms "
+                f"{r['p99_ms']:>6.1f}ms")
+        before = baseline and baseline['routes'].get(route)
+        if before:
+            change = (r['p95_ms'] - before['p95_ms']) / before['p95_ms']
+            line += f"   {change:+7.1%}"
+        print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+##############################################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--database-url',
+                        default=os.environ.get('LOADTEST_DATABASE_URL',
+                                               'postgresql:///warbler_loadtest'))
+    parser.add_argument('--skip-seed', action='store_true',
+                        help="reuse the data already in the database")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--follows', type=int, default=40000)
+    parser.add_argument('--likes', type=int, default=100000)
+    parser.add_argument('--dms', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=4,
+                        help="gunicorn threads per worker")
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--vus', type=int, default=16,
+                        help="virtual users making requests at once")
+    parser.add_argument('--duration', type=float, default=30,
+                        help="seconds to record for")
+    parser.add_argument('--warmup', type=float, default=5,
+                        help="seconds of requests to run before recording")
+    parser.add_argument('--think', type=float, default=0,
+                        help="mean pause between a user's requests, seconds")
+    parser.add_argument('--out', default='loadtest.json')
+    parser.add_argument('--baseline', help="earlier --out file to compare to")
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL=args.database_url,
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'loadtest'),
+               GUNICORN_THREADS=str(args.threads))
+
+    if not args.skip_seed:
+        seed(args, env)
+
+    engine = create_engine(args.database_url)
+    num_users, num_messages = dataset_size(engine)
+
+    server, url = start_server(args, env)
+    try:
+        users = make_virtual_users(args, url, engine, num_users, num_messages)
+        print(f"Logging in {len(users)} virtual users...")
+        for user in users:
+            user.login()
+
+        routes, weights = zip(*ROUTE_MIX.items())
+        start_at = perf_counter() + args.warmup
+        stop_at = start_at + args.duration
+        results = [defaultdict(list) for _ in users]
+        threads = [
+            threading.Thread(target=user.run, args=(
+                routes, weights, start_at, stop_at, args.think, result))
+            for user, result in zip(users, results)
+        ]
+
+        print(f"Running for {args.warmup:g}s warmup + {args.duration:g}s...")
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        'revision': git_revision(),
+        'config': {
+            'users': num_users, 'messages': num_messages,
+            'workers': args.workers, 'threads': args.threads,
+            'vus': len(users), 'duration_s': args.duration,
+            'think_s': args.think, 'seed': args.seed,
+        },
+        **summarize(results, args.duration),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""HTTP caching policy.
+
+- Static files linked with `static_url()` carry a fingerprint of their
+  contents (`?v=...`), so they can be cached for a year: a changed file
+  gets a new URL.
+- Pages that opt in with `cached_page()` get a weak ETag built from cheap
+  version stamps (e.g. `User.updated_at` and counters) plus the viewer's
+  own session stamps. A browser revalidating an unchanged page gets a 304
+  without any template being rendered.
+- Everything else is `private, no-store`, as before.
+
+Pages are personalized (navbar, follow buttons, CSRF tokens), so they are
+always `private`: browsers may keep them, shared caches may not.
+"""
+
+import hashlib
+import os
+from threading import Lock
+from time import time
+
+from flask import current_app, g, make_response, request, session, url_for
+
+# Seconds browsers and CDNs may keep fingerprinted static files
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+# Seconds for static files requested without (or with a stale) fingerprint
+UNVERSIONED_STATIC_MAX_AGE = 60 * 60
+
+_asset_versions = {}
+_asset_versions_lock = Lock()
+
+
+def asset_version(filename):
+    """Short hash of a static file's contents, recomputed if it changes."""
+
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    with _asset_versions_lock:
+        cached = _asset_versions.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    with open(path, 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:10]
+
+    with _asset_versions_lock:
+        _asset_versions[filename] = (mtime, version)
+    return version
+
+
+def static_url(filename):
+    """URL for a static file, fingerprinted so it can be cached forever."""
+
+    return url_for('static', filename=filename, v=asset_version(filename))
+
+
+def viewer_stamp():
+    """What about the logged-in user shows up on every page.
+
+    The CSRF time bucket makes a cached page go stale before the tokens in
+    its forms expire.
+    """
+
+    user = g.get('user')
+    csrf_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600) or 3600
+    return (
+        user.stamp() if user is not None else None,
+        int(time() // (csrf_limit / 2)),
+    )
+
+
+def user_stamp(user):
+    """Changes whenever anything shown about `user` does."""
+
+    return (user.id, user.updated_at, user.messages_count,
+            user.followers_count, user.following_count, user.likes_count)
+
+
+def page_etag(*parts):
+    """ETag for a page whose content depends only on `parts` and the viewer.
+
+    Each part should be cheap to get, like a row's `updated_at` or counts.
+    """
+
+    key = repr((request.full_path, parts, viewer_stamp())).encode('utf-8')
+    return hashlib.sha1(key).hexdigest()[:20]
+
+
+def cached_page(etag, render):
+    """Respond 304 if the browser has `etag`, else `render()` it with the tag.
+
+    Pages about to show flashed messages are always rendered and not
+    tagged, since the same URL will look different next time.
+    """
+
+    if session.get('_flashes'):
+        return render()
+
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def set_cache_headers(response):
+    """Apply the caching policy to `response`."""
+
+    if request.endpoint == 'static':
+        filename = request.view_args.get('filename')
+        version = request.args.get('v')
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        if version and version == asset_version(filename):
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = UNVERSIONED_STATIC_MAX_AGE
+
+    elif response.get_etag()[0]:
+        # Browser may reuse it, but must check the ETag first
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+
+    return response
+
+
+def init_caching(app):
+    app.after_request(set_cache_headers)
+    app.jinja_env.globals['static_url'] = static_url
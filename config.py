@@ -0,0 +1,104 @@
+"""Settings for each way Warbler runs.
+
+`create_app()` (see app.py) loads one of these profiles, named by its
+argument or else by the WARBLER_CONFIG environment variable:
+
+- development (the default): Flask-DebugToolbar, templates compiled as
+  they're first rendered;
+- testing: no CSRF checks, errors raised in the test instead of a 500;
+- production: no debug toolbar at all, and every template compiled up front
+  with Jinja's bytecode cache on disk, so workers start ready to serve.
+
+Settings from environment variables are read when the app is created, not
+when this module is imported.
+"""
+
+import os
+
+from pooling import pool_config
+
+
+class Config:
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    # Install Flask-DebugToolbar (it only shows when debugging)
+    DEBUG_TOOLBAR = False
+
+    # Keep compiled templates on disk, in TEMPLATE_CACHE_DIR or else a
+    # private temporary directory, for the next process to load
+    TEMPLATE_BYTECODE_CACHE = False
+    TEMPLATE_CACHE_DIR = None
+
+    # Compile every template when the app is created
+    PRECOMPILE_TEMPLATES = False
+
+    # Set up Flask-Migrate (which imports Alembic) even when not run by the
+    # `flask` command
+    MIGRATIONS = True
+
+
+class DevelopmentConfig(Config):
+    DEBUG_TOOLBAR = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+
+
+class ProductionConfig(Config):
+    TEMPLATE_BYTECODE_CACHE = True
+    PRECOMPILE_TEMPLATES = True
+    MIGRATIONS = False
+
+
+PROFILES = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+DEFAULT_PROFILE = 'development'
+
+
+def environ_config(environ):
+    """Settings given by environment variables."""
+
+    config = {
+        # Heroku-style URLs say postgres://, which SQLAlchemy doesn't accept
+        'SQLALCHEMY_DATABASE_URI':
+            environ['DATABASE_URL'].replace("postgres://", "postgresql://"),
+        'SQLALCHEMY_REPLICA_URIS': [
+            url.strip().replace("postgres://", "postgresql://")
+            for url in environ.get('DATABASE_REPLICA_URLS', '').split(',')
+            if url.strip()],
+        'SECRET_KEY': environ['SECRET_KEY'],
+        'BCRYPT_LOG_ROUNDS': int(environ.get('BCRYPT_LOG_ROUNDS', 12)),
+        'FRAGMENT_CACHE_URL': environ.get('FRAGMENT_CACHE_URL'),
+        **pool_config(environ),
+    }
+
+    for name in ('REPLICA_STICKY_SECONDS', 'BCRYPT_POOL_SIZE'):
+        if name in environ:
+            config[name] = int(environ[name])
+    if 'TEMPLATE_CACHE_DIR' in environ:
+        config['TEMPLATE_CACHE_DIR'] = environ['TEMPLATE_CACHE_DIR']
+
+    return config
+
+
+def load_config(app, profile=None, environ=os.environ):
+    """Configure `app` with a profile and the environment's settings."""
+
+    profile = profile or environ.get('WARBLER_CONFIG', DEFAULT_PROFILE)
+    try:
+        app.config.from_object(PROFILES[profile])
+    except KeyError:
+        raise ValueError(
+            f"Unknown config profile {profile!r}; "
+            f"expected one of {', '.join(PROFILES)}") from None
+
+    app.config['PROFILE'] = profile
+    app.config.update(environ_config(environ))
@@ -0,0 +1,162 @@
+"""Denormalized per-user counters.
+
+`users.messages_count`, `followers_count`, `following_count` and
+`likes_count` let profile stats render from the user row alone, and
+`unread_count` totals the user's unread direct messages. The write
+paths keep them current with `adjust_counters()`; `reconcile_counters()`
+recomputes them in bulk after data is loaded or if they ever drift.
+"""
+
+from sqlalchemy import func, or_, select, update
+
+from models import db, User, Message, Follows, Like, Conversation
+
+COUNTER_COLUMNS = (
+    'messages_count', 'followers_count', 'following_count', 'likes_count',
+    'unread_count')
+
+# Users recomputed per transaction by `reconcile_counters()`
+RECONCILE_BATCH_SIZE = 5000
+
+
+def adjust_counters(user_id, **deltas):
+    """Atomically add `deltas` to counters of `user_id`.
+
+    e.g. adjust_counters(5, followers_count=1)
+
+    The increment happens in the database, so concurrent writers never
+    overwrite each other's changes.
+    """
+
+    values = {}
+    for name, delta in deltas.items():
+        if name not in COUNTER_COLUMNS:
+            raise ValueError(f"Unknown counter: {name}")
+        values[name] = getattr(User, name) + delta
+
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def adjust_many(user_ids, **deltas):
+    """Add `deltas` to the counters of every user in `user_ids`."""
+
+    values = {name: getattr(User, name) + delta
+              for name, delta in deltas.items()}
+
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _true_counts():
+    """Correlated subqueries giving each user's real counts."""
+
+    return {
+        'messages_count': (select(func.count())
+                           .where(Message.user_id == User.id)
+                           .scalar_subquery()),
+        'followers_count': (select(func.count())
+                            .where(Follows.user_being_followed_id == User.id)
+                            .scalar_subquery()),
+        'following_count': (select(func.count())
+                            .where(Follows.user_following_id == User.id)
+                            .scalar_subquery()),
+        'likes_count': (select(func.count())
+                        .where(Like.user_id == User.id)
+                        .scalar_subquery()),
+        'unread_count': (select(func.coalesce(
+                             func.sum(Conversation.unread_count), 0))
+                         .where(Conversation.user_id == User.id)
+                         .scalar_subquery()),
+    }
+
+
+def reconcile_counters(batch_size=RECONCILE_BATCH_SIZE, progress=None):
+    """Recompute every user's counters from the underlying tables.
+
+    Only rows whose stored counts are wrong are rewritten. Work is committed
+    per range of user ids; `progress`, if given, is called with the highest
+    id checked so far. Returns the number of users corrected.
+    """
+
+    max_id = db.session.execute(select(func.max(User.id))).scalar() or 0
+    counts = _true_counts()
+
+    fixed = 0
+    for start in range(0, max_id, batch_size):
+        result = db.session.execute(
+            update(User)
+            .where(User.id > start,
+                   User.id <= start + batch_size,
+                   or_(*(getattr(User, name) != count
+                         for name, count in counts.items())))
+            .values(counts)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        fixed += result.rowcount
+        if progress:
+            progress(min(start + batch_size, max_id))
+
+    return fixed
+
+
+def release_message(message):
+    """Adjust counters for `message` about to be deleted.
+
+    The author loses a message and everyone who liked it loses a like.
+    """
+
+    adjust_counters(message.user_id, messages_count=-1)
+    adjust_many(select(Like.user_id).where(Like.message_id == message.id),
+                likes_count=-1)
+
+
+def release_user(user_id):
+    """Adjust other users' counters for `user_id` about to be deleted.
+
+    Users they followed lose a follower, their followers lose a followed
+    user, anyone who liked their messages loses those likes, and anyone
+    with unread messages from them loses those.
+    """
+
+    adjust_many(select(Follows.user_being_followed_id)
+                .where(Follows.user_following_id == user_id),
+                followers_count=-1)
+    adjust_many(select(Follows.user_following_id)
+                .where(Follows.user_being_followed_id == user_id),
+                following_count=-1)
+
+    likes = (select(Like.user_id, func.count().label('n'))
+             .join(Message, Message.id == Like.message_id)
+             .where(Message.user_id == user_id, Like.user_id != user_id)
+             .group_by(Like.user_id)
+             .subquery())
+
+    db.session.execute(
+        update(User)
+        .where(User.id == likes.c.user_id)
+        .values(likes_count=User.likes_count - likes.c.n)
+        .execution_options(synchronize_session=False)
+    )
+
+    unread = (select(Conversation.user_id, Conversation.unread_count)
+              .where(Conversation.other_user_id == user_id,
+                     Conversation.unread_count > 0)
+              .subquery())
+
+    db.session.execute(
+        update(User)
+        .where(User.id == unread.c.user_id)
+        .values(unread_count=User.unread_count - unread.c.unread_count)
+        .execution_options(synchronize_session=False)
+    )
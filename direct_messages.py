@@ -0,0 +1,171 @@
+"""Direct message conversations.
+
+Sending a message updates one `conversations` row per participant: both get
+the new last message, and the recipient's unread count (and their
+`users.unread_count` total) goes up by one. Opening a thread sets the
+reader's count back to zero. The inbox is then a keyset-paginated range
+read on (user_id, last_message_at), and a thread is two range reads, one
+per direction, on the (user_id_from, user_id_to, timestamp) index.
+"""
+
+import heapq
+
+from sqlalchemy import delete, literal, select, tuple_, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
+
+from counters import adjust_counters
+from models import db, Conversation, DirectMessage, User
+from pagination import make_page, paginate
+
+CONVERSATION_ORDER = (Conversation.last_message_at, Conversation.other_user_id)
+
+
+def direct_message_key(dm):
+    """Sort key of `dm` for keyset cursors."""
+
+    return (dm.timestamp, dm.id)
+
+
+def _touch_conversation(user_id, other_user_id, dm, unread):
+    """Point `user_id`'s conversation with `other_user_id` at `dm`."""
+
+    stmt = insert(Conversation).values(
+        user_id=user_id,
+        other_user_id=other_user_id,
+        last_message_id=dm.id,
+        last_message_at=dm.timestamp,
+        unread_count=unread,
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[Conversation.user_id, Conversation.other_user_id],
+        set_={
+            'last_message_id': stmt.excluded.last_message_id,
+            'last_message_at': stmt.excluded.last_message_at,
+            'unread_count': Conversation.unread_count + unread,
+        },
+    ))
+
+
+def send_direct_message(sender_id, recipient_id, subject, text):
+    """Add a direct message and update both sides' conversations.
+
+    The caller commits.
+    """
+
+    dm = DirectMessage(user_id_from=sender_id, user_id_to=recipient_id,
+                       subject=subject, text=text)
+    db.session.add(dm)
+    db.session.flush()
+
+    _touch_conversation(sender_id, recipient_id, dm, unread=0)
+    _touch_conversation(recipient_id, sender_id, dm, unread=1)
+    adjust_counters(recipient_id, unread_count=1)
+
+    return dm
+
+
+def mark_read(user_id, other_user_id):
+    """Clear `user_id`'s unread count for their conversation with another.
+
+    Returns how many messages were unread. The caller commits.
+    """
+
+    conversation = (Conversation.query
+                    .filter_by(user_id=user_id, other_user_id=other_user_id)
+                    .with_for_update()
+                    .first())
+    if conversation is None or not conversation.unread_count:
+        return 0
+
+    unread = conversation.unread_count
+    conversation.unread_count = 0
+    adjust_counters(user_id, unread_count=-unread)
+    return unread
+
+
+def conversations(user_id, before=None, per_page=20):
+    """Page of `user_id`'s conversations, most recently active first."""
+
+    return paginate(
+        Conversation.query
+            .options(joinedload(Conversation.other_user),
+                     joinedload(Conversation.last_message))
+            .filter(Conversation.user_id == user_id),
+        CONVERSATION_ORDER, before=before, per_page=per_page)
+
+
+def thread(user_id, other_user_id, before=None, per_page=20):
+    """Page of messages between two users, newest first."""
+
+    def one_direction(from_id, to_id):
+        query = DirectMessage.query.filter(
+            DirectMessage.user_id_from == from_id,
+            DirectMessage.user_id_to == to_id)
+        if before is not None:
+            query = query.filter(
+                tuple_(DirectMessage.timestamp, DirectMessage.id)
+                < tuple_(*before))
+        return (query
+                .order_by(DirectMessage.timestamp.desc(),
+                          DirectMessage.id.desc())
+                .limit(per_page + 1)
+                .all())
+
+    rows = heapq.merge(one_direction(user_id, other_user_id),
+                       one_direction(other_user_id, user_id),
+                       key=direct_message_key, reverse=True)
+    return make_page(list(rows)[:per_page + 1], per_page,
+                     key=direct_message_key)
+
+
+def rebuild_conversations():
+    """Recreate every conversation row from the direct messages table.
+
+    For data loaded outside the app. Loaded messages count as read.
+    Returns the number of conversation rows written.
+    """
+
+    db.session.execute(delete(Conversation))
+
+    both_directions = union_all(
+        select(DirectMessage.user_id_from.label('user_id'),
+               DirectMessage.user_id_to.label('other_user_id'),
+               DirectMessage.id, DirectMessage.timestamp),
+        select(DirectMessage.user_id_to, DirectMessage.user_id_from,
+               DirectMessage.id, DirectMessage.timestamp),
+    ).subquery()
+
+    latest = (
+        select(both_directions.c.user_id,
+               both_directions.c.other_user_id,
+               both_directions.c.id,
+               both_directions.c.timestamp,
+               literal(0))
+        .distinct(both_directions.c.user_id, both_directions.c.other_user_id)
+        .order_by(both_directions.c.user_id,
+                  both_directions.c.other_user_id,
+                  both_directions.c.timestamp.desc(),
+                  both_directions.c.id.desc())
+    )
+
+    result = db.session.execute(
+        insert(Conversation).from_select(
+            ['user_id', 'other_user_id', 'last_message_id',
+             'last_message_at', 'unread_count'],
+            latest))
+    db.session.execute(
+        User.__table__.update().where(User.unread_count != 0)
+        .values(unread_count=0))
+    db.session.commit()
+
+    return result.rowcount
+
+
+def find_recipient(username):
+    """Id of the user called `username`, or None."""
+
+    return db.session.execute(
+        select(User.id).where(User.username == username.strip().lstrip('@'),
+                              User.deleted_at.is_(None))
+    ).scalar()
@@ -0,0 +1,101 @@
+"""In-process cache of the follow graph.
+
+Keeps, per user, the sorted ids of everyone they follow in a compact
+`array('i')`. Membership is a binary search, so "which of these 60 users do
+I follow?" is answered for a whole directory or follower page with no
+queries once the viewer's list is cached.
+
+Each worker has its own cache. Entries expire after a short TTL, are dropped
+by the worker that handles a follow/unfollow, and callers can pass the time
+of the viewer's own last follow change (kept in their session) so a user
+never sees a stale answer after changing who they follow, whichever worker
+serves them next.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+from sqlalchemy import select
+
+from models import db, Follows
+
+# Seconds a cached following list is trusted
+FOLLOW_CACHE_TTL = 30
+
+# Most users whose following lists are kept per worker
+FOLLOW_CACHE_MAX_USERS = 10000
+
+
+class FollowGraphCache:
+    """LRU of user id -> sorted array of the ids they follow."""
+
+    def __init__(self, ttl=FOLLOW_CACHE_TTL, max_users=FOLLOW_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def following_ids(self, user_id, fresh_after=None):
+        """Sorted array of ids `user_id` follows.
+
+        `fresh_after` is a timestamp; a cached list loaded before it is
+        reloaded.
+        """
+
+        now = time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                loaded_at, ids = entry
+                if (now - loaded_at < self.ttl
+                        and (fresh_after is None or loaded_at >= fresh_after)):
+                    self._entries.move_to_end(user_id)
+                    return ids
+
+        ids = array('i', db.session.execute(
+            select(Follows.user_being_followed_id)
+            .where(Follows.user_following_id == user_id)
+            .order_by(Follows.user_being_followed_id)
+        ).scalars())
+
+        with self._lock:
+            self._entries[user_id] = (now, ids)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+        return ids
+
+    def is_following(self, user_id, other_id, fresh_after=None):
+        """Does `user_id` follow `other_id`?"""
+
+        ids = self.following_ids(user_id, fresh_after)
+        i = bisect_left(ids, other_id)
+        return i < len(ids) and ids[i] == other_id
+
+    def following_among(self, user_id, candidate_ids, fresh_after=None):
+        """Return the subset of `candidate_ids` that `user_id` follows."""
+
+        ids = self.following_ids(user_id, fresh_after)
+        found = set()
+        for other_id in candidate_ids:
+            i = bisect_left(ids, other_id)
+            if i < len(ids) and ids[i] == other_id:
+                found.add(other_id)
+        return found
+
+    def invalidate(self, user_id):
+        """Forget `user_id`'s cached following list."""
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+follow_cache = FollowGraphCache()
@@ -1,15 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, TextAreaField, SelectField
+from wtforms import StringField, PasswordField, TextAreaField
 from wtforms.validators import DataRequired, Email, Length, URL, Optional
-from wtforms_alchemy import model_form_factory
-from models import db, DirectMessage
 
-BaseModelForm = model_form_factory(FlaskForm)
-
-class ModelForm(BaseModelForm):
-    @classmethod
-    def get_session(self):
-        return db.session
 
 class MessageForm(FlaskForm):
     """Form for adding/editing messages."""
@@ -45,9 +37,9 @@ class EditProfileForm(FlaskForm):
     bio = StringField('(Optional) Bio')
     password = PasswordField('Password', validators=[Length(min=6)])
 
-class DirectMessageForm(ModelForm):
-    class Meta:
-        model = DirectMessage
-        include = ['user_id_to']
+class DirectMessageForm(FlaskForm):
+    """Form for sending a direct message."""
 
-    user_id_to = SelectField(validators=[DataRequired()])
\ No newline at end of file
+    recipient = StringField('To (username)', validators=[DataRequired()])
+    subject = StringField('Subject', validators=[DataRequired(), Length(max=20)])
+    text = TextAreaField('Message', validators=[DataRequired()])
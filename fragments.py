@@ -0,0 +1,211 @@
+"""Cached HTML for message cards.
+
+A message card (author picture and name, date, text) looks the same to
+every viewer, so its rendered HTML is cached, keyed by the message id and a
+version of the author's displayed profile (username and picture). Messages
+can't be edited, so a profile edit is the only thing that changes a card;
+the new version gives it a new key everywhere at once.
+
+The per-viewer parts (like star, delete button) are rendered by the page
+and spliced into each card's ACTIONS_SLOT:
+
+    {% for card in message_cards(messages) %}
+      {% call card.render() %}...like form for card.message...{% endcall %}
+    {% endfor %}
+
+Cards are kept in a per-worker LRU. If FRAGMENT_CACHE_URL names a Redis
+server (needs the `redis` package), workers also share cards through it,
+fetching a page's worth of local misses in one round trip.
+"""
+
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+from flask import current_app
+from markupsafe import Markup
+
+CARD_TEMPLATE = 'messages/card.html'
+
+# Where a card's per-viewer markup goes
+ACTIONS_SLOT = '<!--viewer-actions-->'
+
+# Seconds a card is kept; keys are versioned, so this only bounds memory
+FRAGMENT_CACHE_TTL = 60 * 60
+
+# Most cards kept per worker
+FRAGMENT_CACHE_MAX_ENTRIES = 10000
+
+
+def profile_version(user):
+    """Short hash of the profile fields a card shows about its author."""
+
+    key = repr((user.username, user.image_url)).encode('utf-8')
+    return hashlib.sha1(key).hexdigest()[:12]
+
+
+class RedisFragmentBackend:
+    """Cards shared between workers through Redis."""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        values = self.client.mget(keys)
+        return {key: value.decode('utf-8')
+                for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items, ttl):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.setex(key, ttl, value)
+        pipeline.execute()
+
+    def delete(self, keys):
+        self.client.delete(*keys)
+
+
+class MessageCard:
+    """A message's cached card, ready for the viewer's actions."""
+
+    def __init__(self, message, html):
+        self.message = message
+        self.html = html
+
+    def render(self, caller=None):
+        actions = caller() if caller is not None else ''
+        return Markup(self.html.replace(ACTIONS_SLOT, actions, 1))
+
+
+class FragmentCache:
+    """LRU of card key -> (stored at, author id, html), in front of an
+    optional shared backend."""
+
+    def __init__(self, ttl=FRAGMENT_CACHE_TTL,
+                 max_entries=FRAGMENT_CACHE_MAX_ENTRIES, backend=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._template_version = None
+
+    def _key(self, message_id, version):
+        if self._template_version is None:
+            env = current_app.jinja_env
+            source = env.loader.get_source(env, CARD_TEMPLATE)[0]
+            self._template_version = hashlib.sha1(
+                source.encode('utf-8')).hexdigest()[:8]
+
+        return f"card:{self._template_version}:{message_id}:{version}"
+
+    def _get_local(self, keys, now):
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if now - entry[0] > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[2]
+        return found
+
+    def _put_local(self, items, authors, now):
+        with self._lock:
+            for key, html in items.items():
+                self._entries[key] = (now, authors[key], html)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _render(self, message):
+        template = current_app.jinja_env.get_template(CARD_TEMPLATE)
+        return template.render(msg=message, actions_slot=Markup(ACTIONS_SLOT))
+
+    def _shared(self, method, *args):
+        # The shared cache only saves rendering; if it's down, render
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception:
+            current_app.logger.warning(
+                "Fragment cache backend %s failed", method, exc_info=True)
+            return None
+
+    def cards(self, messages):
+        """MessageCards for `messages` (authors loaded), rendering and
+        storing any that aren't cached."""
+
+        now = time()
+        keys = {message.id: self._key(message.id,
+                                      profile_version(message.user))
+                for message in messages}
+        authors = {keys[message.id]: message.user_id for message in messages}
+        html = self._get_local(list(keys.values()), now)
+
+        missing = [key for key in keys.values() if key not in html]
+        if missing and self.backend is not None:
+            shared = self._shared('get_many', missing) or {}
+            html.update(shared)
+            self._put_local(shared, authors, now)
+
+        rendered = {}
+        for message in messages:
+            key = keys[message.id]
+            if key not in html:
+                rendered[key] = html[key] = self._render(message)
+
+        if rendered:
+            self._put_local(rendered, authors, now)
+            if self.backend is not None:
+                self._shared('set_many', rendered, self.ttl)
+
+        return [MessageCard(message, html[keys[message.id]])
+                for message in messages]
+
+    def invalidate_message(self, message_id, version):
+        """Drop a deleted message's card, given its id and its author's
+        `profile_version()`, both read before the delete."""
+
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key.split(':')[2] == str(message_id)]:
+                del self._entries[key]
+
+        if self.backend is not None:
+            self._shared('delete', [self._key(message_id, version)])
+
+    def invalidate_user(self, user_id):
+        """Drop this worker's cards by `user_id`.
+
+        Other workers and the shared backend hold them under the old
+        profile version, which no page asks for again.
+        """
+
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if entry[1] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def message_cards(messages):
+    return fragment_cache.cards(list(messages))
+
+
+def init_fragments(app):
+    url = app.config.get('FRAGMENT_CACHE_URL')
+    if url:
+        fragment_cache.backend = RedisFragmentBackend(url)
+    app.jinja_env.globals['message_cards'] = message_cards
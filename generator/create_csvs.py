@@ -2,76 +2,263 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows:
+
+    python generator/create_csvs.py --users 100000 --messages 10000000 \\
+        --follows 5000000 --likes 20000000 --dms 1000000
+
+Rows are streamed straight to disk, so memory use grows only by each
+message's author (4 bytes a message, kept so nobody likes their own
+messages), and the same --seed always produces the same files. No network
+access is needed.
+
+Follower counts, posting and likes follow power laws: a few users have most
+of the followers and write most of the messages, and a few messages get
+most of the likes. Message and direct message ids (assigned by the database
+in file order, see load.py) increase with their timestamps.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
-from faker import Faker
-from helpers import get_random_datetime
+import os
+from array import array
+from datetime import datetime, timedelta
+from random import Random
+from time import perf_counter
+
+from helpers import (ADJECTIVES, NOUNS, LOCATIONS, DOMAINS, IMAGE_URLS,
+                     HEADER_IMAGE_URLS, sentence, paragraph, zipf_rank,
+                     scatter, allocate)
 
 MAX_WARBLER_LENGTH = 140
+MAX_SUBJECT_LENGTH = 20
+MAX_DIRECT_MESSAGE_LENGTH = 500
 
 USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio', 'header_image_url', 'location']
 MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
 FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+LIKES_CSV_HEADERS = ['user_id', 'message_id']
+DIRECT_MESSAGES_CSV_HEADERS = ['subject', 'text', 'timestamp', 'user_id_from', 'user_id_to']
 
 NUM_USERS = 300
 NUM_MESSAGES = 1000
-NUM_FOLLWERS = 5000
+NUM_FOLLOWS = 5000
+NUM_LIKES = 2000
+NUM_DIRECT_MESSAGES = 500
+
+# bcrypt hash of "password", shared by every generated user
+PASSWORD_HASH = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+# How unevenly follows and likes are handed out: each user's share is
+# proportional to 1 / rank ** skew
+FOLLOWING_SKEW = 0.5
+LIKING_SKEW = 0.5
+
+# Chance that a message author, followed user or liked message is picked by
+# popularity rather than uniformly at random
+POPULAR_AUTHOR_RATE = 0.7
+POPULAR_FOLLOW_RATE = 0.5
+POPULAR_LIKE_RATE = 0.5
+
+# Generated timestamps span this many days before --end
+TIME_SPAN_DAYS = 730
+
+
+def open_writer(directory, filename, headers):
+    f = open(os.path.join(directory, filename), 'w', newline='',
+             buffering=1 << 20)
+    writer = csv.writer(f)
+    writer.writerow(headers)
+    return f, writer
+
+
+def timestamps(rng, count, end, days):
+    """Yield `count` increasing datetimes spread over `days` before `end`."""
+
+    start = end - timedelta(days=days)
+    step = days * 86400 / max(count, 1)
+    for i in range(count):
+        yield start + timedelta(seconds=(i + rng.random()) * step)
+
+
+def pick(rng, n, rate, popular):
+    """An index in range(n): by popularity with chance `rate`, else uniform."""
+
+    if rng.random() < rate:
+        return popular(zipf_rank(rng, n))
+    return rng.randrange(n)
+
+
+def distinct_picks(rng, count, n, rate, popular, exclude=None, keep=None):
+    """Sorted list of `count` different picks, none equal to `exclude` and
+    all passing `keep`, if given."""
+
+    chosen = set()
+    while len(chosen) < count:
+        i = pick(rng, n, rate, popular)
+        if i != exclude and (keep is None or keep(i)):
+            chosen.add(i)
+    return sorted(chosen)
+
+
+def write_users(rng, directory, num_users):
+    f, writer = open_writer(directory, 'users.csv', USERS_CSV_HEADERS)
+    with f:
+        for user_id in range(1, num_users + 1):
+            username = f"{rng.choice(ADJECTIVES)}_{rng.choice(NOUNS)}{user_id}"
+            writer.writerow([
+                f"{username}@{rng.choice(DOMAINS)}",
+                username,
+                rng.choice(IMAGE_URLS),
+                PASSWORD_HASH,
+                sentence(rng),
+                rng.choice(HEADER_IMAGE_URLS),
+                rng.choice(LOCATIONS),
+            ])
+    return num_users
+
+
+def write_messages(rng, directory, num_users, num_messages, end,
+                   popular_users, authors):
+    """Write messages.csv, appending each message's author to `authors`."""
+
+    f, writer = open_writer(directory, 'messages.csv', MESSAGES_CSV_HEADERS)
+    with f:
+        for timestamp in timestamps(rng, num_messages, end, TIME_SPAN_DAYS):
+            author = pick(rng, num_users, POPULAR_AUTHOR_RATE, popular_users)
+            authors.append(author)
+            writer.writerow([
+                paragraph(rng, MAX_WARBLER_LENGTH),
+                timestamp,
+                author + 1,
+            ])
+    return num_messages
+
+
+def write_follows(rng, directory, num_users, num_follows, popular_users):
+    # Following half of everyone is plenty, and keeps picks cheap
+    cap = (num_users - 1) // 2
+    rows = 0
+
+    f, writer = open_writer(directory, 'follows.csv', FOLLOWS_CSV_HEADERS)
+    with f:
+        for follower, count in allocate(rng, num_follows, num_users,
+                                        FOLLOWING_SKEW, cap):
+            for followed in distinct_picks(rng, count, num_users,
+                                           POPULAR_FOLLOW_RATE, popular_users,
+                                           exclude=follower):
+                writer.writerow([followed + 1, follower + 1])
+            rows += count
+    return rows
+
+
+def write_likes(rng, directory, num_users, num_messages, num_likes,
+                authors):
+    popular_messages = scatter(rng, num_messages)
+    cap = num_messages // 2
+    rows = 0
+
+    written = [0] * num_users
+    for author in authors:
+        written[author] += 1
 
-fake = Faker()
+    f, writer = open_writer(directory, 'likes.csv', LIKES_CSV_HEADERS)
+    with f:
+        for user, count in allocate(rng, num_likes, num_users,
+                                    LIKING_SKEW, cap):
+            # Nobody likes their own messages (interactions.like() refuses
+            # to), so a prolific author has fewer messages to pick from
+            count = min(count, (num_messages - written[user]) // 2)
+            for message in distinct_picks(
+                    rng, count, num_messages, POPULAR_LIKE_RATE,
+                    popular_messages,
+                    keep=lambda message: authors[message] != user):
+                writer.writerow([user + 1, message + 1])
+            rows += count
+    return rows
 
-# Generate random profile image URLs to use for users
 
-image_urls = [
-    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
-    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
-    for i in range(count)
-]
+def write_direct_messages(rng, directory, num_users, num_direct_messages,
+                          end, popular_users):
+    f, writer = open_writer(directory, 'directmessages.csv',
+                            DIRECT_MESSAGES_CSV_HEADERS)
+    with f:
+        for timestamp in timestamps(rng, num_direct_messages, end,
+                                    TIME_SPAN_DAYS):
+            sender = rng.randrange(num_users)
+            recipient = sender
+            while recipient == sender:
+                recipient = pick(rng, num_users, POPULAR_FOLLOW_RATE,
+                                 popular_users)
+            writer.writerow([
+                sentence(rng, 1, 3)[:MAX_SUBJECT_LENGTH],
+                paragraph(rng, MAX_DIRECT_MESSAGE_LENGTH),
+                timestamp,
+                sender + 1,
+                recipient + 1,
+            ])
+    return num_direct_messages
 
-# Generate random header image URLs to use for users
 
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
-]
+def generate(directory, num_users=NUM_USERS, num_messages=NUM_MESSAGES,
+             num_follows=NUM_FOLLOWS, num_likes=NUM_LIKES,
+             num_direct_messages=NUM_DIRECT_MESSAGES, seed=0,
+             end=datetime(2022, 10, 1)):
+    """Write every CSV to `directory`, printing rows/s for each."""
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
+    rng = Random(seed)
 
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
+    # Rank -> user index, shared by followers and posting, so the most
+    # followed users are also the most prolific
+    popular_users = scatter(rng, num_users)
+    authors = array('I')
 
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
+    steps = [
+        ('users', lambda: write_users(rng, directory, num_users)),
+        ('messages', lambda: write_messages(
+            rng, directory, num_users, num_messages, end, popular_users,
+            authors)),
+        ('follows', lambda: write_follows(
+            rng, directory, num_users, num_follows, popular_users)),
+        ('likes', lambda: write_likes(
+            rng, directory, num_users, num_messages, num_likes, authors)),
+        ('directmessages', lambda: write_direct_messages(
+            rng, directory, num_users, num_direct_messages, end,
+            popular_users)),
+    ]
 
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
+    for name, step in steps:
+        start = perf_counter()
+        rows = step()
+        seconds = perf_counter() - start
+        print(f"  {name:<15} {rows:>12,} rows  {seconds:8.2f}s  "
+              f"{rows / seconds if seconds else 0:>12,.0f} rows/s")
 
-# Generate follows.csv from random pairings of users
 
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate CSVs of random data for Warbler.")
+    parser.add_argument('--dir', default=os.path.dirname(__file__) or '.',
+                        help="directory to write the CSV files to")
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLOWS)
+    parser.add_argument('--likes', type=int, default=NUM_LIKES)
+    parser.add_argument('--dms', type=int, default=NUM_DIRECT_MESSAGES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--end', type=datetime.fromisoformat,
+                        default=datetime(2022, 10, 1),
+                        help="latest timestamp, as YYYY-MM-DD")
+    args = parser.parse_args()
 
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
+    if args.users < 3 or args.messages < 2:
+        parser.error("need at least 3 users and 2 messages")
+    # Keep follows and likes well below the cap each user can take, so the
+    # requested counts can always be met
+    if args.follows > args.users * ((args.users - 1) // 2) // 4:
+        parser.error("too many follows for that many users")
+    if args.likes > args.users * (args.messages // 2) // 4:
+        parser.error("too many likes for that many users and messages")
 
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+    generate(args.dir, args.users, args.messages, args.follows, args.likes,
+             args.dms, args.seed, args.end)
@@ -1,14 +1,133 @@
-"""Support functions for CSV generation."""
+"""Support functions for CSV generation.
 
-from datetime import datetime
-from random import uniform
+Everything here draws from a `random.Random` passed in by the caller, so a
+given seed always produces the same rows, and nothing touches the network.
+"""
 
+from math import gcd
 
-def get_random_datetime(year_gap=2):
-    """Get a random datetime within the last few years."""
+ADJECTIVES = """
+    amber ancient autumn bitter black bold brave bright broken calm clever
+    cold crimson curious damp dark dawn deep dry dusty eager early empty
+    fading fancy fierce floral fragrant frosty gentle golden green hidden
+    hollow humble icy jolly late lively lone long lucky misty morning muddy
+    noisy old orange patient pink plain polished proud purple quiet rapid
+    red restless rough round shy silent silver small snowy solitary sparkling
+    spring still summer sunny swift tiny twilight wandering warm weathered
+    white wild windy winter wispy yellow young
+""".split()
 
-    now = datetime.now()
-    then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+NOUNS = """
+    bird brook bush butterfly cloud dawn dew dream dust feather field fire
+    firefly flower fog forest frog glade glitter grass haze hill lake leaf
+    meadow moon morning mountain night owl paper pine pond rain resonance
+    river robin sea shadow shape silence sky smoke snow snowflake sound star
+    sun sunset surf thunder tree truth violet voice water waterfall wave
+    wildflower wind wood wren finch sparrow heron lark swallow
+""".split()
 
-    return datetime.fromtimestamp(random_timestamp)
+WORDS = """
+    about after again air all also always another any around away back
+    because been before being best better between big both bring but call
+    came can change city close coffee come could day did different does dog
+    done down each early end enough even every example eye face family far
+    feel few find first follow food found friend from game get give good
+    great group hand hard have head hear help here high home house idea
+    important just keep kind know large last later learn leave left life
+    light like line little live long look made make many may mean might
+    more most move much music must name need never new next night nothing
+    now number often old once only open other over own page paper part
+    people place plan play point put question quite read real right room
+    run said same saw say school second see seem set should show side small
+    something sometimes song soon sound start still story study such sure
+    take talk tell than thing think thought through time today together
+    told took try turn under until very walk want warble watch water way
+    week well went what when where while why with without word work world
+    would write year yes yesterday young
+""".split()
+
+LOCATIONS = """
+    Aberdeen Albany Austin Boise Boston Bristol Cardiff Chicago Cork Denver
+    Dublin Dundee Durham Edinburgh Glasgow Halifax Houston Leeds Lisbon
+    Madison Melbourne Memphis Nashville Oakland Omaha Oslo Perth Portland
+    Quebec Reno Richmond Sacramento Seattle Sheffield Spokane Sydney Tacoma
+    Toronto Tucson Vancouver Wellington Winnipeg York
+""".split()
+
+DOMAINS = ["example.com", "example.net", "example.org", "mail.test"]
+
+IMAGE_URLS = [
+    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
+    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
+    for i in range(count)
+]
+
+HEADER_IMAGE_URLS = [
+    "/static/images/warbler-hero.jpg",
+    "/static/images/signed-out-home.jpg",
+    "/static/images/nav-bg.png",
+]
+
+
+def sentence(rng, min_words=4, max_words=14):
+    """A capitalised sentence of random words."""
+
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng, max_length):
+    """One or more sentences, cut to at most `max_length` characters."""
+
+    text = sentence(rng)
+    while rng.random() < 0.5:
+        text += " " + sentence(rng)
+    return text[:max_length]
+
+
+def zipf_rank(rng, n):
+    """A rank in range(n) drawn with P(rank = r) roughly proportional to 1/r.
+
+    Log-uniform sampling: no lookup table, so it costs the same for ten
+    users as for ten million messages.
+    """
+
+    return min(int((n + 1) ** rng.random()) - 1, n - 1)
+
+
+def scatter(rng, n):
+    """A random bijection on range(n), as `rank -> position`.
+
+    Used so that the most popular users or messages are spread across the
+    id range instead of being the lowest ids. It's an affine map, so it
+    takes no memory however large `n` is.
+    """
+
+    step = rng.randrange(1, n) if n > 1 else 1
+    while gcd(step, n) != 1:
+        step = rng.randrange(1, n)
+    offset = rng.randrange(n)
+
+    return lambda rank: (step * rank + offset) % n
+
+
+def allocate(rng, total, n, skew, cap):
+    """Yield (index, share) splitting `total` over range(n), heavy-tailed.
+
+    Each index gets a share proportional to 1 / (r + 1) ** skew, where r is
+    its rank in a random order, and no share is larger than `cap`. Shares
+    that don't fit carry over to later indexes, so the shares add up to
+    `total` as long as it's well under n * cap.
+    """
+
+    order = scatter(rng, n)
+    weight_sum = sum(1 / (r + 1) ** skew for r in range(n))
+
+    carry = 0.0
+    remaining = total
+    for i in range(n):
+        carry += total / weight_sum / (order(i) + 1) ** skew
+        share = min(remaining if i == n - 1 else int(carry), cap, remaining)
+        carry -= share
+        remaining -= share
+        yield i, share
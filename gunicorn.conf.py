@@ -0,0 +1,73 @@
+"""Gunicorn settings for Warbler.
+
+Picked up automatically by gunicorn from the project directory. In
+production run
+
+    gunicorn --preload "app:create_app('production')"
+
+so the master builds the app once and forks workers that share its memory
+until they write to it.
+"""
+
+import gc
+import os
+import shutil
+import tempfile
+
+# Each worker writes its Prometheus samples here so /metrics can add them up.
+# This must be set, and the directory exist, before anything imports
+# prometheus_client: with --preload the master imports the app before
+# on_starting runs.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'warbler-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Threads per worker, so other requests are served while a thread waits on
+# the password-hashing pool (see passwords.py)
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# The master collects no garbage until it's frozen the preloaded app (see
+# when_ready), so collections don't write to pages the workers share
+gc.disable()
+
+
+def on_starting(server):
+    """Start every deploy with an empty metrics directory."""
+
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def when_ready(server):
+    """Move everything loaded so far out of the collector's reach.
+
+    Frozen objects are never scanned, so workers don't touch (and copy)
+    the pages of the app they inherited just to check it for cycles.
+    """
+
+    gc.freeze()
+    gc.enable()
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Start the worker with its own database connections."""
+
+    gc.enable()
+
+    app = server.app.callable
+    if app is not None:
+        from pooling import dispose_engines
+        dispose_engines(app)
+
+
+def child_exit(server, worker):
+    """Drop live gauges belonging to a worker that has exited."""
+
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
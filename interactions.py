@@ -0,0 +1,115 @@
+"""Likes and follows.
+
+Each write is one statement that touches only the rows involved: the
+`likes` or `follows` row is inserted with ON CONFLICT DO NOTHING (or deleted
+with RETURNING) in a data-modifying CTE, and the counters are updated by
+the same statement only if that row actually changed. So repeating a write,
+or racing another request for the same row, is harmless: the loser changes
+nothing, raises nothing and leaves the counters right.
+
+Each function returns whether anything changed. The caller commits.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import case, delete, exists, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Follows, Like, Message, User
+from timeline import backfill_follow, prune_follow
+
+
+def _update_counters_if(changed, user_ids, **deltas):
+    """Add `deltas` to `user_ids`' counters if the CTE `changed` returns a
+    row, in the same statement. Returns whether it did."""
+
+    # Set explicitly: the column's onupdate isn't applied alongside a CTE
+    values = {'updated_at': datetime.utcnow()}
+    for name, per_user in deltas.items():
+        column = getattr(User, name)
+        values[name] = column + case(
+            {user_id: delta for user_id, delta in per_user.items()},
+            value=User.id, else_=0)
+
+    return db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids), exists(select(changed.c[0])))
+        .values(values)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    ).first() is not None
+
+
+def like(user_id, message_id):
+    """Have `user_id` like `message_id`, unless it's their own message."""
+
+    added = (
+        insert(Like)
+        .from_select(['user_id', 'message_id'],
+                     select(literal(user_id), Message.id)
+                     .where(Message.id == message_id,
+                            Message.user_id != user_id))
+        .on_conflict_do_nothing()
+        .returning(Like.user_id)
+        .cte('added'))
+
+    return _update_counters_if(added, [user_id],
+                               likes_count={user_id: 1})
+
+
+def unlike(user_id, message_id):
+    """Have `user_id` stop liking `message_id`, if they liked it."""
+
+    removed = (
+        delete(Like)
+        .where(Like.user_id == user_id, Like.message_id == message_id)
+        .returning(Like.user_id)
+        .cte('removed'))
+
+    return _update_counters_if(removed, [user_id],
+                               likes_count={user_id: -1})
+
+
+def follow(follower_id, followed_id):
+    """Have `follower_id` follow `followed_id` and fill in their timeline."""
+
+    if follower_id == followed_id:
+        return False
+
+    added = (
+        insert(Follows)
+        .values(user_being_followed_id=followed_id,
+                user_following_id=follower_id)
+        .on_conflict_do_nothing()
+        .returning(Follows.user_following_id)
+        .cte('added'))
+
+    changed = _update_counters_if(
+        added, [follower_id, followed_id],
+        following_count={follower_id: 1},
+        followers_count={followed_id: 1})
+
+    if changed:
+        backfill_follow(follower_id, followed_id)
+    return changed
+
+
+def unfollow(follower_id, followed_id):
+    """Have `follower_id` stop following `followed_id` and drop that
+    user's messages from their timeline."""
+
+    removed = (
+        delete(Follows)
+        .where(Follows.user_being_followed_id == followed_id,
+               Follows.user_following_id == follower_id)
+        .returning(Follows.user_following_id)
+        .cte('removed'))
+
+    changed = _update_counters_if(
+        removed, [follower_id, followed_id],
+        following_count={follower_id: -1},
+        followers_count={followed_id: -1})
+
+    if changed:
+        prune_follow(follower_id, followed_id)
+    return changed
@@ -0,0 +1,224 @@
+"""Bulk-load Warbler data from CSV files.
+
+    python load.py [--dir generator] [--workers 4]
+
+Recreates the schema (stamped as migrated to the latest revision), then
+loads users.csv, messages.csv, follows.csv and, if present, likes.csv and
+directmessages.csv. Each CSV's header row names the columns it fills.
+
+On Postgres each file is streamed through `COPY ... FROM STDIN`, with
+secondary indexes, unique and foreign-key constraints dropped for the load
+and rebuilt afterwards, and tables loaded in parallel on separate
+connections. Other databases fall back to batched `executemany` inserts.
+
+Afterwards sequences are moved past the loaded ids, and the derived data
+(conversations, profile counters and home timelines) is rebuilt.
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from time import perf_counter
+
+from sqlalchemy import text
+
+from flask_migrate import stamp
+
+from app import app, db, init_migrations
+from counters import reconcile_counters
+from direct_messages import rebuild_conversations
+from timeline import rebuild_timelines
+
+# Files loaded, in dependency order (which matters only for executemany)
+TABLE_FILES = (
+    ('users', 'users.csv'),
+    ('messages', 'messages.csv'),
+    ('follows', 'follows.csv'),
+    ('likes', 'likes.csv'),
+    ('directmessages', 'directmessages.csv'),
+)
+
+# Rows per executemany batch on non-Postgres databases
+INSERT_BATCH_SIZE = 5000
+
+# Bytes read from a CSV per COPY chunk
+COPY_CHUNK_SIZE = 1 << 20
+
+
+def report(table, rows, seconds):
+    rate = rows / seconds if seconds else float('inf')
+    print(f"  {table:<15} {rows:>12,} rows  {seconds:8.2f}s  "
+          f"{rate:>12,.0f} rows/s")
+
+
+##############################################################################
+# Postgres
+
+
+def deferrable_ddl(connection, tables):
+    """Return (drop, create) DDL for constraints/indexes on `tables`.
+
+    Covers foreign keys, unique constraints and indexes that don't back a
+    constraint. Primary keys stay in place.
+    """
+
+    constraints = connection.execute(text("""
+        SELECT conrelid::regclass::text, conname, contype,
+               pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype IN ('f', 'u')
+          AND conrelid::regclass::text = ANY(:tables)
+        ORDER BY contype
+    """), {"tables": list(tables)}).all()
+
+    indexes = connection.execute(text("""
+        SELECT i.tablename, i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = current_schema()
+          AND i.tablename = ANY(:tables)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c
+                          WHERE c.conname = i.indexname)
+    """), {"tables": list(tables)}).all()
+
+    # Foreign keys ('f') sort before unique constraints ('u') they may use
+    drop = ([f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'
+             for table, name, _, _ in constraints]
+            + [f'DROP INDEX "{name}"' for _, name, _ in indexes])
+
+    # Indexes first, then unique constraints, then foreign keys (which may
+    # rely on the unique constraints)
+    create = ([indexdef for _, _, indexdef in indexes]
+              + [f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'
+                 for table, name, kind, definition in reversed(constraints)])
+
+    return drop, create
+
+
+def copy_csv(table, path):
+    """Stream `path` into `table` with COPY on its own connection."""
+
+    with open(path, newline='') as f:
+        columns = next(csv.reader(f))
+        f.seek(0)
+
+        conn = db.engine.raw_connection()
+        try:
+            start = perf_counter()
+            with conn.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) "
+                    "FROM STDIN WITH (FORMAT csv, HEADER true)",
+                    f, size=COPY_CHUNK_SIZE)
+                rows = cursor.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+
+    return table, rows, perf_counter() - start
+
+
+def reset_sequences(connection, tables):
+    """Point each serial `id` sequence past the highest loaded id."""
+
+    for table in tables:
+        if 'id' in db.metadata.tables[table].c:
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"coalesce(max(id), 1), max(id) IS NOT NULL) FROM {table}"))
+
+
+def load_postgres(files, workers):
+    tables = [table for table, _ in files]
+
+    with db.engine.begin() as connection:
+        drop, create = deferrable_ddl(connection, tables)
+        for statement in drop:
+            connection.execute(text(statement))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for table, rows, seconds in pool.map(lambda f: copy_csv(*f), files):
+            report(table, rows, seconds)
+
+    start = perf_counter()
+    with db.engine.begin() as connection:
+        for statement in create:
+            connection.execute(text(statement))
+        reset_sequences(connection, tables)
+    print(f"  rebuilt {len(create)} indexes/constraints "
+          f"in {perf_counter() - start:.2f}s")
+
+    with db.engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("ANALYZE"))
+
+
+##############################################################################
+# Other databases
+
+
+def load_executemany(files):
+    for table_name, path in files:
+        table = db.metadata.tables[table_name]
+        start = perf_counter()
+        rows = 0
+
+        with open(path, newline='') as f, db.engine.begin() as connection:
+            reader = csv.DictReader(f)
+            while True:
+                batch = list(islice(reader, INSERT_BATCH_SIZE))
+                if not batch:
+                    break
+                connection.execute(table.insert(), batch)
+                rows += len(batch)
+
+        report(table_name, rows, perf_counter() - start)
+
+
+##############################################################################
+
+
+def load_all(directory='generator', workers=4):
+    """Recreate the schema and load every CSV found in `directory`."""
+
+    files = [(table, os.path.join(directory, filename))
+             for table, filename in TABLE_FILES
+             if os.path.exists(os.path.join(directory, filename))]
+
+    db.drop_all()
+    db.create_all()
+    with app.app_context():
+        # Outside `flask db`, profiles like production leave it out
+        if 'migrate' not in app.extensions:
+            init_migrations(app)
+        stamp()
+
+    start = perf_counter()
+    print(f"Loading {len(files)} files from {directory}/")
+
+    if db.engine.dialect.name == 'postgresql':
+        load_postgres(files, workers)
+    else:
+        load_executemany(files)
+
+    print("Rebuilding conversations...")
+    rebuild_conversations()
+    print("Reconciling counters...")
+    reconcile_counters()
+    print("Rebuilding timelines...")
+    rebuild_timelines()
+
+    print(f"Done in {perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Bulk-load Warbler data from CSV files.")
+    parser.add_argument('--dir', default='generator',
+                        help="directory holding the CSV files")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="tables loaded at once (Postgres only)")
+    args = parser.parse_args()
+
+    load_all(args.dir, args.workers)
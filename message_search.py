@@ -0,0 +1,363 @@
+"""Full-text message search.
+
+On Postgres, `messages.search_vector` is a stored generated column
+(`to_tsvector('english', text)`), so it is filled in on insert with no
+application code, and a GIN index on it finds matching messages. Queries
+use `websearch_to_tsquery()`, so "quoted phrases", `or` and `-excluded`
+words work as they do in web search engines.
+
+A Postgres database created before the column existed computes the
+vectors as it scans the table instead, which is slow but still costs less
+than every worker holding and reloading a copy of the messages. Other
+databases (SQLite in tests) get an in-process inverted index of words to
+message ids.
+
+Results are ranked best match first within windows of SEARCH_WINDOW
+matches: the newest window's matches come first, best first, then the
+next newest window's, and so on. So a very common word never means
+ranking millions of rows, but every match is still reachable by paging.
+Postgres finds a window by walking the primary key backwards for common
+words, or through the GIN index for rare ones, which fit in one window and
+so are ranked all together.
+"""
+
+import re
+from collections import Counter, defaultdict
+from math import log
+from threading import Lock
+from time import time
+
+from sqlalchemy import (
+    Float, cast, event, func, literal_column, select, text, tuple_)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from models import db, Message, Follows, User
+from pagination import Page, make_page
+from queries import load_authors
+
+# Text search configuration (stemming and stop words)
+SEARCH_CONFIG = 'english'
+
+# Matches ranked together (see above)
+SEARCH_WINDOW = 2000
+
+# Seconds before the in-process fallback index is reloaded from the database
+MESSAGE_INDEX_TTL = 60
+
+FULLTEXT_INDEX = 'ix_messages_search_vector'
+
+_WORD_RE = re.compile(r"\w+")
+
+
+##############################################################################
+# Database column and index
+
+
+def create_message_search_index(connection):
+    """Add the tsvector column and its GIN index on a Postgres connection.
+
+    Adding the column rewrites the messages table, so on a large existing
+    database run it (via `flask create-search-indexes`) at a quiet time.
+    Returns whether full-text search is available.
+    """
+
+    if connection.dialect.name != 'postgresql':
+        return False
+
+    connection.execute(text(
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', text)) STORED"))
+    connection.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {FULLTEXT_INDEX} "
+        "ON messages USING gin (search_vector)"))
+
+    return True
+
+
+@event.listens_for(Message.__table__, 'after_create')
+def _create_message_search_index(target, connection, **kw):
+    create_message_search_index(connection)
+
+
+def message_fallback():
+    """Are searches answered by the in-process index? Only off Postgres,
+    which searches in the database with or without the search_vector
+    column."""
+
+    return db.engine.dialect.name != 'postgresql'
+
+
+_fulltext_urls = set()
+
+
+def fulltext_enabled():
+    """Does this database have the search_vector column?
+
+    Only a yes is cached (per engine), so a worker started before the
+    column was added uses it as soon as it exists.
+    """
+
+    engine = db.engine
+    if engine.url in _fulltext_urls:
+        return True
+    if engine.dialect.name != 'postgresql':
+        return False
+
+    if db.session.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'messages' "
+            "AND column_name = 'search_vector'")).first() is None:
+        return False
+
+    _fulltext_urls.add(engine.url)
+    return True
+
+
+##############################################################################
+# In-process fallback index
+
+
+def _words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    """Word -> {message id: occurrences} postings over message text."""
+
+    def __init__(self, ttl=MESSAGE_INDEX_TTL):
+        self.ttl = ttl
+        self.loaded_at = None
+        self._postings = defaultdict(dict)
+        self._counts = {}
+        self._lock = Lock()
+
+    def _load(self):
+        self._postings = defaultdict(dict)
+        self._counts = {}
+        for message_id, message_text in db.session.execute(
+                select(Message.id, Message.text)):
+            self._add(message_id, message_text)
+        self.loaded_at = time()
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or time() - self.loaded_at > self.ttl:
+            self._load()
+
+    def _add(self, message_id, message_text):
+        counts = Counter(_words(message_text))
+        self._counts[message_id] = counts
+        for word, count in counts.items():
+            self._postings[word][message_id] = count
+
+    def _remove(self, message_id):
+        for word in self._counts.pop(message_id, ()):
+            self._postings[word].pop(message_id, None)
+
+    def add(self, message_id, message_text):
+        """Index one message, if the index is loaded."""
+
+        with self._lock:
+            if self.loaded_at is None:
+                return
+            self._remove(message_id)
+            self._add(message_id, message_text)
+
+    def remove(self, message_id):
+        with self._lock:
+            self._remove(message_id)
+
+    def search(self, term):
+        """{message id: score} for messages containing every word in `term`.
+
+        Scores are TF-IDF: repeated and rarer words count for more.
+        """
+
+        words = set(_words(term))
+        if not words:
+            return {}
+
+        with self._lock:
+            self._ensure_loaded()
+
+            postings = sorted((self._postings.get(word, {}) for word in words),
+                              key=len)
+            matches = set(postings[0]).intersection(*postings[1:])
+
+            total = len(self._counts) or 1
+            scores = dict.fromkeys(matches, 0.0)
+            for posting in postings:
+                idf = log(1 + total / len(posting)) if posting else 0
+                for message_id in matches:
+                    scores[message_id] += posting[message_id] * idf
+
+            return scores
+
+    def clear(self):
+        with self._lock:
+            self.loaded_at = None
+            self._postings = defaultdict(dict)
+            self._counts = {}
+
+
+message_index = InvertedIndex()
+
+
+def index_message(message):
+    """Keep the fallback index current after a message is posted."""
+
+    message_index.add(message.id, message.text)
+
+
+def unindex_message(message_id):
+    """Drop a deleted message from the fallback index."""
+
+    message_index.remove(message_id)
+
+
+##############################################################################
+# Queries
+
+
+def _filters(author_id, following_of):
+    # Not by accounts waiting to be purged (a handful at most)
+    filters = [Message.user_id.notin_(
+        select(User.id).where(User.deleted_at.isnot(None)))]
+    if author_id is not None:
+        filters.append(Message.user_id == author_id)
+    if following_of is not None:
+        filters.append(Message.user_id.in_(
+            select(Follows.user_being_followed_id)
+            .where(Follows.user_following_id == following_of)))
+    return filters
+
+
+def _search_postgres(term, filters, before, per_page):
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, term)
+    if fulltext_enabled():
+        vector = literal_column('messages.search_vector', type_=TSVECTOR)
+    else:
+        vector = func.to_tsvector(SEARCH_CONFIG, Message.text)
+
+    # Double precision so ranks survive the trip through a cursor exactly
+    def rank(vector):
+        return cast(func.ts_rank_cd(vector, tsquery), Float(precision=53))
+
+    match = [vector.op('@@')(tsquery), *filters]
+
+    def open_window(below, limit):
+        """The best `limit` of the newest SEARCH_WINDOW matches older than
+        `below`, with the window's id range and size."""
+
+        candidates = (
+            select(Message.id.label('id'), vector.label('vector'))
+            .where(*match)
+            .order_by(Message.id.desc())
+            .limit(SEARCH_WINDOW))
+        if below is not None:
+            candidates = candidates.where(Message.id < below)
+        candidates = candidates.subquery()
+
+        ranked = select(
+            candidates.c.id,
+            rank(candidates.c.vector).label('rank'),
+            func.max(candidates.c.id).over().label('high'),
+            func.min(candidates.c.id).over().label('low'),
+            func.count().over().label('size'),
+        ).subquery()
+
+        return (db.session.query(Message, ranked.c.rank, ranked.c.high,
+                                 ranked.c.low, ranked.c.size)
+                .join(ranked, Message.id == ranked.c.id)
+                .order_by(ranked.c.rank.desc(), ranked.c.id.desc())
+                .limit(limit)
+                .all())
+
+    def continue_window(high, low, after, limit):
+        """The next `limit` matches in a window, after the (rank, id) key."""
+
+        rank_ = rank(vector)
+        return (db.session.query(Message, rank_)
+                .filter(*match, Message.id.between(low, high),
+                        tuple_(rank_, Message.id) < tuple_(*after))
+                .order_by(rank_.desc(), Message.id.desc())
+                .limit(limit)
+                .all())
+
+    # A cursor is the window (high, low, whether older matches may remain)
+    # and the (rank, id) key of the last message shown
+    if before is not None:
+        high, low, more, *after = before
+    else:
+        high = low = after = None
+        more = True
+
+    # One row more than a page, to tell whether there's another
+    rows = []
+    while len(rows) <= per_page:
+        limit = per_page + 1 - len(rows)
+        if after is None:
+            if not more:
+                break
+            window = open_window(low, limit)
+            if not window:
+                break
+            _, _, high, low, size = window[0]
+            more = size == SEARCH_WINDOW
+            fetched = [(msg, msg_rank) for msg, msg_rank, *_ in window]
+        else:
+            fetched = continue_window(high, low, after, limit)
+
+        rows.extend((msg, (high, low, more, msg_rank, msg.id))
+                    for msg, msg_rank in fetched)
+        if len(fetched) == limit:
+            break
+        # This window is used up; go on to the older matches
+        after = None
+
+    page = make_page(rows, per_page, key=lambda row: row[1])
+    return Page([msg for msg, _ in page], page.next_cursor)
+
+
+def _search_fallback(term, filters, before, per_page):
+    scores = message_index.search(term)
+    if not scores:
+        return Page([])
+
+    matches = db.session.execute(
+        select(Message.id).where(Message.id.in_(list(scores)), *filters)
+    ).scalars().all()
+
+    ranked = sorted(((scores[id], id) for id in matches), reverse=True)
+    if before is not None:
+        ranked = [key for key in ranked if key < tuple(before)]
+
+    keys = ranked[:per_page + 1]
+    messages = {msg.id: msg for msg in
+                Message.query.filter(Message.id.in_([id for _, id in keys]))}
+
+    # Messages deleted since they were indexed are skipped
+    rows = [(score, messages[id]) for score, id in keys if id in messages]
+    page = make_page(rows, per_page, key=lambda row: (row[0], row[1].id))
+    return Page([msg for _, msg in page], page.next_cursor)
+
+
+def search_messages(term, before=None, per_page=20, author_id=None,
+                    following_of=None):
+    """Return a Page of messages matching `term`, best match first.
+
+    - author_id: only messages by this user
+    - following_of: only messages by users this user follows
+    """
+
+    term = (term or '').strip()
+    if not term:
+        return Page([])
+
+    filters = _filters(author_id, following_of)
+    if message_fallback():
+        page = _search_fallback(term, filters, before, per_page)
+    else:
+        page = _search_postgres(term, filters, before, per_page)
+
+    load_authors(page.items)
+    return page
@@ -0,0 +1,199 @@
+"""Per-request SQL and latency metrics, exported in Prometheus format.
+
+For each route this records request latency, number of SQL statements,
+time spent in the database and time spent rendering templates, and for
+each connection pool how long checkouts take, how often they wait or time
+out, and how many connections are in use. Numbers are served from
+`/metrics`.
+
+Under gunicorn each worker is a separate process, so set
+PROMETHEUS_MULTIPROC_DIR to an empty directory before the workers start
+(gunicorn.conf.py does this); every worker then writes its samples there
+and `/metrics` sums them across workers.
+"""
+
+import os
+from time import perf_counter
+
+from flask import Response, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+    Histogram, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LABELS = ('endpoint', 'method')
+
+LATENCY_BUCKETS = (
+    .005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    'warbler_request_duration_seconds',
+    'Time to handle a request, end to end.',
+    LABELS + ('status',),
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_QUERIES = Histogram(
+    'warbler_request_db_queries',
+    'SQL statements executed per request.',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+
+DB_TIME = Histogram(
+    'warbler_request_db_seconds',
+    'Time spent executing SQL per request.',
+    LABELS,
+    buckets=LATENCY_BUCKETS,
+)
+
+RENDER_TIME = Histogram(
+    'warbler_request_render_seconds',
+    'Time spent rendering templates per request.',
+    LABELS,
+    buckets=LATENCY_BUCKETS,
+)
+
+# Connection pool metrics, labelled by pool ('primary' or 'replica'); see
+# pooling.py
+
+DB_POOL_CHECKOUT = Histogram(
+    'warbler_db_pool_checkout_seconds',
+    'Time to get a connection from the pool, including any wait for one.',
+    ('pool',),
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5,
+             5, 10, 30),
+)
+
+DB_POOL_WAITS = Counter(
+    'warbler_db_pool_waits',
+    'Checkouts that found every connection in use and had to wait.',
+    ('pool',),
+)
+
+DB_POOL_TIMEOUTS = Counter(
+    'warbler_db_pool_timeouts',
+    'Checkouts that gave up waiting for a connection.',
+    ('pool',),
+)
+
+DB_POOL_IN_USE = Gauge(
+    'warbler_db_pool_connections_in_use',
+    'Connections checked out of the pool.',
+    ('pool',),
+    multiprocess_mode='livesum',
+)
+
+
+class RequestStats:
+    """Running totals for the request in progress (stored on `g`)."""
+
+    __slots__ = ('start', 'queries', 'db_time', 'render_time',
+                 'render_start')
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_start = None
+
+
+def _current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = perf_counter() - conn.info['query_start'].pop()
+
+    stats = _current_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start
+    # time so it doesn't stay on the pooled connection
+    connection = context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        stats.render_start = perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None and stats.render_start is not None:
+        stats.render_time += perf_counter() - stats.render_start
+        stats.render_start = None
+
+
+def start_request():
+    """Begin collecting stats for this request."""
+
+    g.request_stats = RequestStats()
+
+
+def finish_request(response):
+    """Record this request's stats against its route."""
+
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+
+    # Labelled by view name: `show_user`, not the blueprint's
+    # `warbler.show_user`
+    endpoint = (request.endpoint or 'unmatched').rpartition('.')[2]
+    method = request.method
+
+    REQUEST_LATENCY.labels(endpoint, method, response.status_code).observe(
+        perf_counter() - stats.start)
+    DB_QUERIES.labels(endpoint, method).observe(stats.queries)
+    DB_TIME.labels(endpoint, method).observe(stats.db_time)
+    RENDER_TIME.labels(endpoint, method).observe(stats.render_time)
+
+    return response
+
+
+def metrics_view():
+    """Serve all metrics in the Prometheus text format."""
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """Install the SQL, template and request hooks and `/metrics`."""
+
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,93 @@
+"""Steps shared by the revisions in versions/.
+
+Every revision after 0001 has to cope with two kinds of Postgres database:
+
+- One made by `db.create_all()` and stamped at 0001 already has whatever
+  the revision adds, so each step here skips what exists (IF NOT EXISTS).
+- A live one keeps taking writes while an index builds, because indexes
+  are built CONCURRENTLY. That can't happen inside a transaction, so they
+  are built in autocommit mode, and an index left INVALID by an
+  interrupted build is dropped and built again.
+
+Other databases (SQLite in development) get the plain Alembic operations.
+
+Like the revisions, this doesn't import the app: a revision has to keep
+doing what it did when it was written.
+"""
+
+from collections import namedtuple
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn
+
+# `columns` are column names, or on Postgres any index expressions (with
+# an operator class); `using` is the index method, e.g. 'gin'
+Index = namedtuple('Index', 'name table columns where using',
+                   defaults=(None, None))
+
+
+def is_postgres():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def create_table(name, *columns):
+    """op.create_table(), unless the table exists."""
+
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns)
+
+
+def add_columns(table, *columns):
+    """Add `columns` to `table`, skipping any it has."""
+
+    if not is_postgres():
+        for column in columns:
+            op.add_column(table, column)
+        return
+
+    dialect = op.get_bind().dialect
+    sa.Table(table, sa.MetaData(), *columns)
+    op.execute(f"ALTER TABLE {table} " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS "
+        f"{CreateColumn(column).compile(dialect=dialect)}"
+        for column in columns))
+
+
+def create_indexes(indexes):
+    """Build `indexes` (Index tuples), CONCURRENTLY on Postgres."""
+
+    if not is_postgres():
+        for index in indexes:
+            op.create_index(index.name, index.table, index.columns)
+        return
+
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        for index in indexes:
+            invalid = bind.execute(sa.text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"),
+                {"name": index.name}).first()
+            if invalid:
+                op.execute(f"DROP INDEX CONCURRENTLY {index.name}")
+
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} "
+                f"ON {index.table}"
+                + (f" USING {index.using}" if index.using else "")
+                + f" ({', '.join(index.columns)})"
+                + (f" WHERE {index.where}" if index.where else ""))
+
+
+def drop_indexes(indexes):
+    """Drop `indexes`, in reverse order, CONCURRENTLY on Postgres."""
+
+    if not is_postgres():
+        for index in reversed(indexes):
+            op.drop_index(index.name, table_name=index.table)
+        return
+
+    with op.get_context().autocommit_block():
+        for index in reversed(indexes):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}")
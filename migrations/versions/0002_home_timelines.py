@@ -0,0 +1,39 @@
+"""home timelines
+
+`timeline_entries`, the materialized home timelines (see timeline.py).
+Fill it with `flask rebuild-timelines` after upgrading; its indexes are
+added in 0006.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 02:34:08.417529
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import create_table
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('message_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('user_id', 'message_id')
+    )
+
+
+def downgrade():
+    op.drop_table('timeline_entries')
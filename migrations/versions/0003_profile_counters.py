@@ -0,0 +1,36 @@
+"""profile counters
+
+The denormalized message, follower, following and like counts on `users`
+(see counters.py). They start at 0; run `flask reconcile-counters` after
+upgrading.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 02:35:47.902316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_columns
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['messages_count', 'followers_count', 'following_count',
+           'likes_count']
+
+
+def upgrade():
+    add_columns('users', *(
+        sa.Column(name, sa.Integer(), server_default='0', nullable=False)
+        for name in COLUMNS))
+
+
+def downgrade():
+    for name in reversed(COLUMNS):
+        op.drop_column('users', name)
@@ -0,0 +1,31 @@
+"""profile updated_at
+
+`users.updated_at`, bumped by every update of the row, which user pages
+put in their ETags (see caching.py).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 02:37:15.260843
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_columns
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_columns('users', sa.Column(
+        'updated_at', sa.DateTime(), server_default=sa.text('now()'),
+        nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'updated_at')
@@ -0,0 +1,45 @@
+"""direct message inbox
+
+`conversations`, each user's list of direct-message threads, and
+`users.unread_count` (see direct_messages.py). Fill them with
+`flask rebuild-conversations` after upgrading; the indexes are added in
+0006.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 02:39:02.684170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_columns, create_table
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_columns('users', sa.Column(
+        'unread_count', sa.Integer(), server_default='0', nullable=False))
+
+    create_table('conversations',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('other_user_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=False),
+    sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['last_message_id'], ['directmessages.id'], ondelete='set null'),
+    sa.ForeignKeyConstraint(['other_user_id'], ['users.id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('user_id', 'other_user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('conversations')
+    op.drop_column('users', 'unread_count')
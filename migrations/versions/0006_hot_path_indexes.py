@@ -0,0 +1,48 @@
+"""hot path indexes
+
+Indexes for the queries behind every page: profiles and search filters
+(messages by author), likes of a message, who a user follows, the home
+timeline and its celebrity authors, and direct messages and conversations.
+
+On Postgres they are built CONCURRENTLY (see migrations/helpers.py).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 02:41:12.512044
+
+"""
+from migrations.helpers import Index, create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    Index('ix_messages_user_id_timestamp', 'messages',
+          ['user_id', 'timestamp', 'id']),
+    Index('ix_likes_message_id', 'likes', ['message_id', 'user_id']),
+    Index('ix_follows_user_following_id', 'follows',
+          ['user_following_id', 'user_being_followed_id']),
+    Index('ix_timeline_entries_user_id_timestamp', 'timeline_entries',
+          ['user_id', 'timestamp', 'message_id']),
+    Index('ix_timeline_entries_message_id', 'timeline_entries',
+          ['message_id']),
+    Index('ix_users_followers_count', 'users', ['followers_count']),
+    Index('ix_directmessages_user_id_to_timestamp', 'directmessages',
+          ['user_id_to', 'timestamp', 'id']),
+    Index('ix_directmessages_from_to_timestamp', 'directmessages',
+          ['user_id_from', 'user_id_to', 'timestamp', 'id']),
+    Index('ix_conversations_user_id_last_message_at', 'conversations',
+          ['user_id', 'last_message_at', 'other_user_id']),
+]
+
+
+def upgrade():
+    create_indexes(INDEXES)
+
+
+def downgrade():
+    drop_indexes(INDEXES)
@@ -0,0 +1,63 @@
+"""search indexes
+
+Username search indexes and the message full-text column and index, as
+`flask create-search-indexes` makes them (see search.py and
+message_search.py). The DDL is copied here so this revision doesn't
+change when those modules do.
+
+Adding the column rewrites the messages table, so on a large database run
+this at a quiet time. The indexes are built CONCURRENTLY (see
+migrations/helpers.py). The trigram index needs the pg_trgm extension; if
+it can't be created that index is skipped, and username substring
+searches scan the table.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 02:44:37.190853
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from migrations.helpers import (
+    Index, add_columns, create_indexes, drop_indexes, is_postgres)
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+PREFIX_INDEX = Index('ix_users_username_lower_pattern', 'users',
+                     ['lower(username) text_pattern_ops'])
+FULLTEXT_INDEX = Index('ix_messages_search_vector', 'messages',
+                       ['search_vector'], using='gin')
+TRIGRAM_INDEX = Index('ix_users_username_trgm', 'users',
+                      ['lower(username) gin_trgm_ops'], using='gin')
+
+
+def upgrade():
+    if not is_postgres():
+        return
+
+    add_columns('messages', sa.Column(
+        'search_vector', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', text)", persisted=True)))
+    create_indexes([PREFIX_INDEX, FULLTEXT_INDEX])
+
+    try:
+        with op.get_context().autocommit_block():
+            op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        create_indexes([TRIGRAM_INDEX])
+    except sa.exc.DBAPIError:
+        pass
+
+
+def downgrade():
+    if not is_postgres():
+        return
+
+    drop_indexes([PREFIX_INDEX, TRIGRAM_INDEX, FULLTEXT_INDEX])
+    op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,44 @@
+"""account purge
+
+`users.deleted_at`, set on large accounts waiting for `flask purge-users`,
+and the indexes Postgres' ON DELETE cascades need to find a deleted user's
+(or direct message's) rows without reading whole tables. The indexes are
+built CONCURRENTLY (see migrations/helpers.py).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 04:12:51.803217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import Index, add_columns, create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    Index('ix_users_deleted_at', 'users', ['deleted_at'],
+          where='deleted_at IS NOT NULL'),
+    Index('ix_timeline_entries_author_id', 'timeline_entries',
+          ['author_id']),
+    Index('ix_conversations_other_user_id', 'conversations',
+          ['other_user_id']),
+    Index('ix_conversations_last_message_id', 'conversations',
+          ['last_message_id']),
+]
+
+
+def upgrade():
+    add_columns('users', sa.Column('deleted_at', sa.DateTime()))
+    create_indexes(INDEXES)
+
+
+def downgrade():
+    drop_indexes(INDEXES)
+    op.drop_column('users', 'deleted_at')
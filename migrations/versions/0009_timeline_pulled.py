@@ -0,0 +1,50 @@
+"""timeline pulled
+
+`users.timeline_pulled`, set on authors whose messages stopped being fanned
+out, so they stay pulled at read time after losing followers (see
+timeline.py), and a partial index on it for the home page's lookup of
+followed authors to pull. Authors already over the threshold are marked.
+The index is built CONCURRENTLY (see migrations/helpers.py).
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 09:40:12.511302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import Index, add_columns, create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+# timeline.CELEBRITY_FOLLOWER_THRESHOLD when this was written
+CELEBRITY_FOLLOWER_THRESHOLD = 10000
+
+INDEXES = [
+    Index('ix_users_timeline_pulled', 'users', ['timeline_pulled'],
+          where='timeline_pulled'),
+]
+
+
+def upgrade():
+    add_columns('users', sa.Column(
+        'timeline_pulled', sa.Boolean(), nullable=False,
+        server_default=sa.false()))
+
+    op.execute(sa.text(
+        "UPDATE users SET timeline_pulled = true "
+        "WHERE followers_count >= :threshold"
+    ).bindparams(threshold=CELEBRITY_FOLLOWER_THRESHOLD))
+
+    create_indexes(INDEXES)
+
+
+def downgrade():
+    drop_indexes(INDEXES)
+    op.drop_column('users', 'timeline_pulled')
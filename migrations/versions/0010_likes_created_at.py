@@ -0,0 +1,42 @@
+"""likes created_at
+
+`likes.created_at`, and an index on (user_id, created_at, message_id) that
+pages of a user's liked messages walk, most recent like first (see
+queries.py). The index is built CONCURRENTLY (see migrations/helpers.py).
+
+Existing likes all get the time of the upgrade, so among them pages fall
+back to message id order, newest message first, as before.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 14:21:09.663410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import Index, add_columns, create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    Index('ix_likes_user_id_created_at', 'likes',
+          ['user_id', 'created_at', 'message_id']),
+]
+
+
+def upgrade():
+    add_columns('likes', sa.Column(
+        'created_at', sa.DateTime(), server_default=sa.text('now()'),
+        nullable=False))
+    create_indexes(INDEXES)
+
+
+def downgrade():
+    drop_indexes(INDEXES)
+    op.drop_column('likes', 'created_at')
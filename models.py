@@ -2,11 +2,11 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from passwords import hash_password, check_password, needs_rehash
+from pooling import engine_options
+from routing import RoutingSQLAlchemy
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 DEFAULT_IMAGE_URL = "/static/images/default-pic.png"
 DEFAULT_HEADER_IMAGE_URL = "/static/images/warbler-hero.jpg"
@@ -17,6 +17,13 @@ class Follows(db.Model):
 
     __tablename__ = 'follows'
 
+    # The primary key leads with the followed user; this serves "who does
+    # this user follow" (and cascades when a follower is deleted)
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
     user_being_followed_id = db.Column(
         db.Integer,
         db.ForeignKey('users.id', ondelete="cascade"),
@@ -34,6 +41,14 @@ class DirectMessage(db.Model):
 
     __tablename__ = 'directmessages'
 
+    # Received messages by time, and each direction of a conversation by time
+    __table_args__ = (
+        db.Index('ix_directmessages_user_id_to_timestamp',
+                 'user_id_to', 'timestamp', 'id'),
+        db.Index('ix_directmessages_from_to_timestamp',
+                 'user_id_from', 'user_id_to', 'timestamp', 'id'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -68,11 +83,75 @@ class DirectMessage(db.Model):
     )
 
 
+class Conversation(db.Model):
+    """One user's view of their direct messages with another user.
+
+    Each pair of users who have exchanged messages has two rows, one per
+    participant, so a user's inbox is a range read on (user_id,
+    last_message_at). Kept current by direct_messages.py.
+    """
+
+    __tablename__ = 'conversations'
+
+    __table_args__ = (
+        db.Index('ix_conversations_user_id_last_message_at',
+                 'user_id', 'last_message_at', 'other_user_id'),
+        # For the cascades when a user or direct message is deleted
+        db.Index('ix_conversations_other_user_id', 'other_user_id'),
+        db.Index('ix_conversations_last_message_id', 'last_message_id'),
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    other_user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    last_message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('directmessages.id', ondelete="set null"),
+    )
+
+    last_message_at = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    # Messages from other_user that user_id hasn't opened the thread for
+    unread_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    other_user = db.relationship('User', foreign_keys=[other_user_id])
+
+    last_message = db.relationship('DirectMessage')
+
+
 class User(db.Model):
     """User in the system."""
 
     __tablename__ = 'users'
 
+    __table_args__ = (
+        # Finds the celebrity authors (see timeline.py) a home page merges in
+        db.Index('ix_users_followers_count', 'followers_count'),
+        # Accounts waiting to be purged (see purge.py)
+        db.Index('ix_users_deleted_at', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL')),
+        # Authors whose messages stay pulled after losing followers
+        db.Index('ix_users_timeline_pulled', 'timeline_pulled',
+                 postgresql_where=db.text('timeline_pulled')),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -114,14 +193,84 @@ class User(db.Model):
         nullable=False,
     )
 
-    messages = db.relationship('Message', backref="user")
+    # Bumped by every UPDATE of the row, counters included, so it changes
+    # whenever the user's profile page does (see caching.py)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=db.func.now(),
+    )
+
+    # Set when a large account is deleted; it's hidden from then on and
+    # removed in the background by `flask purge-users` (see purge.py)
+    deleted_at = db.Column(
+        db.DateTime,
+    )
+
+    # Set once the user's messages stop being fanned out to followers'
+    # timelines; they're pulled at read time until `rebuild_timelines()`
+    # finds the user back under the threshold (see timeline.py)
+    timeline_pulled = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+        server_default=db.false(),
+    )
+
+    # Denormalized counts, kept current by the write paths (see counters.py)
+
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    # Sum of unread_count over the user's conversations
+    unread_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    # Every foreign key to users and messages is ON DELETE CASCADE, so
+    # deleting a user or message leaves the related rows to Postgres
+    # instead of loading them to delete one by one (passive_deletes)
+
+    messages = db.relationship(
+        'Message', backref="user", passive_deletes='all')
 
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_being_followed_id == id),
         secondaryjoin=(Follows.user_following_id == id),
-        backref="following",
+        backref=db.backref("following", passive_deletes=True),
+        passive_deletes=True,
     )
 
     sent_to = db.relationship(
@@ -129,10 +278,16 @@ class User(db.Model):
         secondary="directmessages",
         primaryjoin=(DirectMessage.user_id_to == id),
         secondaryjoin=(DirectMessage.user_id_from == id),
-        backref="sent_from",
+        backref=db.backref("sent_from", passive_deletes=True),
+        passive_deletes=True,
     )
 
-    liked_messages = db.relationship("Message", secondary="likes", backref="users_liked")
+    liked_messages = db.relationship(
+        "Message",
+        secondary="likes",
+        backref=db.backref("users_liked", passive_deletes=True),
+        passive_deletes=True,
+    )
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
@@ -144,7 +299,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hash_password(password)
 
         user = User(
             username=username,
@@ -166,13 +321,18 @@ class User(db.Model):
 
         If this can't find matching user (or if password is wrong), returns
         False.
+
+        A password hashed at an old cost factor is re-hashed at the current
+        one; the caller's next commit saves it.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.query.filter_by(username=username, deleted_at=None).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = check_password(user.password, password)
             if is_auth:
+                if needs_rehash(user.password):
+                    user.password = hash_password(password)
                 return user
 
         return False
@@ -180,16 +340,22 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [
-            user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return db.session.query(
+            Follows.query.filter_by(
+                user_being_followed_id=self.id,
+                user_following_id=other_user.id,
+            ).exists()
+        ).scalar()
 
     def is_following(self, other_user):
         """Is this user following `other_use`?"""
 
-        found_user_list = [
-            user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return db.session.query(
+            Follows.query.filter_by(
+                user_being_followed_id=other_user.id,
+                user_following_id=self.id,
+            ).exists()
+        ).scalar()
 
 
 class Message(db.Model):
@@ -197,6 +363,12 @@ class Message(db.Model):
 
     __tablename__ = 'messages'
 
+    # Serves profile pages and the author/following filters of search
+    __table_args__ = (
+        db.Index('ix_messages_user_id_timestamp',
+                 'user_id', 'timestamp', 'id'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -225,6 +397,14 @@ class Like(db.Model):
 
     __tablename__ = 'likes'
 
+    __table_args__ = (
+        # Who liked a message; also used when a message is deleted
+        db.Index('ix_likes_message_id', 'message_id', 'user_id'),
+        # A user's likes, most recent first, for their liked messages page
+        db.Index('ix_likes_user_id_created_at',
+                 'user_id', 'created_at', 'message_id'),
+    )
+
     user_id = db.Column(
         db.Integer,
         db.ForeignKey('users.id', ondelete="cascade"),
@@ -235,8 +415,50 @@ class Like(db.Model):
         db.ForeignKey('messages.id', ondelete="cascade"),
                      primary_key=True)
 
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        server_default=db.func.now(),
+    )
 
 
+class TimelineEntry(db.Model):
+    """A message delivered to a follower's home timeline."""
+
+    __tablename__ = 'timeline_entries'
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_id_timestamp',
+                 'user_id', 'timestamp', 'message_id'),
+        # Deleting a message removes its entries from every timeline
+        db.Index('ix_timeline_entries_message_id', 'message_id'),
+        # ... and deleting a user removes their messages' entries
+        db.Index('ix_timeline_entries_author_id', 'author_id'),
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
 
 
 def connect_db(app):
@@ -245,5 +467,8 @@ def connect_db(app):
     You should call this in your Flask app.
     """
 
+    app.config.setdefault(
+        'SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config, 'primary'))
+
     db.app = app
     db.init_app(app)
@@ -0,0 +1,144 @@
+"""Keyset (cursor) pagination for Warbler listings.
+
+Pages are read with `WHERE (sort columns) < (cursor values)` rather than
+OFFSET, so fetching page 500 costs the same as fetching page 1. Cursors
+are opaque, URL-safe strings encoding the sort key of the last row shown.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import abort, request
+from sqlalchemy import tuple_
+
+
+class Page:
+    """One page of results plus the cursor for the page after it."""
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(values):
+    """Encode a tuple of sort-key `values` as an opaque cursor string."""
+
+    raw = json.dumps([_encode_value(v) for v in values],
+                     separators=(',', ':'))
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor string back into a tuple of sort-key values.
+
+    Raises ValueError if the cursor is malformed.
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(urlsafe_b64decode(padded.encode()))
+        return tuple(_decode_value(v) for v in values)
+    except (TypeError, KeyError, ValueError, UnicodeDecodeError) as err:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from err
+
+
+def cursor_arg(name='before'):
+    """Return the decoded cursor from the query string, or None.
+
+    A malformed cursor is a client error and aborts with 400.
+    """
+
+    cursor = request.args.get(name)
+    if not cursor:
+        return None
+
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        abort(400)
+
+
+def make_page(rows, per_page, key):
+    """Build a Page from up to `per_page + 1` fetched `rows`.
+
+    The extra row only signals that another page exists; `key(row)` gives
+    the sort-key tuple used for the next cursor.
+    """
+
+    items = rows[:per_page]
+    if len(rows) > per_page and items:
+        return Page(items, encode_cursor(key(items[-1])))
+    return Page(items)
+
+
+def paginate(query, columns, before=None, per_page=20, descending=True,
+             key=None, load=None):
+    """Return one Page of `query` ordered by `columns`.
+
+    - columns: the sort key, e.g. (Message.timestamp, Message.id); the last
+      column must be unique so the key is a total order
+    - before: decoded cursor values from the previous page, if any
+    - descending: newest-first (default) or ascending order
+    - key: maps a result row to its sort-key tuple; defaults to reading the
+      column attributes off the row
+    - load: runs the ordered and limited query, returning a list of rows;
+      defaults to `query.all()`. A Core select() needs one, e.g. from
+      projections.py
+    """
+
+    if before is not None:
+        row_key = tuple_(*columns)
+        cursor = tuple_(*before)
+        query = query.filter(row_key < cursor if descending
+                             else row_key > cursor)
+
+    ordering = [c.desc() if descending else c.asc() for c in columns]
+    query = query.order_by(*ordering).limit(per_page + 1)
+    rows = load(query) if load is not None else query.all()
+
+    if key is None:
+        names = [c.key for c in columns]
+        key = lambda row: tuple(getattr(row, n) for n in names)
+
+    return make_page(rows, per_page, key)
+
+
+def next_page_url(page, name='before'):
+    """URL for the page after `page` on the current route, or None.
+
+    The current path and query string with `name` set to the next cursor;
+    query arguments are passed through as they are, never to `url_for()`,
+    whose own keywords (`endpoint`, `_external`...) they could collide with.
+    """
+
+    if not page.has_next:
+        return None
+
+    args = request.args.copy()
+    args[name] = page.next_cursor
+    return (request.script_root + request.path + '?'
+            + urlencode(list(args.items(multi=True))))
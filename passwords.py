@@ -0,0 +1,125 @@
+"""Password hashing and checking.
+
+bcrypt is deliberately slow (hundreds of ms of CPU at cost 12), so calls
+are handed to a bounded pool of worker processes rather than run on the
+request thread. The pool size caps how many cores hashing can take at once,
+leaving the rest for serving pages; with threaded gunicorn workers other
+requests keep being served while a login waits on the pool.
+
+Config (read by `init_passwords()`):
+
+- BCRYPT_LOG_ROUNDS: cost factor for new hashes (default 12). Changing it
+  makes `needs_rehash()` true for older hashes, and `User.authenticate()`
+  upgrades them at the next successful login.
+- BCRYPT_POOL_SIZE: hashing processes per app worker (default: CPU count).
+  0 hashes inline on the calling thread. Every gunicorn worker starts its
+  own pool, so a box can run workers x BCRYPT_POOL_SIZE of them, and by
+  default workers x cores; with several workers set it to about
+  cores / workers.
+
+The pool's processes are started by a fork server (or spawned where there
+is none), not forked from the worker: a copy of a threaded worker could
+inherit a lock another thread held, or its database connections.
+
+This module is imported by the pool's processes, so it must not import the
+app or models.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+import bcrypt
+
+DEFAULT_LOG_ROUNDS = 12
+
+log_rounds = DEFAULT_LOG_ROUNDS
+pool_size = os.cpu_count() or 1
+
+_pool = None
+_pool_pid = None
+_pool_lock = Lock()
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def _mp_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _get_pool():
+    """The hashing pool for this process, started on first use.
+
+    Starting lazily (and again after a fork) means a gunicorn master that
+    preloads the app never owns the pool; each worker gets its own.
+    """
+
+    global _pool, _pool_pid
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=pool_size, mp_context=_mp_context())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(fn, *args):
+    if pool_size == 0:
+        return fn(*args)
+    return _get_pool().submit(fn, *args).result()
+
+
+def hash_password(password):
+    """Return a bcrypt hash of `password` at the configured cost."""
+
+    return _run(_hash, password, log_rounds)
+
+
+def check_password(hashed, password):
+    """Does `password` match the bcrypt `hashed` value?"""
+
+    return _run(_check, hashed, password)
+
+
+def hash_rounds(hashed):
+    """Cost factor a bcrypt hash was made with, e.g. 12 for '$2b$12$...'."""
+
+    return int(hashed.split('$')[2])
+
+
+def needs_rehash(hashed):
+    """Was `hashed` made at a different cost than the configured one?"""
+
+    return hash_rounds(hashed) != log_rounds
+
+
+def configure(rounds=DEFAULT_LOG_ROUNDS, size=None):
+    """Set the cost factor and pool size, replacing any running pool."""
+
+    global log_rounds, pool_size, _pool
+
+    log_rounds = rounds
+    if size is not None and size != pool_size:
+        pool_size = size
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+                _pool = None
+
+
+def init_passwords(app):
+    """Configure hashing from the app's BCRYPT_* settings."""
+
+    configure(rounds=app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS),
+              size=app.config.get('BCRYPT_POOL_SIZE'))
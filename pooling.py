@@ -0,0 +1,126 @@
+"""Database connection pools.
+
+Every gunicorn worker process keeps its own pool for each database, so
+Warbler can open up to
+
+    workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+connections to each one; keep that under Postgres' `max_connections`, less
+what other clients need. A worker serves GUNICORN_THREADS requests at once,
+so a pool as big as that never makes a request wait. The pool settings are
+read from the environment:
+
+- DB_POOL_SIZE: connections kept open (SQLAlchemy's default is 5)
+- DB_MAX_OVERFLOW: extra connections opened under load and closed after (10)
+- DB_POOL_TIMEOUT: seconds to wait for a free connection before failing (30)
+- DB_POOL_RECYCLE: seconds after which a connection is replaced (never)
+- DB_POOL_PRE_PING: check each connection still works before using it
+
+With DB_PGBOUNCER set, `DATABASE_URL` points at pgbouncer in transaction
+pooling mode, which hands each transaction whichever server connection is
+free. pgbouncer then does the pooling, so workers open and close client
+connections to it as needed (NullPool) and the settings above don't apply.
+Nothing may rely on state that outlives a transaction: psycopg2 never uses
+server-side prepared statements, and Warbler doesn't SET session variables,
+LISTEN or take session advisory locks.
+
+A pool must not be shared across a fork: parent and child would both talk
+over the same sockets. With gunicorn's --preload the app is created in the
+master, so gunicorn.conf.py calls `dispose_engines()` in each new worker.
+
+Pools record how long checkouts take, how often they wait or time out, and
+how many connections are in use (see metrics.py).
+"""
+
+from time import perf_counter
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from metrics import (
+    DB_POOL_CHECKOUT, DB_POOL_IN_USE, DB_POOL_TIMEOUTS, DB_POOL_WAITS)
+
+# Environment variable -> (create_engine() argument, parser)
+POOL_SETTINGS = {
+    'DB_POOL_SIZE': ('pool_size', int),
+    'DB_MAX_OVERFLOW': ('max_overflow', int),
+    'DB_POOL_TIMEOUT': ('pool_timeout', float),
+    'DB_POOL_RECYCLE': ('pool_recycle', int),
+    'DB_POOL_PRE_PING': ('pool_pre_ping', lambda value: value == '1'),
+}
+
+
+class MeteredPool:
+    """Records checkouts of the pool it's mixed into, labelled with the
+    pool's logging name."""
+
+    def _must_wait(self):
+        return False
+
+    def connect(self):
+        name = self.logging_name or 'default'
+        if self._must_wait():
+            DB_POOL_WAITS.labels(name).inc()
+
+        start = perf_counter()
+        try:
+            connection = super().connect()
+        except TimeoutError:
+            DB_POOL_TIMEOUTS.labels(name).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT.labels(name).observe(perf_counter() - start)
+
+        DB_POOL_IN_USE.labels(name).inc()
+        return connection
+
+    def _return_conn(self, record):
+        DB_POOL_IN_USE.labels(self.logging_name or 'default').dec()
+        super()._return_conn(record)
+
+
+class MeteredQueuePool(MeteredPool, QueuePool):
+    def _must_wait(self):
+        # Nothing idle, and no room to open another connection
+        return (self._pool.empty()
+                and 0 <= self._max_overflow <= self._overflow)
+
+
+class MeteredNullPool(MeteredPool, NullPool):
+    pass
+
+
+def pool_config(environ):
+    """The pool settings given in `environ`, as app config."""
+
+    config = {name: parse(environ[name])
+              for name, (_, parse) in POOL_SETTINGS.items()
+              if name in environ}
+    config['DB_PGBOUNCER'] = environ.get('DB_PGBOUNCER') == '1'
+    return config
+
+
+def engine_options(config, name):
+    """create_engine() arguments for the pool called `name`."""
+
+    if config.get('DB_PGBOUNCER'):
+        return {'poolclass': MeteredNullPool, 'pool_logging_name': name}
+
+    options = {'poolclass': MeteredQueuePool, 'pool_logging_name': name}
+    for setting, (argument, _) in POOL_SETTINGS.items():
+        if setting in config:
+            options[argument] = config[setting]
+    return options
+
+
+def dispose_engines(app):
+    """Give a forked process empty pools for all of `app`'s databases.
+
+    Connections inherited from the parent are left for the parent to use
+    and close (`dispose(close=False)`).
+    """
+
+    engines = [app.extensions['sqlalchemy'].db.get_engine(app),
+               *app.extensions['replicas']]
+    for engine in engines:
+        engine.dispose(close=False)
@@ -0,0 +1,87 @@
+"""Read-only rows for listing pages.
+
+Listing pages read a few columns of each message or user and change none
+of them, yet an ORM object costs far more than its columns: per row, an
+instrumented instance with its own state for change tracking and lazy
+loading, kept in the session's identity map until the request ends. For
+these pages a Core `select()` reads just the columns they render, into
+plain named tuples:
+
+- MessageRow: what a message card and its like button show, with an
+  AuthorRow shared by all of an author's messages on the page;
+- UserRow: what a user card and its follow button show, plus the columns
+  `user_stamp()` puts in the page's ETag (see caching.py).
+
+Rows have no relationships and nothing to save; a route that changes
+something loads the model. Neither select shows accounts marked deleted,
+whose rows stay until `flask purge-users` gets to them (see purge.py).
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from models import db, User, Message
+
+AuthorRow = namedtuple('AuthorRow', 'id username image_url')
+
+MessageRow = namedtuple('MessageRow', 'id text timestamp user_id user')
+
+UserRow = namedtuple('UserRow', [
+    'id', 'username', 'image_url', 'header_image_url', 'bio', 'updated_at',
+    'messages_count', 'followers_count', 'following_count', 'likes_count',
+])
+
+MESSAGE_COLUMNS = (
+    Message.id, Message.text, Message.timestamp, Message.user_id,
+    User.username, User.image_url,
+)
+
+USER_COLUMNS = tuple(getattr(User, name) for name in UserRow._fields)
+
+
+def select_messages():
+    """select() of MESSAGE_COLUMNS, for `message_rows()`. Leaves out
+    messages by accounts waiting to be purged."""
+
+    return (select(*MESSAGE_COLUMNS)
+            .join(User, User.id == Message.user_id)
+            .where(User.deleted_at.is_(None)))
+
+
+def message_rows(rows):
+    """MessageRows from rows of MESSAGE_COLUMNS."""
+
+    authors = {}
+    messages = []
+    for id, text, timestamp, user_id, username, image_url in rows:
+        author = authors.get(user_id)
+        if author is None:
+            author = authors[user_id] = AuthorRow(user_id, username, image_url)
+        messages.append(MessageRow(id, text, timestamp, user_id, author))
+    return messages
+
+
+def load_messages(query):
+    """Run a `select_messages()` query; returns a list of MessageRows."""
+
+    return message_rows(db.session.execute(query))
+
+
+def select_users():
+    """select() of USER_COLUMNS, for `user_rows()`. Leaves out accounts
+    waiting to be purged."""
+
+    return select(*USER_COLUMNS).where(User.deleted_at.is_(None))
+
+
+def user_rows(rows):
+    """UserRows from rows of USER_COLUMNS."""
+
+    return [UserRow._make(row) for row in rows]
+
+
+def load_users(query):
+    """Run a `select_users()` query; returns a list of UserRows."""
+
+    return user_rows(db.session.execute(query))
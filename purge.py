@@ -0,0 +1,286 @@
+"""Deleting user accounts.
+
+Every foreign key to `users` and `messages` is ON DELETE CASCADE and the
+relationships leave deletes to the database (see models.py), so deleting a
+user is one DELETE: Postgres removes their messages, likes, follows, direct
+messages, conversations and timeline entries. `delete_account()` does that
+straight away, after taking the user out of everyone else's counters.
+
+One DELETE of an account with years of history still removes millions of
+rows in one long transaction, though. So an account with more than
+PURGE_INLINE_LIMIT related rows is only marked deleted (`deleted_at`), which
+hides it at once: it can't log in, its profile is gone and it doesn't show
+up in searches. `flask purge-users` then deletes its rows PURGE_BATCH_SIZE at
+a time, committing each batch together with the counter changes it causes,
+and deletes the user once little is left.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import case, delete, func, select, tuple_, update
+
+from counters import adjust_many, release_user
+from models import (
+    db, User, Message, Follows, Like, DirectMessage, Conversation,
+    TimelineEntry)
+
+# Accounts with more related rows than this are purged in the background
+PURGE_INLINE_LIMIT = 10000
+
+# Rows deleted per transaction by `purge_user()`
+PURGE_BATCH_SIZE = 1000
+
+
+def account_size(user):
+    """Roughly how many rows deleting `user` removes, counted only until
+    it's over PURGE_INLINE_LIMIT."""
+
+    size = (user.messages_count + user.followers_count
+            + user.following_count + user.likes_count)
+    if size > PURGE_INLINE_LIMIT:
+        return size
+
+    # Every follower's copy of their messages goes too
+    copies = select(TimelineEntry.user_id).where(
+        TimelineEntry.author_id == user.id).limit(PURGE_INLINE_LIMIT + 1)
+    return size + db.session.execute(
+        select(func.count()).select_from(copies.subquery())).scalar()
+
+
+def delete_account(user):
+    """Delete `user` now if that's cheap, else mark them for purging.
+
+    Returns whether they were deleted. The caller commits.
+    """
+
+    if account_size(user) > PURGE_INLINE_LIMIT:
+        user.deleted_at = datetime.utcnow()
+        return False
+
+    release_user(user.id)
+    db.session.delete(user)
+    return True
+
+
+def _subtract(counter, user_ids):
+    """Subtract from `counter` for each occurrence of a user in `user_ids`."""
+
+    by_delta = {}
+    for user_id, n in Counter(user_ids).items():
+        by_delta.setdefault(n, []).append(user_id)
+
+    for n, ids in by_delta.items():
+        adjust_many(ids, **{counter: -n})
+
+
+def _purge_following(user_id, limit):
+    """Users they follow lose a follower."""
+
+    followed = select(Follows.user_being_followed_id).where(
+        Follows.user_following_id == user_id).limit(limit)
+
+    removed = db.session.execute(
+        delete(Follows)
+        .where(Follows.user_following_id == user_id,
+               Follows.user_being_followed_id.in_(followed))
+        .returning(Follows.user_being_followed_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    _subtract('followers_count', removed)
+    return len(removed)
+
+
+def _purge_followers(user_id, limit):
+    """Their followers lose a followed user."""
+
+    followers = select(Follows.user_following_id).where(
+        Follows.user_being_followed_id == user_id).limit(limit)
+
+    removed = db.session.execute(
+        delete(Follows)
+        .where(Follows.user_being_followed_id == user_id,
+               Follows.user_following_id.in_(followers))
+        .returning(Follows.user_following_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    _subtract('following_count', removed)
+    return len(removed)
+
+
+def _purge_likes(user_id, limit):
+    liked = select(Like.message_id).where(Like.user_id == user_id).limit(limit)
+
+    return db.session.execute(
+        delete(Like)
+        .where(Like.user_id == user_id, Like.message_id.in_(liked))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _purge_timeline_copies(user_id, limit):
+    """Followers' timeline entries for their messages, which would
+    otherwise all go in the messages' delete cascades."""
+
+    entries = select(TimelineEntry.user_id, TimelineEntry.message_id).where(
+        TimelineEntry.author_id == user_id).limit(limit)
+
+    return db.session.execute(
+        delete(TimelineEntry)
+        .where(tuple_(TimelineEntry.user_id, TimelineEntry.message_id)
+               .in_(entries))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _purge_messages(user_id, limit):
+    """Whoever liked their messages loses those likes; the messages'
+    timeline entries go with them."""
+
+    # Locked, so nobody can like them between counting likes and deleting
+    message_ids = db.session.execute(
+        select(Message.id)
+        .where(Message.user_id == user_id)
+        .limit(limit)
+        .with_for_update()
+    ).scalars().all()
+    if not message_ids:
+        return 0
+
+    likers = db.session.execute(
+        delete(Like)
+        .where(Like.message_id.in_(message_ids))
+        .returning(Like.user_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    _subtract('likes_count', likers)
+
+    db.session.execute(
+        delete(Message)
+        .where(Message.id.in_(message_ids))
+        .execution_options(synchronize_session=False)
+    )
+    return len(message_ids)
+
+
+def _purge_conversations(user_id, limit):
+    """Users with unread messages from them lose those."""
+
+    others = select(Conversation.user_id).where(
+        Conversation.other_user_id == user_id).limit(limit)
+
+    removed = db.session.execute(
+        delete(Conversation)
+        .where(Conversation.other_user_id == user_id,
+               Conversation.user_id.in_(others))
+        .returning(Conversation.user_id, Conversation.unread_count)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    unread = {owner: n for owner, n in removed if n}
+    if unread:
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(unread))
+            .values(unread_count=User.unread_count
+                    - case(unread, value=User.id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+
+    return len(removed)
+
+
+def _purge_own_conversations(user_id, limit):
+    others = select(Conversation.other_user_id).where(
+        Conversation.user_id == user_id).limit(limit)
+
+    return db.session.execute(
+        delete(Conversation)
+        .where(Conversation.user_id == user_id,
+               Conversation.other_user_id.in_(others))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _purge_direct_messages(column):
+    def purge(user_id, limit):
+        batch = select(DirectMessage.id).where(column == user_id).limit(limit)
+
+        return db.session.execute(
+            delete(DirectMessage)
+            .where(DirectMessage.id.in_(batch))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    return purge
+
+
+def _purge_timeline(user_id, limit):
+    entries = select(TimelineEntry.message_id).where(
+        TimelineEntry.user_id == user_id).limit(limit)
+
+    return db.session.execute(
+        delete(TimelineEntry)
+        .where(TimelineEntry.user_id == user_id,
+               TimelineEntry.message_id.in_(entries))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# What a purge deletes, in order. Follows go first, so the account drops
+# out of other users' follower and following lists early on
+PURGE_STEPS = (
+    ('following', _purge_following),
+    ('followers', _purge_followers),
+    ('likes', _purge_likes),
+    ('timeline copies', _purge_timeline_copies),
+    ('messages', _purge_messages),
+    ('conversations', _purge_conversations),
+    ('own conversations', _purge_own_conversations),
+    ('sent direct messages',
+     _purge_direct_messages(DirectMessage.user_id_from)),
+    ('received direct messages',
+     _purge_direct_messages(DirectMessage.user_id_to)),
+    ('timeline', _purge_timeline),
+)
+
+
+def purge_user(user_id, batch_size=PURGE_BATCH_SIZE, progress=None):
+    """Delete a user marked for purging, a batch per transaction.
+
+    `progress`, if given, is called with the step name and rows deleted by
+    it so far after each batch. Safe to rerun after an interruption.
+    """
+
+    for name, step in PURGE_STEPS:
+        deleted = 0
+        while True:
+            n = step(user_id, batch_size)
+            db.session.commit()
+
+            deleted += n
+            if progress and n:
+                progress(name, deleted)
+            if n < batch_size:
+                break
+
+    # Anything added since its step ran is taken care of here
+    release_user(user_id)
+    db.session.execute(
+        delete(User)
+        .where(User.id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def users_to_purge():
+    """Ids of users marked for purging, oldest first."""
+
+    return db.session.execute(
+        select(User.id)
+        .where(User.deleted_at.isnot(None))
+        .order_by(User.deleted_at)
+    ).scalars().all()
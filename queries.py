@@ -0,0 +1,138 @@
+"""Read queries for message and user listings.
+
+Each message function returns a page of messages whose authors are already
+loaded, so templates can read `msg.user` without issuing a query per
+message. The listing pages get read-only rows (see projections.py) rather
+than ORM objects.
+"""
+
+from sqlalchemy import select
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, User, Message, Like, Follows
+from pagination import Page, make_page, paginate
+from projections import (
+    select_messages, message_rows, load_messages, select_users, load_users)
+from timeline import home_timeline
+
+MESSAGE_ORDER = (Message.timestamp, Message.id)
+
+LIKE_ORDER = (Like.created_at, Like.message_id)
+
+
+def message_key(msg):
+    """Sort key of `msg` for keyset cursors."""
+
+    return (msg.timestamp, msg.id)
+
+
+def load_authors(messages):
+    """Load the authors of `messages` in a single query.
+
+    Each author is attached to its messages as an already-loaded `user`
+    attribute, so templates never trigger a lazy SELECT.
+    """
+
+    author_ids = {msg.user_id for msg in messages}
+    if not author_ids:
+        return messages
+
+    authors = {user.id: user
+               for user in User.query.filter(User.id.in_(author_ids))}
+    for msg in messages:
+        set_committed_value(msg, 'user', authors[msg.user_id])
+
+    return messages
+
+
+def home_feed(user_id, before=None, per_page=100):
+    """Page of MessageRows from `user_id`'s home timeline."""
+
+    rows = home_timeline(user_id, limit=per_page + 1, before=before,
+                         query=select_messages())
+    return make_page(message_rows(rows), per_page, key=message_key)
+
+
+def profile_messages(user_id, before=None, per_page=100):
+    """Page of MessageRows written by `user_id`."""
+
+    return paginate(
+        select_messages().where(Message.user_id == user_id),
+        MESSAGE_ORDER, before=before, per_page=per_page, load=load_messages)
+
+
+def liked_messages(user_id, before=None, per_page=100):
+    """Page of MessageRows liked by `user_id`, most recently liked first.
+
+    Pages walk the likes index on (user_id, created_at, message_id), so
+    each costs the same however many messages the user has liked.
+    """
+
+    def load(query):
+        rows = db.session.execute(query).all()
+        messages = message_rows(row[:-1] for row in rows)
+        return [(msg, row.created_at) for msg, row in zip(messages, rows)]
+
+    page = paginate(
+        select_messages()
+            .add_columns(Like.created_at)
+            .join(Like, Like.message_id == Message.id)
+            .where(Like.user_id == user_id),
+        LIKE_ORDER, before=before, per_page=per_page, load=load,
+        key=lambda row: (row[1], row[0].id))
+
+    return Page([msg for msg, _ in page], page.next_cursor)
+
+
+def liked_message_ids(user_id, messages):
+    """Return the set of ids among `messages` that `user_id` has liked.
+
+    Only the likes rows for the given messages are read, however many
+    messages the user has liked overall.
+    """
+
+    message_ids = [msg.id for msg in messages]
+    if not message_ids:
+        return set()
+
+    return set(db.session.execute(
+        select(Like.message_id)
+        .where(Like.user_id == user_id,
+               Like.message_id.in_(message_ids))
+    ).scalars())
+
+
+def all_users(before=None, per_page=60):
+    """Page of UserRows for every (not deleted) user, oldest first."""
+
+    return paginate(
+        select_users(), (User.id,), before=before, per_page=per_page,
+        descending=False, load=load_users)
+
+
+def user_followers(user_id, before=None, per_page=60):
+    """Page of UserRows following `user_id`, newest accounts first.
+
+    Follows have no timestamp, so this is account order, not the order
+    they followed in; it's the order of the follows primary key, which
+    pages walk.
+    """
+
+    return paginate(
+        select_users()
+            .join(Follows, Follows.user_following_id == User.id)
+            .where(Follows.user_being_followed_id == user_id),
+        (User.id,), before=before, per_page=per_page, load=load_users)
+
+
+def user_following(user_id, before=None, per_page=60):
+    """Page of UserRows `user_id` follows, newest accounts first.
+
+    Account order, as for followers; pages walk ix_follows_user_following_id.
+    """
+
+    return paginate(
+        select_users()
+            .join(Follows, Follows.user_being_followed_id == User.id)
+            .where(Follows.user_following_id == user_id),
+        (User.id,), before=before, per_page=per_page, load=load_users)
@@ -0,0 +1,97 @@
+"""Sending reads to read replicas.
+
+With SQLALCHEMY_REPLICA_URIS set (DATABASE_REPLICA_URLS, comma-separated),
+the SELECTs of GET and HEAD requests go to one of the replicas, picked per
+request so a page reads one consistent snapshot. Everything else goes to
+the primary (`SQLALCHEMY_DATABASE_URI`):
+
+- writes, and every later statement in the same request, so a request
+  reads what it just wrote;
+- other requests (POST etc.), which usually read what they're about to
+  change;
+- all requests from a user for REPLICA_STICKY_SECONDS after they wrote, so
+  a like, follow or new message is on the page they're sent to next,
+  however far the replicas lag. The deadline is kept in their session;
+- anything outside a request (CLI commands, scripts).
+"""
+
+import random
+from time import time
+
+import sqlalchemy
+from flask import request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import orm
+
+from pooling import engine_options
+
+# Seconds after a write that the writer's requests keep reading the primary
+REPLICA_STICKY_SECONDS = 5
+
+# Session key holding when the writer's requests may use replicas again
+PRIMARY_UNTIL_KEY = "db_primary_until"
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(SignallingSession):
+    """A session that sends plain SELECTs to a replica once
+    `use_replicas()` has been called, and everything else to the primary."""
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        self._replica = None
+
+    def use_replicas(self):
+        engines = self.app.extensions.get('replicas')
+        if engines:
+            self._replica = random.choice(engines)
+
+    @property
+    def wrote(self):
+        return self.info.get('wrote', False)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+            self._replica = None
+
+        if (self._replica is not None
+                and getattr(clause, 'is_select', False)
+                and getattr(clause, '_for_update_arg', None) is None):
+            return self._replica
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def init_routing(app):
+    """Create the replica engines and route each request's reads."""
+
+    db = app.extensions['sqlalchemy'].db
+
+    app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+    app.config.setdefault('REPLICA_STICKY_SECONDS', REPLICA_STICKY_SECONDS)
+
+    options = engine_options(app.config, 'replica')
+    app.extensions['replicas'] = [
+        sqlalchemy.create_engine(uri, **options)
+        for uri in app.config['SQLALCHEMY_REPLICA_URIS']]
+
+    @app.before_request
+    def route_reads():
+        if (app.extensions['replicas']
+                and request.method in SAFE_METHODS
+                and session.get(PRIMARY_UNTIL_KEY, 0) <= time()):
+            db.session().use_replicas()
+
+    @app.after_request
+    def stick_to_primary(response):
+        if app.extensions['replicas'] and db.session().wrote:
+            session[PRIMARY_UNTIL_KEY] = (
+                time() + app.config['REPLICA_STICKY_SECONDS'])
+        return response
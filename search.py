@@ -0,0 +1,272 @@
+"""User search.
+
+Matches usernames case-insensitively. Exact matches rank above prefix
+matches, which rank above other substring matches, but follower count is
+weighed in too: a match gains one place for every FOLLOWERS_PER_PLACE
+times more followers, so a prefix match with 1000 followers ranks level
+with an exact match with none.
+
+- Terms shorter than TRIGRAM_MIN_LENGTH match username prefixes only, which
+  a btree index on lower(username) serves.
+- Longer terms match anywhere in the username. On Postgres with the
+  pg_trgm extension a GIN trigram index serves these; without it Postgres
+  scans the users table, which still costs less than every worker holding
+  and reloading a copy of it. Other databases get an in-process trigram
+  index that narrows the candidates instead. The app's writes need
+  Postgres (interactions.py and timeline.py use its INSERT ... ON
+  CONFLICT), so that index only serves tests and read-only tools.
+"""
+
+from collections import defaultdict
+from math import log
+from threading import Lock
+from time import time
+
+from sqlalchemy import and_, case, event, func, select, text
+from sqlalchemy.exc import DBAPIError
+
+from models import db, User
+
+# Most results returned for a search
+SEARCH_RESULTS_LIMIT = 60
+
+# Most suggestions returned by autocomplete
+AUTOCOMPLETE_LIMIT = 10
+
+# A match moves up one place (substring, prefix, exact) for every this many
+# times more followers
+FOLLOWERS_PER_PLACE = 1000
+
+# Terms shorter than this only match username prefixes
+TRIGRAM_MIN_LENGTH = 3
+
+# Seconds before the in-process fallback index is reloaded from the database
+NGRAM_INDEX_TTL = 60
+
+# Most fallback index matches looked up by id; a term matching more is
+# matched by scanning the table instead
+NGRAM_CANDIDATES_LIMIT = 1000
+
+TRIGRAM_INDEX = 'ix_users_username_trgm'
+PREFIX_INDEX = 'ix_users_username_lower_pattern'
+
+
+##############################################################################
+# Database indexes
+
+
+def create_search_indexes(connection):
+    """Create the username search indexes on a Postgres connection.
+
+    The trigram index needs the pg_trgm extension; if it can't be created
+    substring searches scan the table instead, so failure is not an error.
+    Returns whether the trigram index exists.
+    """
+
+    if connection.dialect.name != 'postgresql':
+        return False
+
+    connection.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {PREFIX_INDEX} "
+        "ON users (lower(username) text_pattern_ops)"))
+
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} "
+                "ON users USING gin (lower(username) gin_trgm_ops)"))
+    except DBAPIError:
+        return False
+
+    return True
+
+
+@event.listens_for(User.__table__, 'after_create')
+def _create_search_indexes(target, connection, **kw):
+    create_search_indexes(connection)
+
+
+def ngram_fallback():
+    """Are substring matches narrowed by the in-process index? Only off
+    Postgres, whose substring matches run in the database."""
+
+    return db.engine.dialect.name != 'postgresql'
+
+
+##############################################################################
+# In-process fallback index
+
+
+def _trigrams(term):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def _add(names, postings, user_id, username):
+    name = username.lower()
+    names[user_id] = name
+    for gram in _trigrams(name):
+        postings[gram].add(user_id)
+
+
+def _remove(names, postings, user_id):
+    name = names.pop(user_id, None)
+    if name is not None:
+        for gram in _trigrams(name):
+            postings[gram].discard(user_id)
+
+
+class NgramIndex:
+    """Trigram -> user ids postings over lower-cased usernames."""
+
+    def __init__(self, ttl=NGRAM_INDEX_TTL):
+        self.ttl = ttl
+        self.loaded_at = None
+        self._names = {}
+        self._postings = defaultdict(set)
+        # Guards the postings; never held while the database is read
+        self._lock = Lock()
+        # Held by the one thread reloading the index
+        self._load_lock = Lock()
+        # (user_id, username or None) changes made during a reload
+        self._changes = None
+
+    def _stale(self):
+        return self.loaded_at is None or time() - self.loaded_at > self.ttl
+
+    def _load(self):
+        """Read the usernames into new postings and swap them in.
+
+        Other threads keep searching the current postings meanwhile, or
+        before the first load, wait for it.
+        """
+
+        if not self._load_lock.acquire(blocking=self.loaded_at is None):
+            return
+        try:
+            if not self._stale():
+                return
+            with self._lock:
+                self._changes = []
+
+            names = {}
+            postings = defaultdict(set)
+            for user_id, username in self._read():
+                _add(names, postings, user_id, username)
+
+            with self._lock:
+                # Replay the adds and removes the read may have missed
+                for user_id, username in self._changes:
+                    _remove(names, postings, user_id)
+                    if username is not None:
+                        _add(names, postings, user_id, username)
+                self._names, self._postings = names, postings
+                self.loaded_at = time()
+        finally:
+            with self._lock:
+                self._changes = None
+            self._load_lock.release()
+
+    def _read(self):
+        return db.session.execute(select(User.id, User.username))
+
+    def add(self, user_id, username):
+        """Index (or re-index) one user, if the index is loaded."""
+
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((user_id, username))
+            if self.loaded_at is None:
+                return
+            _remove(self._names, self._postings, user_id)
+            _add(self._names, self._postings, user_id, username)
+
+    def remove(self, user_id):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((user_id, None))
+            _remove(self._names, self._postings, user_id)
+
+    def search(self, term):
+        """Ids of users whose username contains `term` (3+ chars)."""
+
+        if self._stale():
+            self._load()
+
+        with self._lock:
+            postings = sorted((self._postings.get(gram, set())
+                               for gram in _trigrams(term)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            return [user_id for user_id in candidates
+                    if term in self._names[user_id]]
+
+    def clear(self):
+        with self._lock:
+            self.loaded_at = None
+            self._names = {}
+            self._postings = defaultdict(set)
+
+
+username_index = NgramIndex()
+
+
+def index_user(user):
+    """Keep the fallback index current after a signup or rename."""
+
+    username_index.add(user.id, user.username)
+
+
+def unindex_user(user_id):
+    """Drop a deleted user from the fallback index."""
+
+    username_index.remove(user_id)
+
+
+##############################################################################
+# Queries
+
+
+def search_users(term, limit=SEARCH_RESULTS_LIMIT, columns=None):
+    """Return up to `limit` users matching `term`, best match first.
+
+    `columns` selects specific User columns (rows come back as tuples);
+    by default whole User objects are returned.
+    """
+
+    term = (term or '').strip().lower()
+    if not term:
+        return []
+
+    username = func.lower(User.username)
+
+    if len(term) < TRIGRAM_MIN_LENGTH:
+        match = username.startswith(term, autoescape=True)
+    elif not ngram_fallback():
+        match = username.contains(term, autoescape=True)
+    else:
+        candidates = username_index.search(term)
+        if not candidates:
+            return []
+        if len(candidates) > NGRAM_CANDIDATES_LIMIT:
+            match = username.contains(term, autoescape=True)
+        else:
+            # Re-check the name in case it changed since the index was loaded
+            match = and_(User.id.in_(candidates),
+                         username.contains(term, autoescape=True))
+
+    place = case(
+        (username == term, 0),
+        (username.startswith(term, autoescape=True), 1),
+        else_=2,
+    )
+    relevance = (place - func.ln(User.followers_count + 1)
+                 / log(FOLLOWERS_PER_PLACE))
+
+    query = (select(*columns) if columns else select(User))
+    query = (query
+             .where(match, User.deleted_at.is_(None))
+             .order_by(relevance, User.id)
+             .limit(limit))
+
+    result = db.session.execute(query)
+    return result.all() if columns else result.scalars().all()
@@ -0,0 +1,67 @@
+"use strict";
+
+// Like and follow buttons without a page reload. Forms marked with
+// data-toggle send their CSRF token to the JSON API (data-api): POST to
+// set, DELETE to clear. The button and any counts on the page are updated
+// from the response. Without JavaScript the forms post as usual.
+
+const viewerId = document.body.dataset.userId;
+
+function setCount(kind, userId, count) {
+  document.querySelectorAll(`[data-${kind}-count="${userId}"]`)
+    .forEach(el => { el.textContent = count; });
+}
+
+const UPDATE = {
+  like(form, data) {
+    const icon = form.querySelector("i");
+    icon.classList.toggle("bi-star-fill", data.liked);
+    icon.classList.toggle("bi-star", !data.liked);
+    setCount("likes", viewerId, data.likes_count);
+    return data.liked;
+  },
+
+  follow(form, data) {
+    const button = form.querySelector("button");
+    button.classList.toggle("btn-primary", data.following);
+    button.classList.toggle("btn-outline-primary", !data.following);
+    button.textContent = data.following ? "Unfollow" : "Follow";
+    form.action = data.following
+      ? `/users/stop-following/${data.user_id}`
+      : `/users/follow/${data.user_id}`;
+    setCount("followers", data.user_id, data.followers_count);
+    setCount("following", viewerId, data.following_count);
+    return data.following;
+  },
+};
+
+async function toggle(form) {
+  const active = form.dataset.active === "true";
+  const resp = await fetch(form.dataset.api, {
+    method: active ? "DELETE" : "POST",
+    body: new FormData(form),
+    credentials: "same-origin",
+    headers: { Accept: "application/json" },
+  });
+
+  if (!resp.ok) {
+    // Fall back to the regular form, which reports errors in the page
+    form.submit();
+    return;
+  }
+
+  const data = await resp.json();
+  form.dataset.active = UPDATE[form.dataset.toggle](form, data);
+}
+
+document.addEventListener("submit", evt => {
+  const form = evt.target;
+  if (!form.dataset || !(form.dataset.toggle in UPDATE)) return;
+
+  evt.preventDefault();
+  if (form.dataset.busy) return;
+  form.dataset.busy = "true";
+  toggle(form)
+    .catch(() => form.submit())
+    .finally(() => { delete form.dataset.busy; });
+});
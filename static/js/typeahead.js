@@ -0,0 +1,37 @@
+"use strict";
+
+// Username suggestions for inputs with a data-autocomplete URL: as the user
+// types, fetch matches (at most one request per pause in typing) and fill
+// the input's <datalist>.
+
+const TYPEAHEAD_DELAY_MS = 150;
+
+function attachTypeahead(input) {
+  const datalist = document.getElementById(input.getAttribute("list"));
+  let timer = null;
+  let lastTerm = null;
+
+  async function suggest() {
+    const term = input.value.trim().replace(/^@/, "");
+    if (!term || term === lastTerm) return;
+    lastTerm = term;
+
+    const url = `${input.dataset.autocomplete}?q=${encodeURIComponent(term)}`;
+    const resp = await fetch(url, { credentials: "same-origin" });
+    if (!resp.ok || term !== lastTerm) return;
+
+    const { users } = await resp.json();
+    datalist.replaceChildren(...users.map(user => {
+      const option = document.createElement("option");
+      option.value = user.username;
+      return option;
+    }));
+  }
+
+  input.addEventListener("input", () => {
+    clearTimeout(timer);
+    timer = setTimeout(suggest, TYPEAHEAD_DELAY_MS);
+  });
+}
+
+document.querySelectorAll("input[data-autocomplete]").forEach(attachTypeahead);
@@ -0,0 +1,136 @@
+"""JSON like/follow API tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_api.py
+
+
+import os
+import re
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, Follows, Like
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from testing import QueryCountMixin
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class ApiTestCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        User.query.delete()
+
+        viewer = User(username="viewer", email="viewer@email.com",
+                      password="not-a-hash")
+        author = User(username="author", email="author@email.com",
+                      password="not-a-hash")
+        db.session.add_all([viewer, author])
+        db.session.flush()
+
+        message = Message(text="hello", user_id=author.id)
+        db.session.add(message)
+        db.session.commit()
+
+        self.viewer_id = viewer.id
+        self.author_id = author.id
+        self.message_id = message.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_like_and_unlike(self):
+        url = f"/api/messages/{self.message_id}/like"
+
+        resp = self.client.post(url)
+        self.assertEqual(resp.json, {"message_id": self.message_id,
+                                     "liked": True, "likes_count": 1})
+
+        # setting the same state again changes nothing
+        resp = self.client.post(url)
+        self.assertEqual(resp.json["likes_count"], 1)
+        self.assertEqual(Like.query.count(), 1)
+
+        resp = self.client.delete(url)
+        self.assertEqual(resp.json, {"message_id": self.message_id,
+                                     "liked": False, "likes_count": 0})
+        self.assertEqual(Like.query.count(), 0)
+
+    def test_follow_and_unfollow(self):
+        url = f"/api/users/{self.author_id}/follow"
+
+        resp = self.client.post(url)
+        self.assertEqual(resp.json, {
+            "user_id": self.author_id, "following": True,
+            "followers_count": 1, "following_count": 1})
+        self.assertEqual(Follows.query.count(), 1)
+
+        resp = self.client.delete(url)
+        self.assertEqual(resp.json, {
+            "user_id": self.author_id, "following": False,
+            "followers_count": 0, "following_count": 0})
+        self.assertEqual(Follows.query.count(), 0)
+
+    def test_errors(self):
+        resp = self.client.post("/api/messages/0/like")
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.post(f"/api/users/{self.viewer_id}/follow")
+        self.assertEqual(resp.status_code, 403)
+
+        with self.client.session_transaction() as sess:
+            del sess[CURR_USER_KEY]
+        resp = self.client.post(f"/api/users/{self.author_id}/follow")
+        self.assertEqual(resp.status_code, 401)
+        self.assertIn("error", resp.json)
+
+    def test_csrf_required(self):
+        url = f"/api/messages/{self.message_id}/like"
+
+        with patch.dict(app.config, {'WTF_CSRF_ENABLED': True}):
+            resp = self.client.post(url)
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(Like.query.count(), 0)
+
+            html = self.client.get("/").get_data(as_text=True)
+            token = re.search(
+                r'name="csrf_token" type="hidden" value="([^"]+)"', html)[1]
+
+            resp = self.client.post(url, data={"csrf_token": token})
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.json["liked"])
+
+    def test_cheaper_than_form_post(self):
+        """A click costs a handful of queries and no page render."""
+
+        with self.assertMaxQueries(6):
+            self.client.post(f"/api/messages/{self.message_id}/like")
+        with self.assertMaxQueries(9):
+            self.client.post(f"/api/users/{self.author_id}/follow")
+
+    def test_forms_are_enhanced(self):
+        self.client.post(f"/api/users/{self.author_id}/follow")
+
+        html = self.client.get(
+            f"/messages/{self.message_id}").get_data(as_text=True)
+
+        self.assertIn(f'data-api="/api/messages/{self.message_id}/like"', html)
+        self.assertIn(f'data-api="/api/users/{self.author_id}/follow"', html)
+        self.assertIn('data-active="true"', html)
+        self.assertIn("js/toggles.js", html)
@@ -0,0 +1,88 @@
+"""App factory and config profile tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_app_factory.py
+
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import click
+
+from models import db
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, create_app
+from pooling import dispose_engines
+
+db.create_all()
+
+
+class AppFactoryTestCase(TestCase):
+    def create(self, profile):
+        new_app = create_app(profile)
+
+        # connect_db() points the shared `db` at the newest app
+        self.addCleanup(setattr, db, 'app', app)
+        self.addCleanup(lambda: db.get_engine(new_app).dispose())
+        return new_app
+
+    def test_production_profile(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        with patch.dict(os.environ, {'TEMPLATE_CACHE_DIR': cache_dir}):
+            prod = self.create('production')
+
+        # No debug toolbar or Flask-Migrate
+        self.assertNotIn('DEBUG_TB_ENABLED', prod.config)
+        self.assertNotIn('migrate', prod.extensions)
+
+        # Every template compiled, and kept for the next process
+        templates = prod.jinja_env.list_templates()
+        self.assertEqual(len(prod.jinja_env.cache), len(templates))
+        self.assertEqual(len(os.listdir(cache_dir)), len(templates))
+
+        resp = prod.test_client().get("/login")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_development_profile(self):
+        dev = self.create('development')
+
+        self.assertIn('DEBUG_TB_ENABLED', dev.config)
+        self.assertIn('migrate', dev.extensions)
+        self.assertEqual(len(dev.jinja_env.cache), 0)
+
+    def test_migrations_for_flask_command(self):
+        with click.Context(click.Command('db')):
+            prod = self.create('production')
+
+        self.assertIn('migrate', prod.extensions)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            create_app('staging')
+
+    def test_dispose_engines(self):
+        """A forked worker gets a new pool; the parent's stays open."""
+
+        engine = db.get_engine(app)
+        connection = engine.connect()
+        self.addCleanup(connection.close)
+        pool = engine.pool
+
+        dispose_engines(app)
+
+        self.assertIsNot(engine.pool, pool)
+        self.assertFalse(connection.closed)
@@ -0,0 +1,161 @@
+"""HTTP caching tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_caching.py
+
+
+import os
+from unittest import TestCase
+
+from flask import template_rendered
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from caching import asset_version
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class CachingTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+
+        viewer = User(username="viewer", email="viewer@email.com",
+                      password="not-a-hash")
+        author = User(username="author", email="author@email.com",
+                      password="not-a-hash")
+        db.session.add_all([viewer, author])
+        db.session.flush()
+
+        message = Message(text="hello", user_id=author.id)
+        db.session.add(message)
+        db.session.commit()
+
+        self.viewer_id = viewer.id
+        self.author_id = author.id
+        self.message_id = message.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+        self.rendered = []
+        template_rendered.connect(self.record_render, app)
+
+    def tearDown(self):
+        template_rendered.disconnect(self.record_render, app)
+        db.session.rollback()
+
+    def record_render(self, sender, template, context, **extra):
+        self.rendered.append(template.name)
+
+    def revalidate(self, url):
+        """GET `url`, then GET it again with the ETag it came with."""
+
+        first = self.client.get(url)
+        self.rendered.clear()
+        return first, self.client.get(
+            url, headers={"If-None-Match": first.headers["ETag"]})
+
+    def test_unchanged_profile_is_not_modified(self):
+        """A revalidated profile is a 304 and renders nothing."""
+
+        first, second = self.revalidate(f"/users/{self.author_id}")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("private", first.headers["Cache-Control"])
+        self.assertIn("no-cache", first.headers["Cache-Control"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(self.rendered, [])
+
+    def test_new_message_changes_profile_etag(self):
+        first = self.client.get(f"/users/{self.author_id}")
+
+        db.session.add(Message(text="again", user_id=self.author_id))
+        db.session.flush()
+        User.query.filter_by(id=self.author_id).update(
+            {User.messages_count: User.messages_count + 1})
+        db.session.commit()
+
+        second = self.client.get(
+            f"/users/{self.author_id}",
+            headers={"If-None-Match": first.headers["ETag"]})
+
+        self.assertEqual(second.status_code, 200)
+        self.assertIn("again", second.get_data(as_text=True))
+
+    def test_profile_edit_changes_etag(self):
+        """A followed user's new bio shows on the following page."""
+
+        self.client.post(f"/users/follow/{self.author_id}")
+        first = self.client.get(f"/users/{self.viewer_id}/following")
+
+        author = User.query.get(self.author_id)
+        author.bio = "new bio"
+        db.session.commit()
+
+        second = self.client.get(
+            f"/users/{self.viewer_id}/following",
+            headers={"If-None-Match": first.headers["ETag"]})
+
+        self.assertEqual(second.status_code, 200)
+        self.assertIn("new bio", second.get_data(as_text=True))
+
+    def test_viewer_changes_etag(self):
+        """Liking the message changes how its page looks to the viewer."""
+
+        first = self.client.get(f"/messages/{self.message_id}")
+        self.client.post(f"/messages/{self.message_id}/likes")
+        self.client.get("/")  # show the flash
+
+        second = self.client.get(
+            f"/messages/{self.message_id}",
+            headers={"If-None-Match": first.headers["ETag"]})
+
+        self.assertEqual(second.status_code, 200)
+
+    def test_flashes_are_not_cached(self):
+        """A page showing a one-off message gets no ETag."""
+
+        with self.client.session_transaction() as sess:
+            sess["_flashes"] = [("success", "Hi!")]
+
+        resp = self.client.get(f"/users/{self.author_id}")
+
+        self.assertIn("Hi!", resp.get_data(as_text=True))
+        self.assertNotIn("ETag", resp.headers)
+        self.assertIn("no-store", resp.headers["Cache-Control"])
+
+    def test_other_pages_not_stored(self):
+        resp = self.client.get("/")
+        self.assertEqual(resp.headers["Cache-Control"], "private, no-store")
+
+    def test_fingerprinted_static(self):
+        """Pages link static files by content hash; those never expire."""
+
+        with app.test_request_context():
+            version = asset_version("stylesheets/style.css")
+
+        html = self.client.get("/").get_data(as_text=True)
+        self.assertIn(f"/static/stylesheets/style.css?v={version}", html)
+
+        resp = self.client.get(f"/static/stylesheets/style.css?v={version}")
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn("max-age=31536000", resp.headers["Cache-Control"])
+
+        resp = self.client.get("/static/stylesheets/style.css")
+        self.assertNotIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn("max-age=3600", resp.headers["Cache-Control"])
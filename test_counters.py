@@ -0,0 +1,124 @@
+"""Profile counter tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_counters.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from counters import reconcile_counters
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class CountersTestCase(TestCase):
+    def setUp(self):
+        """Set up two users; u2 has one message."""
+        User.query.delete()
+
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        u2 = User.signup("u2", "u2@email.com", "password", None)
+        db.session.flush()
+
+        m1 = Message(text="m1-text", user_id=u2.id)
+        db.session.add(m1)
+        db.session.commit()
+
+        self.u1_id = u1.id
+        self.u2_id = u2.id
+        self.m1_id = m1.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def counts(self, user_id):
+        user = User.query.get(user_id)
+        return (user.messages_count, user.followers_count,
+                user.following_count, user.likes_count)
+
+    def test_follow_counts(self):
+        """Following and unfollowing update both users."""
+
+        self.client.post(f"/users/follow/{self.u2_id}")
+        self.assertEqual(self.counts(self.u1_id), (0, 0, 1, 0))
+        self.assertEqual(self.counts(self.u2_id), (0, 1, 0, 0))
+
+        self.client.post(f"/users/stop-following/{self.u2_id}")
+        self.assertEqual(self.counts(self.u1_id), (0, 0, 0, 0))
+        self.assertEqual(self.counts(self.u2_id), (0, 0, 0, 0))
+
+    def test_like_counts(self):
+        """Liking and unliking update the liker."""
+
+        self.client.post(f"/messages/{self.m1_id}/likes")
+        self.assertEqual(self.counts(self.u1_id)[3], 1)
+
+        self.client.post(f"/messages/{self.m1_id}/likes")
+        self.assertEqual(self.counts(self.u1_id)[3], 0)
+
+    def test_message_counts(self):
+        """Posting and deleting update the author and likers."""
+
+        self.client.post("/messages/new", data={"text": "Hello"})
+        self.assertEqual(self.counts(self.u1_id)[0], 1)
+
+        msg_id = Message.query.filter_by(text="Hello").one().id
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u2_id
+        self.client.post(f"/messages/{msg_id}/likes")
+        self.assertEqual(self.counts(self.u2_id)[3], 1)
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+        self.client.post(f"/messages/{msg_id}/delete")
+
+        self.assertEqual(self.counts(self.u1_id)[0], 0)
+        self.assertEqual(self.counts(self.u2_id)[3], 0)
+
+    def test_delete_user_counts(self):
+        """Deleting an account updates the users it was connected to."""
+
+        self.client.post(f"/users/follow/{self.u2_id}")
+        self.client.post(f"/messages/{self.m1_id}/likes")
+        self.assertEqual(self.counts(self.u2_id)[1], 1)
+
+        self.client.post("/users/delete")
+
+        self.assertIsNone(User.query.get(self.u1_id))
+        self.assertEqual(self.counts(self.u2_id)[1], 0)
+
+    def test_reconcile_counters(self):
+        """Reconciling fixes counters that have drifted."""
+
+        db.session.add(Follows(user_being_followed_id=self.u2_id,
+                               user_following_id=self.u1_id))
+        db.session.add(Like(user_id=self.u1_id, message_id=self.m1_id))
+        db.session.commit()
+
+        fixed = reconcile_counters()
+
+        self.assertEqual(fixed, 2)
+        self.assertEqual(self.counts(self.u1_id), (0, 0, 1, 1))
+        self.assertEqual(self.counts(self.u2_id), (1, 1, 0, 0))
+        self.assertEqual(reconcile_counters(), 0)
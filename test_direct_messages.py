@@ -0,0 +1,196 @@
+"""Direct message tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_direct_messages.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, DirectMessage, Conversation
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from counters import reconcile_counters
+from direct_messages import (
+    send_direct_message, mark_read, conversations, thread,
+    rebuild_conversations)
+from pagination import decode_cursor
+from user_cache import user_cache
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class DirectMessageTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+        user_cache.clear()
+
+        self.ids = {}
+        for name in ("alice", "bob", "carol"):
+            user = User(username=name, email=f"{name}@email.com",
+                        password="not-a-hash")
+            db.session.add(user)
+            db.session.flush()
+            self.ids[name] = user.id
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def send(self, sender, recipient, subject="hi", text="hello"):
+        dm = send_direct_message(self.ids[sender], self.ids[recipient],
+                                 subject, text)
+        db.session.commit()
+        return dm
+
+    def conversation(self, user, other):
+        return Conversation.query.get((self.ids[user], self.ids[other]))
+
+    def unread(self, name):
+        return db.session.get(User, self.ids[name],
+                              populate_existing=True).unread_count
+
+    def login(self, name):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.ids[name]
+
+    def test_send_updates_both_sides(self):
+        dm = self.send("alice", "bob")
+        self.send("alice", "bob", subject="again")
+
+        mine = self.conversation("alice", "bob")
+        theirs = self.conversation("bob", "alice")
+
+        self.assertEqual(theirs.unread_count, 2)
+        self.assertEqual(mine.unread_count, 0)
+        self.assertEqual(theirs.last_message.subject, "again")
+        self.assertNotEqual(theirs.last_message_id, dm.id)
+        self.assertEqual(self.unread("bob"), 2)
+        self.assertEqual(self.unread("alice"), 0)
+
+    def test_mark_read(self):
+        self.send("alice", "bob")
+        self.send("carol", "bob")
+
+        self.assertEqual(mark_read(self.ids["bob"], self.ids["alice"]), 1)
+        db.session.commit()
+
+        self.assertEqual(self.conversation("bob", "alice").unread_count, 0)
+        self.assertEqual(self.conversation("bob", "carol").unread_count, 1)
+        self.assertEqual(self.unread("bob"), 1)
+        self.assertEqual(mark_read(self.ids["bob"], self.ids["alice"]), 0)
+
+        # the counter agrees with the conversations it totals
+        self.assertEqual(reconcile_counters(), 0)
+
+    def test_conversations_most_recent_first(self):
+        self.send("alice", "bob")
+        self.send("carol", "bob")
+        self.send("bob", "alice")
+
+        page = conversations(self.ids["bob"], per_page=1)
+        self.assertEqual([c.other_user.username for c in page], ["alice"])
+
+        page = conversations(self.ids["bob"], per_page=1,
+                             before=decode_cursor(page.next_cursor))
+        self.assertEqual([c.other_user.username for c in page], ["carol"])
+        self.assertFalse(page.has_next)
+
+    def test_thread_pages_both_directions(self):
+        start = datetime(2022, 1, 1)
+        for i in range(5):
+            sender, recipient = (
+                ("alice", "bob") if i % 2 == 0 else ("bob", "alice"))
+            db.session.add(DirectMessage(
+                user_id_from=self.ids[sender], user_id_to=self.ids[recipient],
+                subject=f"m{i}", text="...",
+                timestamp=start + timedelta(minutes=i)))
+        self.send("carol", "alice", subject="other")
+
+        subjects = []
+        before = None
+        while True:
+            page = thread(self.ids["alice"], self.ids["bob"],
+                          before=before, per_page=2)
+            subjects.extend(dm.subject for dm in page)
+            if not page.has_next:
+                break
+            before = decode_cursor(page.next_cursor)
+
+        self.assertEqual(subjects, ["m4", "m3", "m2", "m1", "m0"])
+
+    def test_rebuild_conversations(self):
+        self.send("alice", "bob", subject="first")
+        self.send("bob", "alice", subject="latest")
+        self.send("carol", "bob")
+
+        self.assertEqual(rebuild_conversations(), 4)
+        self.assertEqual(
+            self.conversation("alice", "bob").last_message.subject, "latest")
+        self.assertEqual(self.conversation("bob", "carol").unread_count, 0)
+        self.assertEqual(self.unread("bob"), 0)
+
+    def test_send_by_username(self):
+        self.login("alice")
+
+        resp = self.client.post("/direct-messages/new", data={
+            "recipient": "@bob", "subject": "hey", "text": "hello bob"})
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.location, f"/direct-messages/{self.ids['bob']}")
+        self.assertEqual(self.conversation("bob", "alice").unread_count, 1)
+
+        html = self.client.post("/direct-messages/new", data={
+            "recipient": "nobody", "subject": "hey", "text": "?"},
+        ).get_data(as_text=True)
+        self.assertIn("No user with that username.", html)
+
+        html = self.client.post("/direct-messages/new", data={
+            "recipient": "alice", "subject": "hey", "text": "?"},
+        ).get_data(as_text=True)
+        self.assertIn("You can&#39;t message yourself.", html)
+
+    def test_new_message_form(self):
+        self.login("alice")
+
+        html = self.client.get("/direct-messages/new?to=bob").get_data(
+            as_text=True)
+
+        self.assertIn('value="bob"', html)
+        self.assertIn('list="recipient-suggestions"', html)
+        self.assertIn("js/typeahead.js", html)
+
+    def test_inbox_and_thread_pages(self):
+        self.send("alice", "bob", subject="lunch?")
+        self.login("bob")
+
+        html = self.client.get("/direct-messages").get_data(as_text=True)
+        self.assertIn("@alice", html)
+        self.assertIn("lunch?", html)
+        self.assertIn("1 new", html)
+        self.assertIn('id="unread-count"', html)
+
+        html = self.client.get(
+            f"/direct-messages/{self.ids['alice']}").get_data(as_text=True)
+        self.assertIn("lunch?", html)
+        self.assertEqual(self.unread("bob"), 0)
+
+        # opening the thread clears the navbar badge straight away
+        html = self.client.get("/direct-messages").get_data(as_text=True)
+        self.assertNotIn("1 new", html)
+        self.assertNotIn('id="unread-count"', html)
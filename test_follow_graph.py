@@ -0,0 +1,114 @@
+"""Follow graph cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_follow_graph.py
+
+
+import os
+from time import time
+from unittest import TestCase
+
+from models import db, User, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from follow_graph import FollowGraphCache, follow_cache
+from testing import QueryCountMixin
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class FollowGraphTestCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        """Set up a viewer who follows every other of ten users."""
+        User.query.delete()
+        follow_cache.clear()
+
+        users = [User(username=f"user{i}", email=f"user{i}@email.com",
+                      password="not-a-hash")
+                 for i in range(11)]
+        db.session.add_all(users)
+        db.session.flush()
+
+        viewer, others = users[0], users[1:]
+        viewer.following.extend(others[::2])
+        db.session.commit()
+
+        self.viewer_id = viewer.id
+        self.other_ids = [u.id for u in others]
+        self.followed_ids = set(self.other_ids[::2])
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_following_among(self):
+        """Batch lookups return exactly the followed candidates."""
+
+        cache = FollowGraphCache()
+        self.assertEqual(cache.following_among(self.viewer_id, self.other_ids),
+                         self.followed_ids)
+        self.assertTrue(cache.is_following(self.viewer_id,
+                                           self.other_ids[0]))
+        self.assertFalse(cache.is_following(self.viewer_id,
+                                            self.other_ids[1]))
+
+    def test_cached_lookups_skip_db(self):
+        """Once loaded, lookups don't hit the database."""
+
+        cache = FollowGraphCache()
+        cache.following_ids(self.viewer_id)
+
+        with self.assertMaxQueries(0):
+            cache.following_among(self.viewer_id, self.other_ids)
+
+    def test_fresh_after_reloads(self):
+        """A follow change newer than the cached list forces a reload."""
+
+        cache = FollowGraphCache()
+        cache.following_ids(self.viewer_id)
+
+        db.session.add(Follows(user_being_followed_id=self.other_ids[1],
+                               user_following_id=self.viewer_id))
+        db.session.commit()
+
+        self.assertFalse(cache.is_following(self.viewer_id,
+                                            self.other_ids[1]))
+        self.assertTrue(cache.is_following(self.viewer_id, self.other_ids[1],
+                                           fresh_after=time()))
+
+    def test_follow_route_updates_directory(self):
+        """Following someone is reflected on the next directory page."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+        self.client.get("/users")
+        self.client.post(f"/users/follow/{self.other_ids[1]}")
+        html = self.client.get("/users").get_data(as_text=True)
+
+        self.assertEqual(html.count("Unfollow"), len(self.followed_ids) + 1)
+
+    def test_model_checks(self):
+        """is_following / is_followed_by agree with the follows table."""
+
+        viewer = User.query.get(self.viewer_id)
+        followed = User.query.get(self.other_ids[0])
+        not_followed = User.query.get(self.other_ids[1])
+
+        self.assertTrue(viewer.is_following(followed))
+        self.assertFalse(viewer.is_following(not_followed))
+        self.assertTrue(followed.is_followed_by(viewer))
+        self.assertFalse(not_followed.is_followed_by(viewer))
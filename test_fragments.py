@@ -0,0 +1,188 @@
+"""Message card fragment cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_fragments.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from fragments import FragmentCache, fragment_cache, profile_version
+from timeline import rebuild_timelines
+from user_cache import user_cache
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class DictBackend:
+    """Shared backend kept in a dict, counting round trips."""
+
+    def __init__(self):
+        self.data = {}
+        self.calls = 0
+
+    def get_many(self, keys):
+        self.calls += 1
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set_many(self, items, ttl):
+        self.calls += 1
+        self.data.update(items)
+
+    def delete(self, keys):
+        self.calls += 1
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+        fragment_cache.clear()
+        user_cache.clear()
+
+        reader = User(username="reader", email="reader@email.com",
+                      password="not-a-hash")
+        author = User(username="author", email="author@email.com",
+                      password="not-a-hash")
+        db.session.add_all([reader, author])
+        db.session.flush()
+
+        db.session.add(Follows(user_being_followed_id=author.id,
+                               user_following_id=reader.id))
+        db.session.add_all([
+            Message(text="first warble", user_id=author.id),
+            Message(text="second warble", user_id=author.id),
+        ])
+        db.session.commit()
+        rebuild_timelines()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+
+        self.client = app.test_client()
+        self.login(self.reader_id)
+
+        self.cards_rendered = 0
+        render = FragmentCache._render
+
+        def count_render(cache, message):
+            self.cards_rendered += 1
+            return render(cache, message)
+
+        patcher = patch.object(FragmentCache, '_render', count_render)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_cards_rendered_once(self):
+        """Cards are rendered on the first view and reused after."""
+
+        first = self.client.get("/").get_data(as_text=True)
+        self.assertEqual(self.cards_rendered, 2)
+
+        second = self.client.get(f"/users/{self.author_id}").get_data(
+            as_text=True)
+        self.assertEqual(self.cards_rendered, 2)
+
+        for html in (first, second):
+            self.assertIn("first warble", html)
+            self.assertIn("@author", html)
+            self.assertNotIn("viewer-actions", html)
+
+    def test_viewer_parts_spliced_in(self):
+        """The like star comes from the viewer, not the cached card."""
+
+        msg = Message.query.filter_by(text="first warble").one()
+        self.client.get("/")
+
+        self.client.post(f"/messages/{msg.id}/likes")
+        html = self.client.get("/").get_data(as_text=True)
+
+        self.assertEqual(html.count("bi-star-fill"), 1)
+        self.assertEqual(self.cards_rendered, 2)
+
+    def test_profile_edit_invalidates(self):
+        self.client.get("/")
+
+        author = User.query.get(self.author_id)
+        author.username = "renamed"
+        db.session.commit()
+        user_cache.clear()
+
+        html = self.client.get("/").get_data(as_text=True)
+
+        self.assertIn("@renamed", html)
+        self.assertNotIn("@author", html)
+        self.assertEqual(self.cards_rendered, 4)
+
+    def test_message_delete_invalidates(self):
+        msg = Message.query.filter_by(text="first warble").one()
+        self.client.get(f"/users/{self.author_id}")
+        self.assertTrue(any(f":{msg.id}:" in key
+                            for key in fragment_cache._entries))
+
+        self.login(self.author_id)
+        self.client.post(f"/messages/{msg.id}/delete")
+
+        self.assertFalse(any(f":{msg.id}:" in key
+                             for key in fragment_cache._entries))
+
+    def test_message_delete_with_shared_backend(self):
+        backend = DictBackend()
+        msg = Message.query.filter_by(text="first warble").one()
+
+        with patch.object(fragment_cache, 'backend', backend):
+            self.client.get(f"/users/{self.author_id}")
+            self.assertEqual(len(backend.data), 2)
+
+            self.login(self.author_id)
+            resp = self.client.post(f"/messages/{msg.id}/delete")
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(any(f":{msg.id}:" in key for key in backend.data))
+        self.assertEqual(len(backend.data), 1)
+
+    def test_shared_backend(self):
+        """Workers fill and read the shared backend a page at a time."""
+
+        backend = DictBackend()
+        first = FragmentCache(backend=backend)
+        second = FragmentCache(backend=backend)
+        messages = Message.query.order_by(Message.id).all()
+
+        with app.test_request_context():
+            first.cards(messages)
+            self.assertEqual(self.cards_rendered, 2)
+            self.assertEqual(backend.calls, 2)
+
+            cards = second.cards(messages)
+            self.assertEqual(self.cards_rendered, 2)
+            self.assertEqual(backend.calls, 3)
+            self.assertIn("first warble", cards[0].render())
+
+            second.invalidate_message(
+                messages[0].id, profile_version(messages[0].user))
+            self.assertEqual(len(backend.data), 1)
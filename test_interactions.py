@@ -0,0 +1,145 @@
+"""Like and follow write tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_interactions.py
+
+
+import os
+from threading import Barrier, Thread
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app
+from interactions import like, unlike, follow, unfollow
+from testing import QueryCountMixin
+
+db.create_all()
+
+THREADS = 8
+ROUNDS = 25
+
+
+class InteractionsTestCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        User.query.delete()
+
+        fan = User(username="fan", email="fan@email.com",
+                   password="not-a-hash")
+        author = User(username="author", email="author@email.com",
+                      password="not-a-hash")
+        db.session.add_all([fan, author])
+        db.session.flush()
+
+        message = Message(text="hello", user_id=author.id)
+        db.session.add(message)
+        db.session.commit()
+
+        self.fan_id = fan.id
+        self.author_id = author.id
+        self.message_id = message.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def user(self, user_id):
+        return db.session.get(User, user_id, populate_existing=True)
+
+    def hammer(self, add, remove, *args):
+        """Run `add` and `remove` on the same row from many threads at once.
+
+        Returns (net change reported by the calls, errors raised).
+        """
+
+        barrier = Barrier(THREADS)
+        net = []
+        errors = []
+
+        def work(n):
+            with app.app_context():
+                barrier.wait()
+                for i in range(ROUNDS):
+                    write = add if (n + i) % 2 == 0 else remove
+                    try:
+                        changed = write(*args)
+                        db.session.commit()
+                    except Exception as exc:
+                        db.session.rollback()
+                        errors.append(exc)
+                    else:
+                        if changed:
+                            net.append(1 if write is add else -1)
+                db.session.remove()
+
+        threads = [Thread(target=work, args=(n,)) for n in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return sum(net), errors
+
+    def test_like_is_idempotent(self):
+        self.assertTrue(like(self.fan_id, self.message_id))
+        self.assertFalse(like(self.fan_id, self.message_id))
+        self.assertEqual(self.user(self.fan_id).likes_count, 1)
+
+        self.assertTrue(unlike(self.fan_id, self.message_id))
+        self.assertFalse(unlike(self.fan_id, self.message_id))
+        self.assertEqual(self.user(self.fan_id).likes_count, 0)
+
+        # own messages and missing messages can't be liked
+        self.assertFalse(like(self.author_id, self.message_id))
+        self.assertFalse(like(self.fan_id, 0))
+        self.assertEqual(Like.query.count(), 0)
+
+    def test_follow_is_idempotent(self):
+        self.assertTrue(follow(self.fan_id, self.author_id))
+        self.assertFalse(follow(self.fan_id, self.author_id))
+        self.assertFalse(follow(self.fan_id, self.fan_id))
+
+        self.assertEqual(self.user(self.fan_id).following_count, 1)
+        self.assertEqual(self.user(self.author_id).followers_count, 1)
+
+        self.assertTrue(unfollow(self.fan_id, self.author_id))
+        self.assertFalse(unfollow(self.fan_id, self.author_id))
+        self.assertEqual(self.user(self.author_id).followers_count, 0)
+
+    def test_single_statement(self):
+        """A like costs one statement, whether it changes anything or not."""
+
+        for write in (like, like, unlike, unlike):
+            with self.assertMaxQueries(1):
+                write(self.fan_id, self.message_id)
+
+        # plus the timeline backfill
+        with self.assertMaxQueries(3):
+            follow(self.fan_id, self.author_id)
+
+    def test_concurrent_likes(self):
+        net, errors = self.hammer(like, unlike, self.fan_id, self.message_id)
+
+        self.assertEqual(errors, [])
+        rows = Like.query.count()
+        self.assertEqual(rows, net)
+        self.assertEqual(self.user(self.fan_id).likes_count, rows)
+
+    def test_concurrent_follows(self):
+        net, errors = self.hammer(
+            follow, unfollow, self.fan_id, self.author_id)
+
+        self.assertEqual(errors, [])
+        rows = Follows.query.count()
+        self.assertEqual(rows, net)
+        self.assertEqual(self.user(self.fan_id).following_count, rows)
+        self.assertEqual(self.user(self.author_id).followers_count, rows)
@@ -0,0 +1,105 @@
+"""Bulk loader tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_load.py
+
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Message, Follows, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, create_app
+from load import load_all
+
+db.create_all()
+
+
+class LoadTestCase(TestCase):
+    def setUp(self):
+        """Write a tiny dataset to a scratch directory."""
+
+        self.dir = tempfile.mkdtemp()
+        files = {
+            'users.csv': (
+                "email,username,image_url,password,bio,header_image_url,"
+                "location\n"
+                "a@email.com,alice,/a.png,not-a-hash,\"Hi, I'm Alice\",,Here\n"
+                "b@email.com,bob,/b.png,not-a-hash,,,There\n"),
+            'messages.csv': (
+                "text,timestamp,user_id\n"
+                "first,2022-01-01 10:00:00,1\n"
+                "second,2022-01-02 10:00:00,1\n"),
+            'follows.csv': (
+                "user_being_followed_id,user_following_id\n"
+                "1,2\n"),
+        }
+        for name, contents in files.items():
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        db.session.rollback()
+
+    def test_load_all(self):
+        """Rows, sequences, counters and timelines are all in place."""
+
+        load_all(self.dir)
+
+        alice = User.query.filter_by(username="alice").one()
+        self.assertEqual(alice.bio, "Hi, I'm Alice")
+        self.assertEqual(alice.messages_count, 2)
+        self.assertEqual(alice.followers_count, 1)
+        self.assertEqual(Follows.query.count(), 1)
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=2).count(), 2)
+
+        # New rows get ids after the loaded ones
+        db.session.add(Message(text="third", user_id=alice.id))
+        db.session.commit()
+        self.assertEqual(Message.query.filter_by(text="third").one().id, 3)
+
+    def test_constraints_restored(self):
+        """Unique constraints dropped for the load are back afterwards."""
+
+        load_all(self.dir)
+
+        db.session.add(User(username="alice", email="new@email.com",
+                            password="not-a-hash"))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+
+    def test_production_profile(self):
+        """The loader stamps the schema without `flask db` having set up
+        Flask-Migrate."""
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        with patch.dict(os.environ, {'TEMPLATE_CACHE_DIR': cache_dir}):
+            prod = create_app('production')
+
+        # connect_db() points the shared `db` at the newest app
+        self.addCleanup(setattr, db, 'app', app)
+        self.addCleanup(lambda: db.get_engine(prod).dispose())
+        self.assertNotIn('migrate', prod.extensions)
+
+        with patch('load.app', prod):
+            load_all(self.dir)
+
+        self.assertEqual(User.query.count(), 2)
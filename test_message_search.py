@@ -0,0 +1,187 @@
+"""Message full-text search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_message_search.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from message_search import (
+    InvertedIndex, fulltext_enabled, message_index, search_messages,
+    _fulltext_urls)
+from pagination import decode_cursor
+
+db.create_all()
+
+
+class MessageSearchTestCase(TestCase):
+    def setUp(self):
+        """Two authors writing about birds; the reader follows one."""
+        User.query.delete()
+        message_index.clear()
+
+        reader = User(username="reader", email="reader@email.com",
+                      password="not-a-hash")
+        robin = User(username="robin", email="robin@email.com",
+                     password="not-a-hash")
+        wren = User(username="wren", email="wren@email.com",
+                    password="not-a-hash")
+        db.session.add_all([reader, robin, wren])
+        db.session.flush()
+
+        db.session.add(Follows(user_being_followed_id=robin.id,
+                               user_following_id=reader.id))
+        db.session.add_all([
+            Message(text="Birds singing birds singing birds", user_id=robin.id),
+            Message(text="A bird on the fence", user_id=wren.id),
+            Message(text="Watching birds in the garden", user_id=wren.id),
+            Message(text="Nothing to see here", user_id=robin.id),
+        ])
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.robin_id = robin.id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def texts(self, term, **kwargs):
+        return [msg.text for msg in search_messages(term, **kwargs)]
+
+    def check_search(self):
+        """Behaviour shared by the database and in-process searches."""
+
+        results = self.texts("birds")
+        self.assertEqual(results[0], "Birds singing birds singing birds")
+        self.assertIn("Watching birds in the garden", results)
+        self.assertNotIn("Nothing to see here", results)
+
+        self.assertEqual(self.texts("garden birds"),
+                         ["Watching birds in the garden"])
+        self.assertEqual(self.texts("hummingbird"), [])
+        self.assertEqual(self.texts("   "), [])
+
+        self.assertEqual(
+            self.texts("birds", author_id=self.robin_id),
+            ["Birds singing birds singing birds"])
+        self.assertEqual(
+            self.texts("birds", following_of=self.reader_id),
+            ["Birds singing birds singing birds"])
+
+        first = search_messages("birds", per_page=1)
+        self.assertTrue(first.has_next)
+        second = search_messages(
+            "birds", per_page=1, before=decode_cursor(first.next_cursor))
+        self.assertNotEqual(first.items, second.items)
+        self.assertEqual(
+            [msg.text for msg in first.items + second.items],
+            self.texts("birds")[:2])
+
+    def test_fulltext(self):
+        """Postgres search stems words and ranks repeated matches first."""
+
+        self.assertTrue(fulltext_enabled())
+        self.check_search()
+
+        # 'bird' matches 'birds' through stemming
+        self.assertEqual(len(self.texts("bird")), 3)
+
+    def test_search_windows(self):
+        """Matches are ranked a window at a time, newest window first, and
+        paging reaches every one of them."""
+
+        with patch('message_search.SEARCH_WINDOW', 2):
+            for per_page in (1, 2, 3):
+                texts = []
+                before = None
+                while True:
+                    page = search_messages(
+                        "birds", per_page=per_page, before=before)
+                    texts.extend(msg.text for msg in page)
+                    if not page.has_next:
+                        break
+                    before = decode_cursor(page.next_cursor)
+
+                self.assertEqual(texts, [
+                    "Watching birds in the garden",
+                    "A bird on the fence",
+                    "Birds singing birds singing birds",
+                ])
+
+    def test_following_no_one(self):
+        reader = User(username="loner", email="loner@email.com",
+                      password="not-a-hash")
+        db.session.add(reader)
+        db.session.commit()
+
+        self.assertEqual(self.texts("birds", following_of=reader.id), [])
+
+    def test_without_search_vector(self):
+        """Postgres without the search_vector column still searches in the
+        database, not through the in-process index."""
+
+        with patch('message_search.fulltext_enabled', return_value=False):
+            self.check_search()
+            self.assertEqual(len(self.texts("bird")), 3)
+
+        self.assertIsNone(message_index.loaded_at)
+
+    def test_missing_column_not_cached(self):
+        """A worker that looked before the column existed sees it later."""
+
+        _fulltext_urls.clear()
+        with patch('message_search.db.session.execute') as execute:
+            execute.return_value.first.return_value = None
+            self.assertFalse(fulltext_enabled())
+
+        self.assertTrue(fulltext_enabled())
+
+    def test_fallback(self):
+        """The in-process index behaves the same, minus stemming."""
+
+        with patch('message_search.message_fallback', return_value=True):
+            self.check_search()
+
+            msg = Message(text="birds again", user_id=self.robin_id)
+            db.session.add(msg)
+            db.session.commit()
+            message_index.add(msg.id, msg.text)
+            self.assertIn("birds again", self.texts("birds"))
+
+    def test_inverted_index(self):
+        index = InvertedIndex()
+        self.assertEqual(len(index.search("birds")), 2)
+
+        msg = Message.query.filter_by(text="Nothing to see here").one()
+        index.remove(msg.id)
+        self.assertEqual(index.search("nothing"), {})
+
+    def test_search_page(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+        html = self.client.get(
+            "/messages/search?q=birds&author=wren").get_data(as_text=True)
+
+        self.assertIn("Watching birds in the garden", html)
+        self.assertNotIn("Birds singing", html)
+
+        html = self.client.get(
+            "/messages/search?q=birds&author=nobody").get_data(as_text=True)
+        self.assertIn("No warbles match", html)
@@ -8,7 +8,8 @@
 import os
 from unittest import TestCase
 
-from models import db, Message, User
+from models import db, Message, User, Like
+from testing import QueryCountMixin, QueryCounter
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -66,6 +67,19 @@ class MessageAddViewTestCase(MessageBaseViewTestCase):
             self.assertEqual(resp.status_code, 302)
             self.assertEqual(len(message.text), 5)
 
+    def test_add_message_skips_author_messages(self):
+        """Posting doesn't load the author's other messages."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+        with QueryCounter(db.engine) as counter:
+            self.client.post("/messages/new", data={"text": "Hello"})
+
+        # The lazy load of `user.messages`
+        self.assertFalse([sql for sql in counter.statements
+                          if "= messages.user_id" in sql])
+
     def test_add_message_when_logged_out(self):
         """ Test that a user cannot add a message when logged out."""
 
@@ -102,4 +116,57 @@ class MessageDeleteViewTestCase(MessageBaseViewTestCase):
 
         html = resp.get_data(as_text=True)
         self.assertEqual(resp.status_code, 200)
-        self.assertIn("Access unauthorized", html)
\ No newline at end of file
+        self.assertIn("Access unauthorized", html)
+
+
+class MessageLikeViewTestCase(QueryCountMixin, MessageBaseViewTestCase):
+    def setUp(self):
+        """Add a second user, u2, who likes many messages."""
+        super().setUp()
+
+        u2 = User(username="u2", email="u2@email.com", password="not-a-hash")
+        db.session.add(u2)
+        db.session.flush()
+
+        others = [Message(text=f"other-{i}", user_id=self.u1_id)
+                  for i in range(200)]
+        db.session.add_all(others)
+        db.session.flush()
+        db.session.add_all([Like(user_id=u2.id, message_id=m.id)
+                            for m in others])
+        db.session.commit()
+
+        self.u2_id = u2.id
+
+    def test_like_toggle(self):
+        """Liking twice adds then removes the like."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u2_id
+
+        self.client.post(f"/messages/{self.m1_id}/likes")
+        self.assertIsNotNone(Like.query.get((self.u2_id, self.m1_id)))
+
+        self.client.post(f"/messages/{self.m1_id}/likes")
+        self.assertIsNone(Like.query.get((self.u2_id, self.m1_id)))
+
+    def test_like_does_not_load_all_likes(self):
+        """Toggling costs the same however many likes the user has."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u2_id
+
+        with self.assertMaxQueries(6) as queries:
+            self.client.post(f"/messages/{self.m1_id}/likes")
+
+        self.assertFalse(any("JOIN likes" in sql or "FROM messages, likes" in sql
+                             for sql in queries.statements))
+
+    def test_cannot_like_own_message(self):
+        """Authors can't like their own messages."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+        self.client.post(f"/messages/{self.m1_id}/likes")
+        self.assertIsNone(Like.query.get((self.u1_id, self.m1_id)))
@@ -0,0 +1,94 @@
+"""Request metrics tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_metrics.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from models import db, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from metrics import DB_QUERIES, REQUEST_LATENCY
+
+db.create_all()
+
+
+def sample(histogram, suffix, **labels):
+    """Current value of one series of `histogram`, or 0 if unset."""
+
+    for metric in histogram.collect():
+        for s in metric.samples:
+            if s.name.endswith(suffix) and s.labels == {
+                    **s.labels, **labels}:
+                return s.value
+    return 0
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        db.session.commit()
+        self.u1_id = u1.id
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_request_is_recorded(self):
+        """A request adds its latency and SQL count to its route's series."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+        requests_before = sample(REQUEST_LATENCY, '_count',
+                                 endpoint='show_user', status='200')
+        queries_before = sample(DB_QUERIES, '_sum', endpoint='show_user')
+
+        self.client.get(f"/users/{self.u1_id}")
+
+        self.assertEqual(
+            sample(REQUEST_LATENCY, '_count',
+                   endpoint='show_user', status='200'),
+            requests_before + 1)
+        self.assertGreater(sample(DB_QUERIES, '_sum', endpoint='show_user'),
+                           queries_before)
+
+    def test_metrics_endpoint(self):
+        """/metrics serves the Prometheus text format."""
+
+        self.client.get("/")
+        resp = self.client.get("/metrics")
+        text = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("text/plain", resp.content_type)
+        self.assertIn('warbler_request_duration_seconds_count{'
+                      'endpoint="homepage",method="GET",status="200"}', text)
+        self.assertIn('warbler_request_render_seconds_bucket', text)
+
+    def test_failed_statement_clears_start_time(self):
+        """A statement that fails leaves nothing on the pooled connection."""
+
+        with db.engine.connect() as connection:
+            with self.assertRaises(ProgrammingError):
+                connection.execute(text("SELECT * FROM no_such_table"))
+
+            self.assertEqual(connection.info.get('query_start'), [])
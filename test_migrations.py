@@ -0,0 +1,106 @@
+"""Schema migration tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_migrations.py
+
+
+import os
+from unittest import TestCase
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import text
+
+from models import db
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app
+
+db.create_all()
+
+# Migrations run in their own schema, next to the tables the tests use
+SCHEMA = 'migration_check'
+
+
+class MigrationTestCase(TestCase):
+    def setUp(self):
+        self.connection = db.engine.connect()
+        self.connection.execute(text(
+            f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}"))
+        self.connection.execute(text(f"SET search_path TO {SCHEMA}"))
+
+    def tearDown(self):
+        self.connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        # Don't hand the changed search_path back to the pool
+        self.connection.invalidate()
+        self.connection.close()
+
+    def run_command(self, name, revision):
+        with app.app_context():
+            config = app.extensions['migrate'].migrate.get_config()
+            config.attributes['connection'] = self.connection
+            getattr(command, name)(config, revision)
+
+    def diff(self):
+        """Differences between the migrated schema and the models."""
+
+        context = MigrationContext.configure(self.connection)
+        return [change for change in compare_metadata(context, db.metadata)
+                # only made by migrations (see migrations/env.py)
+                if 'search_vector' not in str(change)
+                and 'ix_users_username' not in str(change)]
+
+    def index_names(self):
+        return {name for name, in self.connection.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = :schema"),
+            {"schema": SCHEMA})}
+
+    def test_upgrade_matches_models(self):
+        self.run_command('upgrade', 'head')
+
+        self.assertEqual(self.diff(), [])
+        self.assertIn('ix_likes_message_id', self.index_names())
+        self.assertIn('ix_messages_search_vector', self.index_names())
+
+    def test_downgrade_and_upgrade(self):
+        self.run_command('upgrade', 'head')
+        self.run_command('downgrade', '0001')
+
+        self.assertNotIn('ix_follows_user_following_id', self.index_names())
+
+        self.run_command('upgrade', 'head')
+        self.assertEqual(self.diff(), [])
+
+    def test_upgrade_original_schema(self):
+        """Rows from before migrations get the later columns' defaults."""
+
+        self.run_command('upgrade', '0001')
+        self.connection.execute(text(
+            "INSERT INTO users (email, username, password) "
+            "VALUES ('old@email.com', 'old', 'not-a-hash')"))
+        self.run_command('upgrade', 'head')
+
+        self.assertEqual(self.diff(), [])
+        row = self.connection.execute(text(
+            "SELECT followers_count, unread_count, timeline_pulled, "
+            "updated_at IS NOT NULL FROM users")).one()
+        self.assertEqual(tuple(row), (0, 0, False, True))
+
+    def test_stamped_create_all_database(self):
+        """A database made by create_all() can be stamped and upgraded."""
+
+        db.metadata.create_all(self.connection)
+        self.run_command('stamp', '0001')
+        self.run_command('upgrade', 'head')
+
+        self.assertEqual(self.diff(), [])
@@ -0,0 +1,131 @@
+"""Keyset pagination tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_pagination.py
+
+
+import os
+import re
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY, USERS_PER_PAGE
+from pagination import encode_cursor, decode_cursor, paginate
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class CursorTestCase(TestCase):
+    def test_round_trip(self):
+        """Cursors decode back to the values they were built from."""
+
+        values = (datetime(2022, 8, 1, 12, 30, 15, 500), 42)
+        self.assertEqual(decode_cursor(encode_cursor(values)), values)
+
+    def test_malformed_cursor(self):
+        """Garbage cursors raise ValueError."""
+
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor!")
+
+
+class PaginateTestCase(TestCase):
+    def setUp(self):
+        """Set up a user with five messages a minute apart."""
+        User.query.delete()
+
+        # Bulk users skip signup's password hashing; they never log in
+        db.session.add_all([
+            User(username=f"user{i:03}", email=f"user{i:03}@email.com",
+                 password="not-a-hash")
+            for i in range(USERS_PER_PAGE + 5)
+        ])
+        db.session.flush()
+
+        user = User.query.filter_by(username="user000").one()
+        now = datetime.utcnow()
+        db.session.add_all([
+            Message(text=f"msg-{i}", user_id=user.id,
+                    timestamp=now - timedelta(minutes=i))
+            for i in range(5)
+        ])
+        db.session.commit()
+
+        self.user_id = user.id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_pages_follow_on(self):
+        """Walking the cursors visits every row once, newest first."""
+
+        query = Message.query.filter_by(user_id=self.user_id)
+        columns = (Message.timestamp, Message.id)
+
+        first = paginate(query, columns, per_page=2)
+        second = paginate(query, columns, per_page=2,
+                          before=decode_cursor(first.next_cursor))
+        third = paginate(query, columns, per_page=2,
+                         before=decode_cursor(second.next_cursor))
+
+        texts = [m.text for page in (first, second, third) for m in page]
+        self.assertEqual(texts, [f"msg-{i}" for i in range(5)])
+        self.assertFalse(third.has_next)
+
+    def test_user_directory_load_more(self):
+        """The directory links to a second page with the remaining users."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        resp = self.client.get("/users")
+        html = resp.get_data(as_text=True)
+        self.assertIn("@user000", html)
+        self.assertNotIn(f"@user{USERS_PER_PAGE:03}", html)
+
+        next_url = re.search(r'href="([^"]*before=[^"]*)"', html).group(1)
+        resp = self.client.get(next_url.replace("&amp;", "&"))
+        html = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(f"@user{USERS_PER_PAGE:03}", html)
+        self.assertNotIn("@user000", html)
+        self.assertNotIn("Load more", html)
+
+    def test_load_more_keeps_query_args(self):
+        """Query arguments named like url_for()'s keywords pass through."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        resp = self.client.get("/users?endpoint=x&_external=1&_anchor=y")
+        html = resp.get_data(as_text=True)
+        self.assertEqual(resp.status_code, 200)
+
+        next_url = re.search(r'href="([^"]*before=[^"]*)"', html).group(1)
+        self.assertTrue(next_url.startswith(
+            "/users?endpoint=x&amp;_external=1&amp;_anchor=y&amp;before="))
+
+    def test_bad_cursor_is_400(self):
+        """A tampered cursor is rejected rather than ignored."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        resp = self.client.get(f"/users/{self.user_id}?before=garbage")
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,94 @@
+"""Connection pool settings and metrics tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_pooling.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import create_engine, exc, text
+
+from models import db
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app
+from metrics import (
+    DB_POOL_CHECKOUT, DB_POOL_IN_USE, DB_POOL_TIMEOUTS, DB_POOL_WAITS)
+from pooling import (
+    MeteredNullPool, MeteredQueuePool, engine_options, pool_config)
+from test_metrics import sample
+
+db.create_all()
+
+URL = "postgresql:///warbler_test"
+
+
+class PoolingTestCase(TestCase):
+    def test_settings_from_environment(self):
+        config = pool_config({
+            'DB_POOL_SIZE': '8', 'DB_MAX_OVERFLOW': '0',
+            'DB_POOL_TIMEOUT': '2.5', 'DB_POOL_PRE_PING': '1'})
+
+        self.assertEqual(engine_options(config, 'primary'), {
+            'poolclass': MeteredQueuePool, 'pool_logging_name': 'primary',
+            'pool_size': 8, 'max_overflow': 0, 'pool_timeout': 2.5,
+            'pool_pre_ping': True})
+
+        # SQLAlchemy's defaults when nothing is set
+        self.assertEqual(engine_options(pool_config({}), 'primary'), {
+            'poolclass': MeteredQueuePool, 'pool_logging_name': 'primary'})
+
+    def test_pgbouncer_mode(self):
+        """Behind pgbouncer each checkout is a fresh client connection."""
+
+        config = pool_config({'DB_PGBOUNCER': '1', 'DB_POOL_SIZE': '8'})
+        engine = create_engine(URL, **engine_options(config, 'bouncer'))
+        self.addCleanup(engine.dispose)
+        self.assertIsInstance(engine.pool, MeteredNullPool)
+
+        pids = set()
+        for _ in range(2):
+            with engine.connect() as connection:
+                pids.add(connection.execute(
+                    text("SELECT pg_backend_pid()")).scalar())
+        self.assertEqual(len(pids), 2)
+        self.assertEqual(sample(DB_POOL_IN_USE, '', pool='bouncer'), 0)
+
+    def test_checkout_metrics(self):
+        config = pool_config({'DB_POOL_SIZE': '1', 'DB_MAX_OVERFLOW': '0',
+                              'DB_POOL_TIMEOUT': '0.1'})
+        engine = create_engine(URL, **engine_options(config, 'small'))
+        self.addCleanup(engine.dispose)
+
+        connection = engine.connect()
+        self.assertEqual(sample(DB_POOL_IN_USE, '', pool='small'), 1)
+
+        with self.assertRaises(exc.TimeoutError):
+            engine.connect()
+        connection.close()
+
+        self.assertEqual(sample(DB_POOL_IN_USE, '', pool='small'), 0)
+        self.assertEqual(sample(DB_POOL_WAITS, '_total', pool='small'), 1)
+        self.assertEqual(sample(DB_POOL_TIMEOUTS, '_total', pool='small'), 1)
+        self.assertEqual(sample(DB_POOL_CHECKOUT, '_count', pool='small'), 2)
+        self.assertGreaterEqual(
+            sample(DB_POOL_CHECKOUT, '_sum', pool='small'), 0.1)
+
+    def test_app_pools_are_named(self):
+        self.assertIsInstance(db.engine.pool, MeteredQueuePool)
+        self.assertEqual(db.engine.pool.logging_name, 'primary')
+
+        with app.test_client() as client:
+            client.get("/")
+        self.assertGreater(
+            sample(DB_POOL_CHECKOUT, '_count', pool='primary'), 0)
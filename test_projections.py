@@ -0,0 +1,151 @@
+"""Read-only listing row tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_projections.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, Like
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from caching import user_stamp
+from pagination import decode_cursor
+from projections import AuthorRow, MessageRow, UserRow
+from queries import (
+    all_users, home_feed, liked_messages, profile_messages, user_followers)
+from timeline import rebuild_timelines
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class ProjectionsTestCase(TestCase):
+    def setUp(self):
+        """A reader who follows and likes the messages of two authors."""
+        User.query.delete()
+
+        reader = User(username="reader", email="reader@email.com",
+                      password="not-a-hash")
+        authors = [User(username=f"author{i}", email=f"author{i}@email.com",
+                        password="not-a-hash")
+                   for i in range(2)]
+        db.session.add(reader)
+        db.session.add_all(authors)
+        db.session.flush()
+
+        reader.following.extend(authors)
+        messages = [Message(text=f"{author.username}-{n}", user_id=author.id)
+                    for author in authors for n in range(3)]
+        db.session.add_all(messages)
+        db.session.flush()
+
+        db.session.add_all([Like(user_id=reader.id, message_id=msg.id)
+                            for msg in messages])
+        db.session.commit()
+        rebuild_timelines()
+
+        self.reader_id = reader.id
+        self.author_ids = [author.id for author in authors]
+
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def assertNothingLoaded(self):
+        self.assertEqual(len(db.session.identity_map), 0)
+
+    def test_message_rows(self):
+        page = profile_messages(self.author_ids[0], per_page=2)
+        self.assertNothingLoaded()
+
+        first, second = page.items
+        self.assertIsInstance(first, MessageRow)
+        self.assertEqual(first.user, AuthorRow(
+            self.author_ids[0], "author0", User.image_url.default.arg))
+        # One author row per author
+        self.assertIs(first.user, second.user)
+        self.assertEqual([msg.text for msg in page],
+                         ["author0-2", "author0-1"])
+
+        rest = profile_messages(self.author_ids[0], before=(
+            second.timestamp, second.id))
+        self.assertEqual([msg.text for msg in rest], ["author0-0"])
+
+    def test_home_feed(self):
+        feed = [msg.id for msg in home_feed(self.reader_id)]
+        self.assertNothingLoaded()
+        self.assertEqual(len(feed), 6)
+
+        # Pulled from celebrity authors instead of the timeline entries
+        with patch('timeline.CELEBRITY_FOLLOWER_THRESHOLD', 0):
+            pulled = [msg.id for msg in home_feed(self.reader_id)]
+        self.assertEqual(pulled, feed)
+
+    def test_liked_messages(self):
+        liked = liked_messages(self.reader_id, per_page=4)
+        self.assertNothingLoaded()
+        self.assertEqual(len(liked), 4)
+        self.assertTrue(liked.has_next)
+
+        rest = liked_messages(self.reader_id, per_page=4,
+                              before=decode_cursor(liked.next_cursor))
+        self.assertEqual(len({msg.id for msg in liked.items + rest.items}), 6)
+
+    def test_liked_messages_order(self):
+        """Most recently liked first, however old the message."""
+
+        oldest = Message.query.filter_by(text="author0-0").one()
+        Like.query.filter_by(message_id=oldest.id).update(
+            {'created_at': datetime.utcnow() + timedelta(minutes=1)})
+        db.session.commit()
+
+        first = liked_messages(self.reader_id, per_page=1).items[0]
+        self.assertEqual(first.text, "author0-0")
+
+    def test_user_rows(self):
+        followers = user_followers(self.author_ids[0])
+        self.assertNothingLoaded()
+
+        reader, = followers.items
+        self.assertIsInstance(reader, UserRow)
+        self.assertEqual(reader.username, "reader")
+        self.assertEqual(user_stamp(reader),
+                         user_stamp(db.session.get(User, self.reader_id)))
+
+        first = all_users(per_page=2)
+        rest = all_users(before=(first.items[-1].id,), per_page=2)
+        self.assertEqual([user.id for user in [*first, *rest]],
+                         [self.reader_id, *self.author_ids])
+
+    def test_listing_pages(self):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+        for url, expected in (
+                ("/", "author1-2"),
+                (f"/users/{self.reader_id}/liked-messages", "author0-0"),
+                (f"/users/{self.author_ids[0]}", "author0-1"),
+                (f"/users/{self.author_ids[0]}/followers", "@reader"),
+                (f"/users/{self.reader_id}/following", "@author1"),
+                ("/users", "@author0"),
+                ("/users?q=auth", "@author1")):
+            resp = client.get(url)
+            self.assertEqual(resp.status_code, 200, url)
+            self.assertIn(expected, resp.get_data(as_text=True), url)
@@ -0,0 +1,167 @@
+"""Account deletion and purge tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_purge.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import (
+    db, User, Message, Follows, Like, DirectMessage, Conversation,
+    TimelineEntry)
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from counters import reconcile_counters
+from direct_messages import send_direct_message
+from interactions import follow, like
+from purge import purge_user, users_to_purge
+from testing import QueryCounter
+from timeline import rebuild_timelines
+from user_cache import user_cache
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class PurgeTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+        user_cache.clear()
+
+        self.ids = {}
+        for name in ("leaver", "alice", "bob"):
+            user = User.signup(name, f"{name}@email.com", "password", None)
+            db.session.flush()
+            self.ids[name] = user.id
+        leaver, alice, bob = self.ids.values()
+
+        db.session.add_all(
+            [Message(text=f"warble {n}", user_id=leaver) for n in range(5)]
+            + [Message(text="alice's warble", user_id=alice)])
+        db.session.commit()
+        reconcile_counters()
+
+        follow(leaver, alice)
+        follow(alice, leaver)
+        follow(bob, leaver)
+        for message in Message.query.all():
+            like(alice if message.user_id == leaver else leaver, message.id)
+        send_direct_message(leaver, alice, "hi", "hello")
+        send_direct_message(leaver, bob, "hi", "hello")
+        send_direct_message(bob, leaver, "hi", "hello")
+        db.session.commit()
+        rebuild_timelines()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = leaver
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def assertGone(self, user_id):
+        """No trace of the user is left and every counter is right."""
+
+        self.assertIsNone(db.session.get(User, user_id))
+        for model, column in (
+                (Message, Message.user_id),
+                (Like, Like.user_id),
+                (Follows, Follows.user_being_followed_id),
+                (Follows, Follows.user_following_id),
+                (DirectMessage, DirectMessage.user_id_from),
+                (DirectMessage, DirectMessage.user_id_to),
+                (Conversation, Conversation.other_user_id),
+                (TimelineEntry, TimelineEntry.author_id)):
+            self.assertEqual(model.query.filter(column == user_id).count(),
+                             0, column)
+
+        self.assertEqual(reconcile_counters(), 0)
+
+    def test_small_account_deleted_at_once(self):
+        """The database cascades the delete; nothing is loaded for it, only
+        the followers' timeline entries counted."""
+
+        with QueryCounter(db.engine) as counter:
+            resp = self.client.post("/users/delete")
+        self.assertEqual(resp.status_code, 302)
+
+        for statement in counter.statements:
+            self.assertFalse(
+                statement.startswith("SELECT")
+                and "FROM users" not in statement
+                and "count(*)" not in statement, statement)
+
+        self.assertGone(self.ids["leaver"])
+        alice = db.session.get(User, self.ids["alice"])
+        self.assertEqual((alice.followers_count, alice.likes_count,
+                          alice.unread_count), (0, 0, 0))
+
+    @patch('purge.PURGE_INLINE_LIMIT', 5)
+    def test_large_account_hidden_then_purged(self):
+        leaver = self.ids["leaver"]
+        other = app.test_client()
+        with other.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.ids["alice"]
+
+        self.client.post("/users/delete")
+
+        self.assertEqual(users_to_purge(), [leaver])
+        self.assertEqual(other.get(f"/users/{leaver}").status_code, 404)
+        self.assertNotIn(
+            "leaver", other.get("/users?q=leav").get_data(as_text=True))
+
+        # Gone from the pages of those who follow or are followed by them
+        self.assertNotIn("warble 0", other.get("/").get_data(as_text=True))
+        self.assertNotIn("@leaver", other.get(
+            f"/users/{self.ids['alice']}/following").get_data(as_text=True))
+        self.assertNotIn("@leaver", other.get(
+            f"/users/{self.ids['alice']}/followers").get_data(as_text=True))
+        self.assertNotIn("warble 0", other.get(
+            "/messages/search?q=warble").get_data(as_text=True))
+        message = Message.query.filter_by(user_id=leaver).first()
+        self.assertEqual(
+            other.get(f"/messages/{message.id}").status_code, 404)
+        self.assertFalse(User.authenticate("leaver", "password"))
+
+        steps = []
+        purge_user(leaver, batch_size=2,
+                   progress=lambda step, done: steps.append((step, done)))
+
+        self.assertGone(leaver)
+        self.assertEqual(users_to_purge(), [])
+        self.assertIn(('messages', 2), steps)
+        self.assertIn(('messages', 5), steps)
+        # Alice's and Bob's copies of the five messages, two at a time
+        self.assertIn(('timeline copies', 2), steps)
+        self.assertIn(('timeline copies', 10), steps)
+
+    @patch('purge.PURGE_INLINE_LIMIT', 12)
+    def test_timeline_copies_count_towards_size(self):
+        """5 messages, 3 follows and 1 like, plus 10 timeline entries."""
+
+        self.client.post("/users/delete")
+
+        self.assertEqual(users_to_purge(), [self.ids["leaver"]])
+
+    @patch('purge.PURGE_INLINE_LIMIT', 5)
+    def test_purge_command(self):
+        self.client.post("/users/delete")
+
+        result = app.test_cli_runner().invoke(
+            args=['purge-users', '--batch-size', '2'])
+
+        self.assertIn("Done: 1 users purged.", result.output)
+        self.assertGone(self.ids["leaver"])
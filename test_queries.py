@@ -0,0 +1,98 @@
+"""Query budget tests for listing pages."""
+
+# run these tests like:
+#
+#    python -m unittest test_queries.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Like
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from testing import QueryCountMixin
+from timeline import rebuild_timelines
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+NUM_AUTHORS = 10
+MESSAGES_PER_AUTHOR = 5
+
+
+class ListingQueriesTestCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        """Set up a reader who follows and likes posts by ten authors."""
+        User.query.delete()
+
+        reader = User(username="reader", email="reader@email.com",
+                      password="not-a-hash")
+        authors = [User(username=f"author{i}", email=f"author{i}@email.com",
+                        password="not-a-hash")
+                   for i in range(NUM_AUTHORS)]
+        db.session.add(reader)
+        db.session.add_all(authors)
+        db.session.flush()
+
+        reader.following.extend(authors)
+        messages = [Message(text=f"{author.username}-{n}", user_id=author.id)
+                    for author in authors
+                    for n in range(MESSAGES_PER_AUTHOR)]
+        db.session.add_all(messages)
+        db.session.flush()
+
+        db.session.add_all([Like(user_id=reader.id, message_id=msg.id)
+                            for msg in messages[::2]])
+        db.session.commit()
+        rebuild_timelines()
+
+        self.reader_id = reader.id
+        self.author_id = authors[0].id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+        # Expire loaded objects so each request starts from a cold session
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_homepage_queries(self):
+        """The home feed loads all fifty authors and likes in bulk."""
+
+        with self.assertMaxQueries(5):
+            resp = self.client.get("/")
+
+        html = resp.get_data(as_text=True)
+        self.assertIn("@author9", html)
+        self.assertEqual(html.count("bi-star-fill"),
+                         NUM_AUTHORS * MESSAGES_PER_AUTHOR // 2)
+
+    def test_liked_messages_queries(self):
+        """The liked page loads authors with the messages."""
+
+        with self.assertMaxQueries(4):
+            resp = self.client.get(f"/users/{self.reader_id}/liked-messages")
+
+        self.assertIn("@author9", resp.get_data(as_text=True))
+
+    def test_profile_queries(self):
+        """A profile page doesn't load anything per message."""
+
+        with self.assertMaxQueries(5):
+            resp = self.client.get(f"/users/{self.author_id}")
+
+        self.assertIn("author0-4", resp.get_data(as_text=True))
@@ -0,0 +1,224 @@
+"""Query plan regression tests.
+
+Each hot route is requested against a seeded database, and every statement
+it sends is run through EXPLAIN with sequential scans (and hash and merge
+joins) disabled. Postgres then only reads a whole table, by a Seq Scan or
+by walking an index that doesn't lead with a filtered column, when no
+index can serve the query; so a missing or unusable index fails the test
+instead of surfacing as a slow page.
+"""
+
+# run these tests like:
+#
+#    python -m unittest test_query_plans.py
+
+
+import os
+import random
+import re
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from sqlalchemy import text
+
+from models import db, User, Message, Follows, Like, DirectMessage
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from counters import reconcile_counters
+from direct_messages import rebuild_conversations
+from testing import QueryCounter
+from timeline import rebuild_timelines
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+USERS = 200
+MESSAGES = 4000
+FOLLOWS_PER_USER = 15
+LIKES = 4000
+DIRECT_MESSAGES = 1000
+
+
+def seed():
+    """A few thousand rows of everything, with statistics gathered."""
+
+    rng = random.Random(20)
+    start = datetime(2022, 1, 1)
+
+    User.query.delete()
+    db.session.execute(User.__table__.insert(), [
+        {"id": n, "username": f"user{n}", "email": f"user{n}@email.com",
+         "password": "not-a-hash"}
+        for n in range(1, USERS + 1)])
+    db.session.execute(Message.__table__.insert(), [
+        {"id": n, "text": f"warble {n}", "user_id": rng.randint(1, USERS),
+         "timestamp": start + timedelta(minutes=n)}
+        for n in range(1, MESSAGES + 1)])
+    db.session.execute(Follows.__table__.insert(), [
+        {"user_following_id": user_id, "user_being_followed_id": followed}
+        for user_id in range(1, USERS + 1)
+        for followed in rng.sample(
+            [n for n in range(1, USERS + 1) if n != user_id],
+            FOLLOWS_PER_USER)])
+    db.session.execute(Like.__table__.insert(), [
+        {"user_id": user_id, "message_id": message_id}
+        for user_id, message_id in {
+            (rng.randint(1, USERS), rng.randint(1, MESSAGES))
+            for _ in range(LIKES)}])
+    db.session.execute(DirectMessage.__table__.insert(), [
+        {"user_id_from": rng.randint(2, USERS), "user_id_to": 1,
+         "subject": "hi", "text": "hello",
+         "timestamp": start + timedelta(minutes=n)}
+        for n in range(DIRECT_MESSAGES)])
+    db.session.commit()
+
+    for table in ('users', 'messages', 'directmessages'):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT max(id) FROM {table}))"))
+    db.session.commit()
+
+    rebuild_conversations()
+    rebuild_timelines()
+    reconcile_counters()
+
+    with db.engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def leading_columns():
+    """Index name -> its first column (None for expression indexes)."""
+
+    return dict(db.session.execute(text(
+        "SELECT c.relname, a.attname FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "LEFT JOIN pg_attribute a "
+        "ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]")).all())
+
+
+def full_scans(plan, leading, limited=False):
+    """Tables an EXPLAIN JSON plan reads in full.
+
+    That's a Seq Scan, or an index scan whose condition (if any) doesn't
+    constrain the index's first column, so the whole index is walked;
+    unless a Limit above it stops the scan early.
+    """
+
+    found = []
+    node = plan.get("Node Type")
+    limited = limited or node == "Limit"
+
+    if node == "Seq Scan":
+        found.append(plan["Relation Name"])
+    elif node in ("Index Scan", "Index Only Scan", "Bitmap Index Scan"):
+        column = leading.get(plan["Index Name"])
+        condition = plan.get("Index Cond", "")
+        if (column and not re.search(rf"\b{column}\b", condition)
+                and not limited):
+            found.append(plan["Index Name"])
+
+    for child in plan.get("Plans", ()):
+        found.extend(full_scans(child, leading, limited))
+    return found
+
+
+class QueryPlanTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        seed()
+        cls.leading = leading_columns()
+
+    def setUp(self):
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+        self.other_id = 2
+        self.message_id = (Message.query.filter(Message.user_id != 1)
+                           .order_by(Message.id.desc()).first().id)
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def explain(self, statement, parameters):
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            # Also steer joins to nested loops, which need an index on the
+            # inner side; hash and merge joins over a few hundred rows
+            # would read whole tables whatever the indexes
+            for setting in ('seqscan', 'hashjoin', 'mergejoin'):
+                cursor.execute(f"SET enable_{setting} = off")
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+            return cursor.fetchone()[0][0]["Plan"]
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def assertIndexed(self, method, url):
+        """Every statement run by the request can be served by an index."""
+
+        with QueryCounter(db.engine) as counter:
+            resp = getattr(self.client, method)(url)
+        self.assertLess(resp.status_code, 400, url)
+
+        for statement, parameters in zip(counter.statements,
+                                         counter.parameters):
+            verb = statement.lstrip().split(None, 1)[0].upper()
+            if verb not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+                continue
+            if 'information_schema' in statement or 'pg_' in statement:
+                continue
+
+            tables = full_scans(self.explain(statement, parameters),
+                                self.leading)
+            self.assertEqual(
+                tables, [],
+                f"{method.upper()} {url} reads all of {tables}:\n"
+                f"{statement}")
+
+    def test_home(self):
+        self.assertIndexed('get', "/")
+
+    def test_profile_pages(self):
+        self.assertIndexed('get', f"/users/{self.other_id}")
+        self.assertIndexed('get', f"/users/{self.other_id}/following")
+        self.assertIndexed('get', f"/users/{self.other_id}/followers")
+        self.assertIndexed('get', f"/users/{self.other_id}/liked-messages")
+
+    def test_message_pages(self):
+        self.assertIndexed('get', f"/messages/{self.message_id}")
+        self.assertIndexed('get', "/messages/search?q=warble&author=user2")
+        self.assertIndexed('get', "/messages/search?q=warble&following=1")
+
+    def test_user_search(self):
+        self.assertIndexed('get', "/users?q=us")
+        self.assertIndexed('get', "/users/autocomplete?q=us")
+
+    def test_direct_messages(self):
+        self.assertIndexed('get', "/direct-messages")
+        self.assertIndexed('get', f"/direct-messages/{self.other_id}")
+
+    def test_likes_and_follows(self):
+        self.assertIndexed('post', f"/api/messages/{self.message_id}/like")
+        self.assertIndexed('delete', f"/api/messages/{self.message_id}/like")
+        self.assertIndexed('delete', f"/api/users/{self.other_id}/follow")
+        self.assertIndexed('post', f"/api/users/{self.other_id}/follow")
+
+    def test_delete_message(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.other_id
+        message = Message.query.filter_by(user_id=self.other_id).first()
+
+        self.assertIndexed('post', f"/messages/{message.id}/delete")
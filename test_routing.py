@@ -0,0 +1,128 @@
+"""Read replica routing tests.
+
+A second database stands in for the replica; it never receives the
+primary's writes, so which one a page read is visible in what it shows.
+"""
+
+# run these tests like (after `createdb warbler_test_replica`):
+#
+#    python -m unittest test_routing.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from routing import PRIMARY_UNTIL_KEY
+from user_cache import user_cache
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+replica = create_engine("postgresql:///warbler_test_replica")
+db.metadata.create_all(replica)
+
+
+class RoutingTestCase(TestCase):
+    def setUp(self):
+        user_cache.clear()
+
+        # The same rows on both, except for the author's name
+        rows = {
+            "users": [
+                {"id": 1, "username": "reader", "email": "reader@email.com",
+                 "password": "not-a-hash"},
+                {"id": 2, "username": "author", "email": "author@email.com",
+                 "password": "not-a-hash"},
+            ],
+            "messages": [{"id": 1, "text": "hello", "user_id": 2}],
+        }
+        for bind, author in ((db.engine, "author"),
+                             (replica, "author-on-replica")):
+            rows["users"][1]["username"] = author
+            with bind.begin() as connection:
+                connection.execute(User.__table__.delete())
+                connection.execute(User.__table__.insert(), rows["users"])
+                connection.execute(Message.__table__.insert(),
+                                   rows["messages"])
+                for table in rows:
+                    connection.execute(db.text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', "
+                        f"'id'), (SELECT max(id) FROM {table}))"))
+
+        patcher = patch.dict(app.extensions, {'replicas': [replica]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def profile(self):
+        return self.client.get("/users/2").get_data(as_text=True)
+
+    def test_reads_use_replica(self):
+        self.assertIn("@author-on-replica", self.profile())
+
+    def test_writes_use_primary(self):
+        resp = self.client.post("/api/messages/1/like")
+        self.assertTrue(resp.json["liked"])
+
+        with db.engine.connect() as connection:
+            likes = connection.execute(db.text(
+                "SELECT count(*) FROM likes")).scalar()
+        with replica.connect() as connection:
+            replica_likes = connection.execute(db.text(
+                "SELECT count(*) FROM likes")).scalar()
+
+        self.assertEqual((likes, replica_likes), (1, 0))
+
+    def test_writer_sticks_to_primary(self):
+        """After a write, the writer reads the primary for a while."""
+
+        self.client.post("/api/messages/1/like")
+        self.assertIn("@author<", self.profile())
+
+        # others still read the replica
+        other = app.test_client()
+        with other.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 2
+        self.assertIn("@author-on-replica",
+                      other.get("/users/2").get_data(as_text=True))
+
+        with self.client.session_transaction() as sess:
+            sess[PRIMARY_UNTIL_KEY] -= app.config['REPLICA_STICKY_SECONDS']
+        self.assertIn("@author-on-replica", self.profile())
+
+    def test_reads_after_write_in_request_use_primary(self):
+        with app.test_request_context("/"):
+            app.preprocess_request()
+            session = db.session()
+
+            self.assertEqual(session.get(User, 2).username,
+                             "author-on-replica")
+
+            session.add(Message(text="new", user_id=1))
+            session.flush()
+
+            self.assertEqual(
+                Message.query.filter_by(text="new").count(), 1)
+            self.assertTrue(session.wrote)
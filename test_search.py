@@ -0,0 +1,168 @@
+"""User search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from search import NgramIndex, search_users, username_index
+
+db.create_all()
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        """Set up users whose names contain 'bird' in different places."""
+        User.query.delete()
+        username_index.clear()
+
+        names_and_followers = [
+            ("bird", 0),
+            ("birdwatcher", 5),
+            ("birdbrain", 50),
+            ("bluebird", 500),
+            ("Big_Bird", 1),
+            ("robin", 1000),
+        ]
+        db.session.add_all([
+            User(username=name, email=f"{name}@email.com",
+                 password="not-a-hash", followers_count=followers)
+            for name, followers in names_and_followers
+        ])
+        db.session.commit()
+
+        self.viewer_id = User.query.filter_by(username="robin").one().id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def names(self, term, **kwargs):
+        return [user.username for user in search_users(term, **kwargs)]
+
+    def test_ranking(self):
+        """Exact, then prefix, then substring, weighted by followers."""
+
+        self.assertEqual(self.names("bird"), [
+            "bird", "birdbrain", "birdwatcher", "bluebird", "Big_Bird"])
+
+    def test_followers_outweigh_match(self):
+        """A much followed substring match outranks a little followed
+        prefix match."""
+
+        user = User.query.filter_by(username="robin").one()
+        user.username = "thebirdman"
+        user.followers_count = 100000
+        db.session.commit()
+
+        self.assertEqual(self.names("bird"), [
+            "bird", "thebirdman", "birdbrain", "birdwatcher", "bluebird",
+            "Big_Bird"])
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.names("BIRDB"), ["birdbrain"])
+
+    def test_short_terms_match_prefix(self):
+        """One and two letter terms only match the start of names."""
+
+        self.assertEqual(self.names("bi"),
+                         ["birdbrain", "birdwatcher", "Big_Bird", "bird"])
+
+    def test_wildcards_are_literal(self):
+        """LIKE wildcards in the term don't match everything."""
+
+        self.assertEqual(self.names("g_b"), ["Big_Bird"])
+        self.assertEqual(self.names("%"), [])
+
+    def test_limit(self):
+        self.assertEqual(len(self.names("bird", limit=2)), 2)
+
+    def test_ngram_index(self):
+        """The fallback index finds substrings and follows renames."""
+
+        index = NgramIndex()
+        self.assertEqual(len(index.search("bird")), 5)
+
+        user = User.query.filter_by(username="robin").one()
+        index.add(user.id, "redbird")
+        self.assertEqual(len(index.search("bird")), 6)
+
+        index.remove(user.id)
+        self.assertEqual(len(index.search("bird")), 5)
+
+    def test_ngram_index_keeps_changes_made_during_load(self):
+        """A user indexed while the table is being read isn't lost when
+        the new postings are swapped in."""
+
+        index = NgramIndex()
+        user = User.query.filter_by(username="robin").one()
+        read = index._read
+
+        def read_then_rename():
+            rows = read().all()
+            index.add(user.id, "redbird")
+            return rows
+
+        with patch.object(index, '_read', read_then_rename):
+            self.assertEqual(len(index.search("bird")), 6)
+
+    def test_postgres_skips_ngram_index(self):
+        """Postgres matches substrings itself, with or without pg_trgm."""
+
+        self.assertEqual(len(self.names("bird")), 5)
+        self.assertIsNone(username_index.loaded_at)
+
+    def test_ngram_fallback(self):
+        """The fallback's matches are looked up by id, or if there are too
+        many, the term is matched by a scan."""
+
+        with patch('search.ngram_fallback', return_value=True):
+            self.assertEqual(self.names("bird"), [
+                "bird", "birdbrain", "birdwatcher", "bluebird", "Big_Bird"])
+            self.assertIsNotNone(username_index.loaded_at)
+
+            with patch('search.NGRAM_CANDIDATES_LIMIT', 2):
+                self.assertEqual(len(self.names("bird")), 5)
+
+    def test_autocomplete(self):
+        """Autocomplete returns a short JSON list of suggestions."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+        resp = self.client.get("/users/autocomplete?q=birdw")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([u["username"] for u in resp.json["users"]],
+                         ["birdwatcher"])
+
+    def test_autocomplete_logged_out(self):
+        resp = self.client.get("/users/autocomplete?q=bird")
+        self.assertEqual(resp.status_code, 401)
+
+    def test_directory_search(self):
+        """The users page shows ranked search results."""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+        html = self.client.get("/users?q=bird").get_data(as_text=True)
+
+        self.assertLess(html.index("@birdbrain"), html.index("@bluebird"))
+        self.assertNotIn("@robin", html)
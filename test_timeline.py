@@ -0,0 +1,182 @@
+"""Home timeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_timeline.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import timeline
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class TimelineTestCase(TestCase):
+    def setUp(self):
+        """Set up a reader and two authors with one message each."""
+        User.query.delete()
+
+        reader = User.signup("reader", "reader@email.com", "password", None)
+        author = User.signup("author", "author@email.com", "password", None)
+        other = User.signup("other", "other@email.com", "password", None)
+        db.session.flush()
+
+        earlier = datetime.utcnow() - timedelta(days=1)
+        m1 = Message(text="author-old", user_id=author.id, timestamp=earlier)
+        m2 = Message(text="other-old", user_id=other.id, timestamp=earlier)
+        db.session.add_all([m1, m2])
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+        self.other_id = other.id
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        timeline.CELEBRITY_FOLLOWER_THRESHOLD = 10000
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_follow_backfills_timeline(self):
+        """Following someone copies their existing messages in."""
+
+        self.login(self.reader_id)
+        self.client.post(f"/users/follow/{self.author_id}")
+
+        entries = TimelineEntry.query.filter_by(user_id=self.reader_id).all()
+        self.assertEqual([e.author_id for e in entries], [self.author_id])
+
+        resp = self.client.get("/")
+        html = resp.get_data(as_text=True)
+        self.assertIn("author-old", html)
+        self.assertNotIn("other-old", html)
+
+    def test_new_message_fans_out(self):
+        """Posting a message delivers it to every follower."""
+
+        self.login(self.reader_id)
+        self.client.post(f"/users/follow/{self.author_id}")
+
+        self.login(self.author_id)
+        self.client.post("/messages/new", data={"text": "fresh warble"})
+
+        messages = timeline.home_timeline(self.reader_id)
+        self.assertEqual([m.text for m in messages],
+                         ["fresh warble", "author-old"])
+
+    def test_unfollow_prunes_timeline(self):
+        """Unfollowing removes that author's messages."""
+
+        self.login(self.reader_id)
+        self.client.post(f"/users/follow/{self.author_id}")
+        self.client.post(f"/users/stop-following/{self.author_id}")
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+        self.assertEqual(timeline.home_timeline(self.reader_id), [])
+
+    def test_celebrity_messages_are_pulled(self):
+        """Authors over the threshold are merged in at read time."""
+
+        timeline.CELEBRITY_FOLLOWER_THRESHOLD = 1
+
+        self.login(self.reader_id)
+        self.client.post(f"/users/follow/{self.author_id}")
+        self.client.post(f"/users/follow/{self.other_id}")
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+        texts = {m.text for m in timeline.home_timeline(self.reader_id)}
+        self.assertEqual(texts, {"author-old", "other-old"})
+
+    def test_celebrity_messages_stay_pulled(self):
+        """Messages posted while over the threshold don't vanish when the
+        author drops back under it."""
+
+        timeline.CELEBRITY_FOLLOWER_THRESHOLD = 2
+
+        for follower_id in (self.reader_id, self.other_id):
+            self.login(follower_id)
+            self.client.post(f"/users/follow/{self.author_id}")
+
+        self.login(self.author_id)
+        self.client.post("/messages/new", data={"text": "famous warble"})
+
+        self.login(self.other_id)
+        self.client.post(f"/users/stop-following/{self.author_id}")
+
+        texts = [m.text for m in timeline.home_timeline(self.reader_id)]
+        self.assertEqual(texts, ["famous warble", "author-old"])
+
+        # Until a rebuild materializes them again
+        timeline.rebuild_timelines()
+        self.assertFalse(timeline.is_celebrity(self.author_id))
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 2)
+        texts = [m.text for m in timeline.home_timeline(self.reader_id)]
+        self.assertEqual(texts, ["famous warble", "author-old"])
+
+    def test_rebuild_timelines(self):
+        """Rebuilding recreates entries from existing follows."""
+
+        db.session.add(Follows(user_being_followed_id=self.other_id,
+                               user_following_id=self.reader_id))
+        db.session.commit()
+
+        rebuilt = timeline.rebuild_timelines()
+
+        self.assertEqual(rebuilt, 1)
+        messages = timeline.home_timeline(self.reader_id)
+        self.assertEqual([m.text for m in messages], ["other-old"])
+
+    def test_rebuild_keeps_timelines_filled(self):
+        """Timelines not yet rebuilt keep their entries meanwhile."""
+
+        db.session.add_all([
+            Follows(user_being_followed_id=self.other_id,
+                    user_following_id=follower_id)
+            for follower_id in (self.reader_id, self.author_id)])
+        db.session.commit()
+        timeline.rebuild_timelines()
+
+        feeds = []
+
+        def progress(done):
+            feeds.append([len(timeline.home_timeline(user_id))
+                          for user_id in (self.reader_id, self.author_id)])
+
+        timeline.rebuild_timelines(batch_size=1, progress=progress)
+        self.assertEqual(feeds, [[1, 1], [1, 1]])
+
+    def test_rebuild_drops_unfollowed_timelines(self):
+        db.session.add(TimelineEntry(
+            user_id=self.reader_id, author_id=self.other_id,
+            message_id=Message.query.filter_by(text="other-old").one().id,
+            timestamp=datetime.utcnow()))
+        db.session.commit()
+
+        timeline.rebuild_timelines()
+
+        self.assertEqual(timeline.home_timeline(self.reader_id), [])
@@ -0,0 +1,117 @@
+"""Logged-in user cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_user_cache.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import app
+from testing import QueryCountMixin
+from user_cache import CurrentUser, user_cache
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+db.create_all()
+
+
+class UserCacheTestCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        User.query.delete()
+        user_cache.clear()
+
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        db.session.commit()
+        self.u1_id = u1.id
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_snapshot_is_cached(self):
+        """Profile fields load once, then come from the cache."""
+
+        with app.test_request_context():
+            with self.assertMaxQueries(1):
+                self.assertEqual(CurrentUser(self.u1_id).username, "u1")
+
+            with self.assertMaxQueries(0):
+                user = CurrentUser(self.u1_id)
+                self.assertTrue(user)
+                self.assertEqual(user.id, self.u1_id)
+                self.assertEqual(user.followers_count, 0)
+
+    def test_other_attributes_load_user(self):
+        """Relationships are read from the real User instance."""
+
+        with app.test_request_context():
+            user = CurrentUser(self.u1_id)
+            self.assertEqual(user.messages, [])
+            self.assertIsInstance(user.load(), User)
+
+    def test_deleted_user_is_falsy(self):
+        """A session pointing at a deleted user isn't logged in."""
+
+        User.query.delete()
+        db.session.commit()
+
+        with app.test_request_context():
+            self.assertFalse(CurrentUser(self.u1_id))
+
+    def test_login_primes_cache(self):
+        """After logging in, pages don't reload the user row."""
+
+        self.client.post("/login", data={"username": "u1",
+                                         "password": "password"})
+
+        # Just the navbar's unread count, which isn't cached
+        with self.assertMaxQueries(1):
+            resp = self.client.get("/messages/new")
+
+        self.assertEqual(resp.status_code, 200)
+
+    def test_unread_count_is_fresh(self):
+        """A direct message shows in the recipient's navbar straight away."""
+
+        self.client.post("/login", data={"username": "u1",
+                                         "password": "password"})
+        etag = self.client.get("/messages/new").headers.get('ETag')
+
+        User.query.filter_by(id=self.u1_id).update({'unread_count': 1})
+        db.session.commit()
+
+        resp = self.client.get("/messages/new",
+                               headers={'If-None-Match': etag or ''})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('id="unread-count">1<', resp.get_data(as_text=True))
+
+    def test_profile_edit_invalidates(self):
+        """A renamed user sees their new name straight away."""
+
+        self.client.post("/login", data={"username": "u1",
+                                         "password": "password"})
+        self.client.get("/")
+
+        self.client.post("/users/profile", data={
+            "username": "renamed",
+            "email": "u1@email.com",
+            "password": "password",
+        })
+        html = self.client.get("/").get_data(as_text=True)
+
+        self.assertIn("@renamed", html)
+        self.assertNotIn("@u1<", html)
@@ -12,6 +12,8 @@ from flask import g, session
 from models import db, User, Message, Follows
 from sqlalchemy.exc import IntegrityError
 
+import passwords
+
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
 # before we import our app, since that will have already
@@ -161,3 +163,31 @@ class UserModelTestCase(TestCase):
 
         self.assertEqual(u1.is_followed_by(u2), False)
 
+    def test_rehash_on_login(self):
+        """Test a password hashed at an old cost is upgraded on login."""
+
+        try:
+            passwords.configure(rounds=4)
+            User.signup("u3", "u3@email.com", "password", None)
+            db.session.commit()
+
+            passwords.configure(rounds=5)
+            user = User.authenticate("u3", "password")
+            db.session.commit()
+
+            self.assertEqual(passwords.hash_rounds(user.password), 5)
+            self.assertEqual(User.authenticate("u3", "password"), user)
+        finally:
+            passwords.configure(rounds=passwords.DEFAULT_LOG_ROUNDS)
+
+    def test_hash_in_pool(self):
+        """Test hashing through the worker pool matches inline hashing."""
+
+        hashed = passwords.hash_password("password")
+
+        self.assertTrue(passwords._check(hashed, "password"))
+        self.assertFalse(passwords.check_password(hashed, "wrong"))
+
+        # Not forked from this (threaded) process
+        self.assertNotEqual(
+            passwords._get_pool()._mp_context.get_start_method(), 'fork')
@@ -0,0 +1,51 @@
+"""Helpers shared by the test suite."""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+
+class QueryCounter:
+    """Records every SQL statement sent to the database while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class QueryCountMixin:
+    """TestCase mixin for putting a query budget on a block of code.
+
+        with self.assertMaxQueries(5):
+            self.client.get("/")
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, maximum):
+        with QueryCounter(db.engine) as counter:
+            yield counter
+
+        if counter.count > maximum:
+            listing = "\n".join(
+                f"{n}. {sql}" for n, sql in enumerate(counter.statements, 1))
+            self.fail(f"{counter.count} queries run, expected at most "
+                      f"{maximum}:\n{listing}")
@@ -0,0 +1,262 @@
+"""Materialized home timelines for Warbler.
+
+Home timelines are filled on write: when a message is posted, one
+`timeline_entries` row is inserted for each follower of its author, so the
+homepage is a single range read on (user_id, timestamp).
+
+Authors with very many followers are not fanned out (one message would write
+a row per follower). Their messages are pulled at read time instead and
+merged into the materialized entries. An author who reaches the threshold
+stays pulled (`users.timeline_pulled`) even if they lose followers again,
+since the messages they posted meanwhile were never fanned out; only
+`rebuild_timelines()`, which materializes everything, sets them back.
+"""
+
+import heapq
+
+from sqlalchemy import (
+    and_, delete, exists, func, literal, or_, select, tuple_, update)
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Follows, Message, TimelineEntry, User
+
+# Authors with at least this many followers are read on demand, not fanned out
+CELEBRITY_FOLLOWER_THRESHOLD = 10000
+
+# How many of an author's recent messages are copied into a new follower's
+# timeline when they start following
+TIMELINE_BACKFILL_LIMIT = 100
+
+# Users handled per transaction by `rebuild_timelines()`
+REBUILD_BATCH_SIZE = 500
+
+
+def _pulled():
+    """Whether a user's messages are read on demand rather than fanned out."""
+
+    return or_(User.timeline_pulled,
+               User.followers_count >= CELEBRITY_FOLLOWER_THRESHOLD)
+
+
+def is_celebrity(user_id):
+    """Is `user_id` read on demand rather than fanned out?"""
+
+    return bool(db.session.execute(
+        select(_pulled()).where(User.id == user_id)
+    ).scalar())
+
+
+def followed_celebrity_ids(user_id):
+    """Return ids of the celebrity authors `user_id` follows."""
+
+    return db.session.execute(
+        select(User.id)
+        .join(Follows, Follows.user_being_followed_id == User.id)
+        .where(Follows.user_following_id == user_id, _pulled())
+    ).scalars().all()
+
+
+def fan_out_message(message):
+    """Deliver a newly-flushed `message` to its author's followers."""
+
+    if is_celebrity(message.user_id):
+        # From now on this author's followers have to pull their messages
+        db.session.execute(
+            update(User)
+            .where(User.id == message.user_id, User.timeline_pulled.is_(False))
+            .values(timeline_pulled=True)
+            .execution_options(synchronize_session=False)
+        )
+        return
+
+    followers = (
+        select(Follows.user_following_id,
+               literal(message.id),
+               literal(message.user_id),
+               literal(message.timestamp))
+        .where(Follows.user_being_followed_id == message.user_id)
+    )
+
+    db.session.execute(
+        insert(TimelineEntry)
+        .from_select(['user_id', 'message_id', 'author_id', 'timestamp'],
+                     followers)
+        .on_conflict_do_nothing()
+    )
+
+
+def backfill_follow(follower_id, followed_id):
+    """Copy `followed_id`'s recent messages into `follower_id`'s timeline."""
+
+    if is_celebrity(followed_id):
+        return
+
+    recent = (
+        select(literal(follower_id),
+               Message.id,
+               Message.user_id,
+               Message.timestamp)
+        .where(Message.user_id == followed_id)
+        .order_by(Message.timestamp.desc())
+        .limit(TIMELINE_BACKFILL_LIMIT)
+    )
+
+    db.session.execute(
+        insert(TimelineEntry)
+        .from_select(['user_id', 'message_id', 'author_id', 'timestamp'],
+                     recent)
+        .on_conflict_do_nothing()
+    )
+
+
+def prune_follow(follower_id, followed_id):
+    """Remove `followed_id`'s messages from `follower_id`'s timeline."""
+
+    db.session.execute(
+        delete(TimelineEntry)
+        .where(TimelineEntry.user_id == follower_id,
+               TimelineEntry.author_id == followed_id)
+    )
+
+
+def home_timeline(user_id, limit=100, before=None, query=None):
+    """Return the `limit` most recent messages for `user_id`'s homepage.
+
+    Reads the materialized entries and merges in recent messages pulled
+    from any celebrity authors the user follows. `before` is an optional
+    (timestamp, message id) keyset cursor; only older messages are returned.
+
+    `query` selects specific columns of the messages, which must include
+    their id and timestamp (rows come back as tuples); by default whole
+    Message objects are returned.
+    """
+
+    def read(statement):
+        result = db.session.execute(statement)
+        return result.all() if query is not None else result.scalars().all()
+
+    base = query if query is not None else select(Message)
+
+    delivered = (base
+                 .join(TimelineEntry,
+                       TimelineEntry.message_id == Message.id)
+                 .where(TimelineEntry.user_id == user_id))
+    if before is not None:
+        delivered = delivered.where(
+            tuple_(TimelineEntry.timestamp, TimelineEntry.message_id)
+            < tuple_(*before))
+    delivered = read(delivered
+                     .order_by(TimelineEntry.timestamp.desc(),
+                               TimelineEntry.message_id.desc())
+                     .limit(limit))
+
+    celebrity_ids = followed_celebrity_ids(user_id)
+    if not celebrity_ids:
+        return delivered
+
+    pulled = base.where(Message.user_id.in_(celebrity_ids))
+    if before is not None:
+        pulled = pulled.where(
+            tuple_(Message.timestamp, Message.id) < tuple_(*before))
+    pulled = read(pulled
+                  .order_by(Message.timestamp.desc(), Message.id.desc())
+                  .limit(limit))
+
+    messages = []
+    seen = set()
+    for msg in heapq.merge(delivered, pulled,
+                           key=lambda m: (m.timestamp, m.id), reverse=True):
+        if msg.id not in seen:
+            seen.add(msg.id)
+            messages.append(msg)
+        if len(messages) == limit:
+            break
+
+    return messages
+
+
+def rebuild_timelines(batch_size=REBUILD_BATCH_SIZE, progress=None):
+    """Rebuild every materialized timeline from `follows` and `messages`.
+
+    Relies on `users.followers_count` to spot celebrity authors, so run
+    `reconcile_counters()` first after loading data. Each follower gets up
+    to TIMELINE_BACKFILL_LIMIT recent messages from every non-celebrity
+    author they follow, so authors back under the threshold are fanned out
+    again. Each batch of followers' entries is deleted and refilled in one
+    transaction, so home pages stay full while the rebuild runs; `progress`,
+    if given, is called with the running total of users rebuilt.
+    """
+
+    celebrities = (select(User.id)
+                   .where(User.followers_count
+                          >= CELEBRITY_FOLLOWER_THRESHOLD)
+                   .scalar_subquery())
+
+    follower_ids = db.session.execute(
+        select(Follows.user_following_id)
+        .distinct()
+        .order_by(Follows.user_following_id)
+    ).scalars().all()
+
+    done = 0
+    for start in range(0, len(follower_ids), batch_size):
+        batch = follower_ids[start:start + batch_size]
+
+        ranked = (
+            select(Follows.user_following_id.label('user_id'),
+                   Message.id.label('message_id'),
+                   Message.user_id.label('author_id'),
+                   Message.timestamp,
+                   func.row_number().over(
+                       partition_by=(Follows.user_following_id,
+                                     Message.user_id),
+                       order_by=Message.timestamp.desc(),
+                   ).label('recency'))
+            .join(Message,
+                  Message.user_id == Follows.user_being_followed_id)
+            .where(and_(Follows.user_following_id.in_(batch),
+                        Follows.user_being_followed_id.not_in(celebrities)))
+            .subquery()
+        )
+
+        db.session.execute(
+            delete(TimelineEntry)
+            .where(TimelineEntry.user_id.in_(batch))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            insert(TimelineEntry)
+            .from_select(
+                ['user_id', 'message_id', 'author_id', 'timestamp'],
+                select(ranked.c.user_id, ranked.c.message_id,
+                       ranked.c.author_id, ranked.c.timestamp)
+                .where(ranked.c.recency <= TIMELINE_BACKFILL_LIMIT))
+            .on_conflict_do_nothing()
+        )
+        db.session.commit()
+
+        done += len(batch)
+        if progress:
+            progress(done)
+
+    # Timelines of users who no longer follow anyone
+    db.session.execute(
+        delete(TimelineEntry)
+        .where(~exists(select(Follows.user_following_id)
+                       .where(Follows.user_following_id
+                              == TimelineEntry.user_id)))
+        .execution_options(synchronize_session=False)
+    )
+    # Only now that every follower has their messages can authors back
+    # under the threshold stop being pulled
+    db.session.execute(
+        update(User)
+        .where(User.timeline_pulled
+               != (User.followers_count >= CELEBRITY_FOLLOWER_THRESHOLD))
+        .values(timeline_pulled=(
+            User.followers_count >= CELEBRITY_FOLLOWER_THRESHOLD))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return done
@@ -0,0 +1,181 @@
+"""Cached loading of the logged-in user.
+
+Most requests only need the logged-in user's id (taken from the session) or
+a few profile columns for the navbar and sidebar. `CurrentUser` is set as
+`g.user` and serves those from a per-worker snapshot cache, loading the real
+`User` row only when a route touches something else (relationships, model
+methods, or `load()` for writes).
+
+Snapshots are keyed by user id and a version stamp kept in the session.
+Changing the profile or counters rotates the stamp, so the user's next
+request misses every worker's cache and sees fresh data; other users see
+the change once the TTL runs out.
+
+The unread direct-message count isn't snapshotted: it changes when other
+users send messages, and their requests can't rotate this user's stamp.
+It's read once per request instead.
+"""
+
+from collections import OrderedDict
+from secrets import token_hex
+from threading import Lock
+from time import time
+
+from sqlalchemy import select
+
+from follow_graph import follow_cache
+from models import db, User
+
+# Seconds a snapshot is served before it is reloaded
+USER_CACHE_TTL = 30
+
+# Most snapshots kept per worker
+USER_CACHE_MAX_ENTRIES = 10000
+
+SNAPSHOT_FIELDS = (
+    'username', 'email', 'image_url', 'header_image_url', 'bio', 'location',
+    'messages_count', 'followers_count', 'following_count', 'likes_count',
+)
+
+
+def new_version():
+    """A fresh version stamp for a session's user snapshot."""
+
+    return token_hex(4)
+
+
+class UserSnapshotCache:
+    """LRU of (user id, version) -> dict of SNAPSHOT_FIELDS."""
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, user_id, version):
+        """Return the snapshot for `user_id`, loading it on a miss.
+
+        Returns None if the user no longer exists (or is being purged).
+        """
+
+        key = (user_id, version)
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        row = db.session.execute(
+            select(*(getattr(User, name) for name in SNAPSHOT_FIELDS))
+            .where(User.id == user_id, User.deleted_at.is_(None))
+        ).first()
+        if row is None:
+            return None
+
+        snapshot = dict(zip(SNAPSHOT_FIELDS, row))
+        self._put(key, snapshot, now)
+        return snapshot
+
+    def store(self, user, version):
+        """Prime the cache from an already-loaded `user`."""
+
+        snapshot = {name: getattr(user, name) for name in SNAPSHOT_FIELDS}
+        self._put((user.id, version), snapshot, time())
+
+    def _put(self, key, snapshot, now):
+        with self._lock:
+            self._entries[key] = (now, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Drop every cached version of `user_id`."""
+
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserSnapshotCache()
+
+
+class CurrentUser:
+    """Lazy stand-in for the logged-in `User`.
+
+    - `id` comes straight from the session
+    - SNAPSHOT_FIELDS come from the snapshot cache
+    - `is_following()` uses the follow graph cache
+    - anything else loads the `User` instance and reads it from there
+    """
+
+    def __init__(self, user_id, version=None, follows_changed_at=None):
+        self.id = user_id
+        self._version = version
+        self._follows_changed_at = follows_changed_at
+        self._snapshot = None
+        self._instance = None
+        self._unread_count = None
+
+    def _get_snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = user_cache.get(self.id, self._version)
+        return self._snapshot
+
+    def __bool__(self):
+        return self._get_snapshot() is not None
+
+    def __getattr__(self, name):
+        if name in SNAPSHOT_FIELDS:
+            return self._get_snapshot()[name]
+        return getattr(self.load(), name)
+
+    @property
+    def unread_count(self):
+        """Unread direct messages, read fresh on the first use per request."""
+
+        if self._unread_count is None:
+            self._unread_count = db.session.execute(
+                select(User.unread_count).where(User.id == self.id)
+            ).scalar()
+        return self._unread_count
+
+    def load(self):
+        """The real `User` instance, loaded on first use."""
+
+        if self._instance is None:
+            self._instance = User.query.get(self.id)
+        return self._instance
+
+    def stamp(self):
+        """Changes whenever this user's view of any page might.
+
+        The version rotates with their profile, counts and likes, and the
+        follows stamp with who they follow. Direct messages arrive from
+        other users' requests, so the current unread count (shown in the
+        navbar) is included as well.
+        """
+
+        return (self.id, self._version, self._follows_changed_at,
+                self.unread_count if self else None)
+
+    def is_following(self, other_user):
+        """Is this user following `other_user`?"""
+
+        return follow_cache.is_following(
+            self.id, other_user.id, fresh_after=self._follows_changed_at)
+
+    def __eq__(self, other):
+        return isinstance(other, (User, CurrentUser)) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<CurrentUser #{self.id}>"